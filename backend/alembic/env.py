@@ -28,6 +28,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 from src.auth.models import Account, APIKey, UserProfile  # noqa
 from src.apps.models import App  # noqa
+from src.files.models import FileUpload  # noqa
 
 # geospatial-mapping-app
 from src.geospatial_mapping.models import Dataset  # noqa
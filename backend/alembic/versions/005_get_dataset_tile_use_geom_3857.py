@@ -0,0 +1,119 @@
+"""get_dataset_tile use precomputed geom_3857
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-04-24 09:12:41.503218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+CREATE OR REPLACE FUNCTION public.get_dataset_tile(
+    relation text,
+    primary_key_column text,
+    z integer,
+    x integer,
+    y integer
+) RETURNS bytea
+LANGUAGE plpgsql
+STABLE
+PARALLEL SAFE
+AS $$
+DECLARE
+    tile bytea;
+    geom_3857 text := 'ST_Transform(geom, 3857)';
+BEGIN
+    -- Prefer the Web Mercator geometry persisted at ingest so the tile filter can use its GiST index
+    IF EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = 'geom_3857'
+          AND NOT attisdropped
+    ) THEN
+        geom_3857 := 'geom_3857';
+    END IF;
+
+    EXECUTE format(
+        $f$
+        WITH mvtgeom AS (
+            SELECT ST_AsMVTGeom(%1$s, ST_TileEnvelope(%2$s, %3$s, %4$s), 4096, 0, true) AS geom
+            ,%5$I AS id
+            ,to_jsonb(t) - 'geom' - 'geom_3857' AS attributes
+            FROM %6$I AS t
+            WHERE %1$s && ST_TileEnvelope(%2$s, %3$s, %4$s)
+        )
+        SELECT ST_AsMVT(mvtgeom, 'dataset', 4096, 'geom', 'id') FROM mvtgeom
+        $f$,
+        geom_3857,
+        z, x, y,
+        primary_key_column,
+        relation
+    ) INTO tile;
+
+    IF tile IS NULL OR length(tile) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN tile;
+END;
+$$;
+"""
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+CREATE OR REPLACE FUNCTION public.get_dataset_tile(
+    relation text,
+    primary_key_column text,
+    z integer,
+    x integer,
+    y integer
+) RETURNS bytea
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    tile bytea;
+BEGIN
+    EXECUTE format(
+        $f$
+        WITH mvtgeom AS (
+            SELECT ST_AsMVTGeom(ST_Transform(geom, 3857), ST_TileEnvelope(%s, %s, %s), 4096, 0, true) AS geom
+            ,%s AS id
+            ,*
+            FROM %s
+            WHERE ST_Intersects(ST_Transform(geom, 3857), ST_TileEnvelope(%s, %s, %s))
+        )
+        SELECT ST_AsMVT(mvtgeom, 'dataset', 4096, 'geom', 'id') FROM mvtgeom
+        $f$,
+        z, x, y,
+        primary_key_column,
+        quote_ident(relation),
+        z, x, y
+    ) INTO tile;
+
+    IF tile IS NULL OR length(tile) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN tile;
+END;
+$$;
+"""
+    )
@@ -0,0 +1,157 @@
+"""get_dataset_tile use generalized geometry per zoom band
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-04-25 14:03:17.220941
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+CREATE OR REPLACE FUNCTION public.get_dataset_tile(
+    relation text,
+    primary_key_column text,
+    z integer,
+    x integer,
+    y integer
+) RETURNS bytea
+LANGUAGE plpgsql
+STABLE
+PARALLEL SAFE
+AS $$
+DECLARE
+    tile bytea;
+    geom_3857 text := 'ST_Transform(geom, 3857)';
+    tile_geom text;
+    generalized_column text;
+BEGIN
+    -- Prefer the Web Mercator geometry persisted at ingest so the tile filter can use its GiST index
+    IF EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = 'geom_3857'
+          AND NOT attisdropped
+    ) THEN
+        geom_3857 := 'geom_3857';
+    END IF;
+    tile_geom := geom_3857;
+
+    -- Low zoom tiles are cut from geometry simplified at ingest for their zoom band
+    generalized_column := CASE
+        WHEN z <= 5 THEN 'geom_3857_z5'
+        WHEN z <= 9 THEN 'geom_3857_z9'
+        WHEN z <= 12 THEN 'geom_3857_z12'
+    END;
+    IF generalized_column IS NOT NULL AND EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = generalized_column
+          AND NOT attisdropped
+    ) THEN
+        tile_geom := generalized_column;
+    END IF;
+
+    EXECUTE format(
+        $f$
+        WITH mvtgeom AS (
+            SELECT ST_AsMVTGeom(
+                       %1$s,
+                       ST_TileEnvelope(%3$s, %4$s, %5$s),
+                       4096,
+                       0,
+                       true
+                   ) AS geom
+            ,%6$I AS id
+            ,to_jsonb(t) - ARRAY['geom', 'geom_3857', 'geom_3857_z5', 'geom_3857_z9', 'geom_3857_z12'] AS attributes
+            FROM %7$I AS t
+            WHERE %2$s && ST_TileEnvelope(%3$s, %4$s, %5$s)
+        )
+        SELECT ST_AsMVT(mvtgeom, 'dataset', 4096, 'geom', 'id') FROM mvtgeom
+        $f$,
+        tile_geom,
+        geom_3857,
+        z, x, y,
+        primary_key_column,
+        relation
+    ) INTO tile;
+
+    IF tile IS NULL OR length(tile) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN tile;
+END;
+$$;
+"""
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+CREATE OR REPLACE FUNCTION public.get_dataset_tile(
+    relation text,
+    primary_key_column text,
+    z integer,
+    x integer,
+    y integer
+) RETURNS bytea
+LANGUAGE plpgsql
+STABLE
+PARALLEL SAFE
+AS $$
+DECLARE
+    tile bytea;
+    geom_3857 text := 'ST_Transform(geom, 3857)';
+BEGIN
+    -- Prefer the Web Mercator geometry persisted at ingest so the tile filter can use its GiST index
+    IF EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = 'geom_3857'
+          AND NOT attisdropped
+    ) THEN
+        geom_3857 := 'geom_3857';
+    END IF;
+
+    EXECUTE format(
+        $f$
+        WITH mvtgeom AS (
+            SELECT ST_AsMVTGeom(%1$s, ST_TileEnvelope(%2$s, %3$s, %4$s), 4096, 0, true) AS geom
+            ,%5$I AS id
+            ,to_jsonb(t) - 'geom' - 'geom_3857' AS attributes
+            FROM %6$I AS t
+            WHERE %1$s && ST_TileEnvelope(%2$s, %3$s, %4$s)
+        )
+        SELECT ST_AsMVT(mvtgeom, 'dataset', 4096, 'geom', 'id') FROM mvtgeom
+        $f$,
+        geom_3857,
+        z, x, y,
+        primary_key_column,
+        relation
+    ) INTO tile;
+
+    IF tile IS NULL OR length(tile) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN tile;
+END;
+$$;
+"""
+    )
@@ -0,0 +1,31 @@
+"""add local storage backend
+
+Revision ID: 010
+Revises: 009
+Create Date: 2025-05-09 10:12:37.204518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Other databases store the enum as plain text
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TYPE storagebackend ADD VALUE IF NOT EXISTS 'local'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # PostgreSQL cannot drop an enum value, datasets stored locally keep it
+    pass
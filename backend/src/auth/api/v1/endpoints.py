@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import timedelta
 from typing import Optional
 
@@ -11,14 +12,14 @@ from src.core.config import settings
 from src.core.logging import get_logger
 
 logger = get_logger(__name__)
-from src.database.session import get_db
+from src.database.session import get_async_db, get_db
 
 router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])  #  Define the tag here
 
 
 @router.post("/login", response_model=schemas.Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    account = db.exec(select(models.Account).where(models.Account.email == form_data.username)).first()
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    account = (await db.exec(select(models.Account).where(models.Account.email == form_data.username))).first()
 
     if not account or account.account_type != models.AccountType.USER:
         raise HTTPException(
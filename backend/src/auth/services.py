@@ -2,6 +2,7 @@ from fastapi import Depends, HTTPException, Header, status
 from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
 from datetime import datetime, timedelta, timezone
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import jwt
 import secrets
 from typing import Optional
@@ -16,7 +17,7 @@ from src.core.config import settings, secret_settings
 from src.core.logging import get_logger
 
 logger = get_logger(__name__)
-from src.database.session import get_db
+from src.database.session import get_async_db
 from passlib.context import CryptContext
 
 
@@ -69,7 +70,7 @@ def decode_jwt(token: str) -> schemas.TokenData:
 async def get_current_account(
     authorization: Optional[str] = Header(default=None),
     x_api_key: Optional[str] = Header(default=None, alias=API_KEY_HEADER),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ) -> models.Account:
 
     # TRY JWT
@@ -79,7 +80,7 @@ async def get_current_account(
         token = authorization.removeprefix("Bearer ").strip()
         try:
             token_data = decode_jwt(token)
-            account = db.exec(select(models.Account).where(models.Account.email == token_data.email)).first()
+            account = (await db.exec(select(models.Account).where(models.Account.email == token_data.email))).first()
             if not account:
                 raise HTTPException(status_code=401, detail="Account not found")
             return account
@@ -89,10 +90,12 @@ async def get_current_account(
 
     # TRY API KEY ONLY IF ENABLED
     if settings.ENABLE_SERVICE_ACCOUNT_AUTH and x_api_key:
-        account = db.exec(
-            select(models.Account)
-            .join(models.APIKey)
-            .where(models.APIKey.key == x_api_key, models.APIKey.is_active == True)
+        account = (
+            await db.exec(
+                select(models.Account)
+                .join(models.APIKey)
+                .where(models.APIKey.key == x_api_key, models.APIKey.is_active == True)
+            )
         ).first()
 
         if not account or account.account_type != models.AccountType.SERVICE_ACCOUNT:
@@ -104,12 +107,16 @@ async def get_current_account(
 
 
 async def get_account_by_api_key(
-    api_key: str = Depends(api_key_header), db: Session = Depends(get_db)
+    api_key: str = Depends(api_key_header), db: AsyncSession = Depends(get_async_db)
 ) -> Optional[models.Account]:
-    api_key_record = db.exec(
-        select(models.APIKey).where(models.APIKey.key == api_key, models.APIKey.is_active == True)
+    # Join instead of lazy loading APIKey.account, which is not possible on an async session
+    return (
+        await db.exec(
+            select(models.Account)
+            .join(models.APIKey)
+            .where(models.APIKey.key == api_key, models.APIKey.is_active == True)
+        )
     ).first()
-    return api_key_record.account if api_key_record else None
 
 
 async def get_current_active_account(current_account: models.Account = Depends(get_current_account)) -> models.Account:
@@ -59,8 +59,22 @@ class Settings(BaseSettings):
     JWT_ENCODE_ALGORITHM: str = "HS256"
     ENABLE_SERVICE_ACCOUNT_AUTH: bool = True
 
-    UPLOAD_BACKEND: Literal["minio", "s3", "uploadthing"] = "minio"
+    UPLOAD_BACKEND: Literal["minio", "s3", "local", "uploadthing"] = "minio"
     UPLOAD_BACKEND_S3_BUCKET_NAME: str = "your-s3-bucket-name"
+    # Uploads are sent to MinIO/S3 as multipart uploads, parts must be at least 5MB
+    UPLOAD_PART_SIZE: int = 16 * 1024 * 1024  # 16MB
+    UPLOAD_MAX_CONCURRENT_PARTS: int = 4
+    # Root directory of the local storage backend, shared with the temporal worker
+    STORAGE_LOCAL_ROOT: str = "./data/storage"
+    # Connections of each MinIO/S3 storage client, shared by all requests
+    STORAGE_MAX_CONNECTIONS: int = 50
+    # Lifetime of the presigned part URLs of direct browser uploads
+    UPLOAD_PRESIGNED_URL_EXPIRES: int = 60 * 60
+    # Largest chunk of a resumable upload, each chunk is held in memory until stored
+    UPLOAD_RESUMABLE_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024  # 64MB
+
+    SQLALCHEMY_POOL_SIZE: int = 10
+    SQLALCHEMY_MAX_OVERFLOW: int = 20
 
     WORKFLOW_BACKEND: Literal["temporal"] = "temporal"
     TEMPORAL_ADDRESS: str = "localhost:7233"
@@ -76,6 +90,8 @@ class MinioSettings(BaseSettings):
     MINIO_ACCESS_KEY: str = "minio"
     MINIO_SECRET_KEY: str = "changeme123"
     MINIO_SECURE: bool = False
+    # host:port browsers reach MinIO at for presigned uploads, defaults to MINIO_ENDPOINT
+    MINIO_PUBLIC_ENDPOINT: str | None = None
 
 
 class PostgisSettings(BaseSettings):
@@ -91,8 +107,30 @@ class PostgisSettings(BaseSettings):
     POSTGIS_PORT: str = "5432"
 
 
+class GeospatialMappingSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_ignore_empty=True,
+        extra="ignore",
+    )
+    TILE_CACHE_ENABLED: bool = True
+    TILE_CACHE_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024  # 64MB
+    TILE_CACHE_DISK_DIR: str = ".cache/tiles"
+    TILE_CACHE_DISK_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB
+    TILE_ARCHIVE_ENABLED: bool = True
+    TILE_ARCHIVE_CACHE_DIR: str = ".cache/tile-archives"
+    TILE_ARCHIVE_MMAP_SIZE: int = 256 * 1024 * 1024  # 256MB
+    TILE_ARCHIVE_MAX_OPEN: int = 32
+    TABLE_STREAM_BATCH_SIZE: int = 1000
+    TABLE_STREAM_CHUNK_SIZE: int = 64 * 1024  # 64KB
+    TABLE_EXPORT_BATCH_SIZE: int = 10000
+    GEOPARQUET_ROW_GROUP_SIZE: int = 100000
+    GEOPARQUET_COMPRESSION: str = "zstd"
+
+
 settings = Settings()
 demo_settings = DemoSettings()
 secret_settings = SecretSettings()
 minio_settings = MinioSettings()
 postgis_settings = PostgisSettings()
+geospatial_mapping_settings = GeospatialMappingSettings()
@@ -0,0 +1,28 @@
+import os
+from functools import lru_cache
+from object_storage import AsyncObjectStorage, LocalStorage, MinioStorage, ObjectStorage, S3Storage
+from src.core.config import minio_settings, settings
+
+
+@lru_cache
+def get_object_storage(backend: str) -> ObjectStorage:
+    """Storage of a `storage_backend`, created on first use and shared by the whole process."""
+    if backend == "minio":
+        return MinioStorage(
+            minio_settings.MINIO_ENDPOINT,
+            access_key=minio_settings.MINIO_ACCESS_KEY,
+            secret_key=minio_settings.MINIO_SECRET_KEY,
+            secure=minio_settings.MINIO_SECURE,
+            max_connections=settings.STORAGE_MAX_CONNECTIONS,
+            public_endpoint=minio_settings.MINIO_PUBLIC_ENDPOINT,
+        )
+    elif backend == "s3":
+        return S3Storage(region=os.getenv("AWS_REGION"), max_connections=settings.STORAGE_MAX_CONNECTIONS)
+    elif backend == "local":
+        return LocalStorage(settings.STORAGE_LOCAL_ROOT)
+    raise NotImplementedError(f"Unsupported storage backend {backend}")
+
+
+@lru_cache
+def get_async_storage(backend: str) -> AsyncObjectStorage:
+    return AsyncObjectStorage(get_object_storage(backend))
@@ -1,5 +1,8 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import create_engine, Session, SQLModel
-from src.core.config import secret_settings
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.config import settings, secret_settings
 
 
 if secret_settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
@@ -8,11 +11,38 @@ else:
     engine = create_engine(secret_settings.SQLALCHEMY_DATABASE_URI)
 
 
+def get_async_database_uri(uri: str) -> str:
+    """Swap the sync driver of a database URI for its asyncio counterpart."""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    return uri
+
+
+if secret_settings.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    async_engine = create_async_engine(get_async_database_uri(secret_settings.SQLALCHEMY_DATABASE_URI))
+else:
+    async_engine = create_async_engine(
+        get_async_database_uri(secret_settings.SQLALCHEMY_DATABASE_URI),
+        pool_size=settings.SQLALCHEMY_POOL_SIZE,
+        max_overflow=settings.SQLALCHEMY_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+
+
 def get_db():
     with Session(engine) as session:
         yield session
 
 
+async def get_async_db():
+    # Objects must stay usable after commit, lazy refreshes are not possible without awaiting
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 def create_db_and_tables():
     engine = create_engine(secret_settings.SQLALCHEMY_DATABASE_URI)
     SQLModel.metadata.create_all(engine)
@@ -1,8 +1,40 @@
-from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile
+import os
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile
+from sqlmodel.ext.asyncio.session import AsyncSession
 from src.auth.models import Account
 from src.auth.services import get_current_active_account_or_400
 from src.core.config import settings
-from src.files.services import handle_upload_minio, handle_upload_s3, uploadthing_handlers
+from src.database.session import get_async_db
+from src.files.schemas import (
+    MultipartUploadAbort,
+    MultipartUploadComplete,
+    MultipartUploadCreate,
+    MultipartUploadRead,
+    ResumableUploadRead,
+    UploadCapabilitiesRead,
+)
+from src.files.services import (
+    abort_presigned_multipart_upload,
+    abort_resumable_upload,
+    append_resumable_upload,
+    complete_presigned_multipart_upload,
+    complete_resumable_upload,
+    create_presigned_multipart_upload,
+    create_resumable_upload,
+    get_resumable_upload,
+    get_resumable_upload_offset,
+    get_upload_capabilities,
+    get_uploadthing_handlers,
+    handle_upload_local,
+    handle_upload_minio,
+    handle_upload_s3,
+    record_file_upload,
+    record_resumable_upload,
+    remove_resumable_upload,
+    upload_local,
+    upload_minio,
+    upload_s3,
+)
 from uploadthing_py import UploadThingRequestBody
 
 router = APIRouter(prefix="/api/v1/files", tags=["Files"], dependencies=[Depends(get_current_active_account_or_400)])
@@ -13,24 +45,205 @@ async def upload_file(
     request: Request,
     response: Response,
     files: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account_or_400),
 ):
     try:
         if settings.UPLOAD_BACKEND == "minio":
             result = await handle_upload_minio(file=files)
-            return result
         elif settings.UPLOAD_BACKEND == "uploadthing":
-            result = await uploadthing_handlers["POST"](
+            result = await get_uploadthing_handlers()["POST"](
                 request=request,
                 response=response,
                 body=UploadThingRequestBody(files=files),
             )
             return result
         elif settings.UPLOAD_BACKEND == "s3":
-            result = await handle_upload_s3(file=files)
-            return result
+            result = await handle_upload_s3(file=files, account_uid=str(account.uid))
+        elif settings.UPLOAD_BACKEND == "local":
+            result = await handle_upload_local(file=files)
         else:
             raise NotImplementedError
+        await record_file_upload(db, account_id=account.id, upload=result)
+        return result
         # return JSONResponse(content={"message": "Upload successful", "result": results})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/upload/stream")
+async def upload_file_stream(
+    request: Request,
+    filename: str = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """
+    Upload the raw request body as a file. The body is relayed to object storage as it arrives, it is never spooled
+    to disk or held in memory whole like a multipart form upload.
+    """
+    try:
+        if settings.UPLOAD_BACKEND == "minio":
+            result = await upload_minio(request.stream(), filename)
+        elif settings.UPLOAD_BACKEND == "s3":
+            result = await upload_s3(request.stream(), filename, account_uid=str(account.uid))
+        elif settings.UPLOAD_BACKEND == "local":
+            result = await upload_local(request.stream(), filename)
+        else:
+            raise NotImplementedError
+        await record_file_upload(db, account_id=account.id, upload=result)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/uploads/capabilities", response_model=UploadCapabilitiesRead)
+async def read_upload_capabilities():
+    """Upload methods of the configured upload backend, the ones it does not support answer 400."""
+    return get_upload_capabilities()
+
+
+@router.post("/uploads/multipart", response_model=MultipartUploadRead)
+async def create_multipart_upload(
+    upload: MultipartUploadCreate,
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """Start a direct upload to object storage, the browser PUTs every part to its presigned URL."""
+    try:
+        return await create_presigned_multipart_upload(upload.filename, upload.size, account_uid=str(account.uid))
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=f"{settings.UPLOAD_BACKEND} does not support direct uploads")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/uploads/multipart/complete")
+async def complete_multipart_upload(
+    upload: MultipartUploadComplete,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """Check the parts in storage against the ones the browser reports and assemble the file."""
+    try:
+        result = await complete_presigned_multipart_upload(upload, account_uid=str(account.uid))
+        await record_file_upload(db, account_id=account.id, upload=result)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/uploads/multipart/abort", status_code=204)
+async def abort_multipart_upload(
+    upload: MultipartUploadAbort,
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    try:
+        await abort_presigned_multipart_upload(upload.key, upload.upload_id, account_uid=str(account.uid))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/uploads/resumable", response_model=ResumableUploadRead, status_code=201)
+async def create_resumable(
+    request: Request,
+    response: Response,
+    upload: MultipartUploadCreate,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """
+    Start a resumable upload. The file is then sent in chunks of `chunk_size` with PATCH, after a dropped connection
+    HEAD tells the offset to carry on from.
+    """
+    try:
+        resumable_upload = await create_resumable_upload(upload.filename, upload.size, account_id=account.id)
+        resumable_upload = await record_resumable_upload(db, resumable_upload)
+        response.headers["Location"] = f"{request.url}/{resumable_upload.key}"
+        uid, _ = os.path.splitext(resumable_upload.key)
+        return {"uid": uid, "key": resumable_upload.key, "chunk_size": resumable_upload.chunk_size, "offset": 0}
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=f"{settings.UPLOAD_BACKEND} does not support resumable uploads")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.head("/uploads/resumable/{key}", status_code=204)
+async def get_resumable_offset(
+    key: str,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    try:
+        offset = await get_resumable_upload_offset(await get_resumable_upload(db, key, account_id=account.id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers["Upload-Offset"] = str(offset)
+    response.headers["Cache-Control"] = "no-store"
+
+
+@router.patch("/uploads/resumable/{key}", status_code=204)
+async def append_resumable(
+    key: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    content_length: int = Header(..., ge=0),
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """
+    Store the request body as the chunk starting at `Upload-Offset`, which must be the offset HEAD returns. Every
+    chunk but the last must be `chunk_size` long.
+    """
+    try:
+        resumable_upload = await get_resumable_upload(db, key, account_id=account.id)
+        offset = await append_resumable_upload(resumable_upload, upload_offset, content_length, request.stream())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers["Upload-Offset"] = str(offset)
+
+
+@router.post("/uploads/resumable/{key}/complete")
+async def complete_resumable(
+    key: str,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    """Assemble the chunks into the uploaded file once all of them are stored."""
+    try:
+        resumable_upload = await get_resumable_upload(db, key, account_id=account.id)
+        result = await complete_resumable_upload(resumable_upload)
+        await remove_resumable_upload(db, resumable_upload)
+        await record_file_upload(db, account_id=account.id, upload=result)
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/uploads/resumable/{key}", status_code=204)
+async def abort_resumable(
+    key: str,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+):
+    try:
+        resumable_upload = await get_resumable_upload(db, key, account_id=account.id)
+        await abort_resumable_upload(resumable_upload)
+        await remove_resumable_upload(db, resumable_upload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1 +1,40 @@
-from sqlmodel import SQLModel
+from datetime import datetime, timezone
+from typing import Optional
+import uuid
+from sqlalchemy import BigInteger, Column
+from sqlmodel import Field, SQLModel
+
+
+class FileUpload(SQLModel, table=True):
+    """
+    File stored by the upload endpoints. Its owner and content hash are recorded by the API, datasets look them up by
+    storage uri rather than trusting the client.
+    """
+
+    __tablename__ = "file_upload"
+
+    id: Optional[int] = Field(default=None, primary_key=True, index=True)
+    uid: uuid.UUID = Field(default_factory=uuid.uuid4, unique=True, index=True)
+    account_id: int = Field(foreign_key="account.id", index=True)
+    storage_backend: str
+    storage_uri: str = Field(index=True)
+    # SHA-256 of the content, None when the content was not read by the API
+    content_hash: Optional[str] = None
+    # Written through asyncpg, which rejects timezone-aware values for TIMESTAMP WITHOUT TIME ZONE columns
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+
+
+class ResumableUpload(SQLModel, table=True):
+    """Pending resumable upload, only its owner may send, query, complete or abort it."""
+
+    __tablename__ = "resumable_upload"
+
+    id: Optional[int] = Field(default=None, primary_key=True, index=True)
+    # Object name of the upload, `<uid><extension>`
+    key: str = Field(unique=True, index=True)
+    account_id: int = Field(foreign_key="account.id", index=True)
+    filename: str
+    size: int = Field(sa_column=Column(BigInteger, nullable=False))
+    # Size of every chunk but the last
+    chunk_size: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
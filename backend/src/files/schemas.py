@@ -1 +1,57 @@
-from pydantic import BaseModel
+import uuid
+from pydantic import BaseModel, Field
+
+
+class MultipartUploadCreate(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+
+
+class MultipartUploadPartUrl(BaseModel):
+    part_number: int
+    url: str
+
+
+class MultipartUploadRead(BaseModel):
+    uid: uuid.UUID
+    key: str
+    upload_id: str
+    part_size: int
+    parts: list[MultipartUploadPartUrl]
+
+
+class MultipartUploadPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class MultipartUploadComplete(BaseModel):
+    uid: uuid.UUID
+    filename: str
+    size: int = Field(ge=0)
+    key: str
+    upload_id: str
+    parts: list[MultipartUploadPart]
+
+
+class MultipartUploadAbort(BaseModel):
+    key: str
+    upload_id: str
+
+
+class ResumableUploadRead(BaseModel):
+    uid: uuid.UUID
+    key: str
+    # Size of the chunks to PATCH, all but the last must be this size
+    chunk_size: int
+    offset: int
+
+
+class UploadCapabilitiesRead(BaseModel):
+    backend: str
+    # Parts sent straight to object storage with presigned URLs
+    presigned: bool
+    # Chunks sent through the API, resumed from the offset storage holds
+    resumable: bool
+    # Raw request body relayed to storage by /upload/stream
+    stream: bool
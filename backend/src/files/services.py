@@ -1,99 +1,185 @@
+import asyncio
+import hashlib
+import math
+import re
 import uuid
-from minio import Minio, S3Error
+from functools import lru_cache
+from typing import AsyncIterable
+from minio import S3Error
 from uploadthing_py import create_route_handler, create_uploadthing
 import os
-import boto3
-from boto3.s3.transfer import TransferConfig
-from botocore.exceptions import NoCredentialsError
-from fastapi import UploadFile
-from src.core.config import settings, secret_settings, minio_settings
+from fastapi import HTTPException, UploadFile
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from object_storage import AsyncObjectStorage, ObjectStorage, PartInfo
+from src.core.config import settings, secret_settings
 from src.core.logging import get_logger
+from src.core.storage import get_async_storage
+from src.files.models import FileUpload, ResumableUpload
+from src.files.schemas import MultipartUploadComplete
 
 logger = get_logger(__name__)
 
 
-f = create_uploadthing()
+@lru_cache
+def get_uploadthing_handlers() -> dict:
+    """Route handlers of the uploadthing backend, built on first use."""
+    f = create_uploadthing()
 
-uploadthing_upload_router = {
-    "default": f({})
-    # .middleware(lambda req: {"user_id": req.headers["x-user-id"]})
-    .on_upload_complete(lambda file, metadata: print(f"Upload complete for {metadata['user_id']}")),
-    "videoAndImage": f(
-        {
-            "image/png": {"max_file_size": "4MB"},
-            "image/heic": {"max_file_size": "16MB"},
-        }
+    uploadthing_upload_router = {
+        "default": f({})
+        # .middleware(lambda req: {"user_id": req.headers["x-user-id"]})
+        .on_upload_complete(lambda file, metadata: print(f"Upload complete for {metadata['user_id']}")),
+        "videoAndImage": f(
+            {
+                "image/png": {"max_file_size": "4MB"},
+                "image/heic": {"max_file_size": "16MB"},
+            }
+        )
+        # .middleware(lambda req: {"user_id": req.headers["x-user-id"]})
+        .on_upload_complete(lambda file, metadata: print(f"Upload complete for {metadata['user_id']}")),
+    }
+
+    return create_route_handler(
+        router=uploadthing_upload_router,
+        api_key=secret_settings.UPLOAD_BACKEND_UPLOADTHING_SECRET,
+        is_dev=os.getenv("ENVIRONMENT", "development") == "development",
     )
-    # .middleware(lambda req: {"user_id": req.headers["x-user-id"]})
-    .on_upload_complete(lambda file, metadata: print(f"Upload complete for {metadata['user_id']}")),
-}
 
-uploadthing_handlers = create_route_handler(
-    router=uploadthing_upload_router,
-    api_key=secret_settings.UPLOAD_BACKEND_UPLOADTHING_SECRET,
-    is_dev=os.getenv("ENVIRONMENT", "development") == "development",
-)
 
+BUCKET_NAME = settings.UPLOAD_BACKEND_S3_BUCKET_NAME
 
-s3 = boto3.client("s3", region_name=os.getenv("AWS_REGION"))
 
-BUCKET_NAME = settings.UPLOAD_BACKEND_S3_BUCKET_NAME
+async def record_file_upload(db: AsyncSession, account_id: int, upload: dict) -> FileUpload:
+    """Keep the owner and content hash of a stored upload, datasets take their content hash from this record."""
+    db_upload = FileUpload(
+        account_id=account_id,
+        storage_backend=upload["storage_backend"],
+        storage_uri=upload["storage_uri"],
+        content_hash=upload.get("content_hash"),
+    )
+    db.add(db_upload)
+    await db.commit()
+    await db.refresh(db_upload)
+    return db_upload
 
-transfer_config = TransferConfig(
-    multipart_chunksize=8 * 1024 * 1024,  # 8MB
-    multipart_threshold=8 * 1024 * 1024,  # 8MB
-)
 
+async def get_file_upload(db: AsyncSession, account_id: int, storage_uri: str) -> FileUpload | None:
+    """Latest upload of the account stored at `storage_uri`."""
+    return (
+        await db.exec(
+            select(FileUpload)
+            .where(FileUpload.account_id == account_id, FileUpload.storage_uri == storage_uri)
+            .order_by(FileUpload.created_at.desc())
+            .limit(1)
+        )
+    ).first()
 
-async def handle_upload_s3(file: UploadFile, account_uid: str):
-    logger.debug("Using S3 upload handler")
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = 1024 * 1024):
+    await file.seek(0)
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def multipart_upload(
+    storage: AsyncObjectStorage,
+    bucket: str,
+    key: str,
+    chunks: AsyncIterable[bytes],
+    part_size: int = settings.UPLOAD_PART_SIZE,
+    max_concurrent_parts: int = settings.UPLOAD_MAX_CONCURRENT_PARTS,
+) -> dict:
+    """
+    Stream `chunks` to `bucket`/`key` as a multipart upload.
+
+    Parts are sent from the thread pool while the next one is read, at most `max_concurrent_parts` at a time. An
+    upload holds no more than `max_concurrent_parts + 1` parts in memory and the event loop never waits on storage.
+    The upload is aborted on failure. Returns the object size and the SHA-256 of its content.
+    """
+    upload_id = await storage.create_multipart_upload(bucket, key)
+    semaphore = asyncio.Semaphore(max_concurrent_parts)
+    tasks: list[asyncio.Task] = []
+    content_hash = hashlib.sha256()
+    size = 0
+
+    async def upload_part(part_number: int, body: bytes) -> PartInfo:
+        try:
+            return PartInfo(part_number, await storage.upload_part(bucket, key, upload_id, part_number, body))
+        finally:
+            semaphore.release()
+
+    async def submit(body: bytes):
+        await semaphore.acquire()
+        # Stop reading as soon as a part failed
+        for task in tasks:
+            if task.done() and task.exception():
+                semaphore.release()
+                raise task.exception()
+        tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, body)))
 
     try:
-        await file.seek(0)
+        buffer = bytearray()
+        async for chunk in chunks:
+            content_hash.update(chunk)
+            size += len(chunk)
+            buffer += chunk
+            while len(buffer) >= part_size:
+                await submit(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+        # The last part may be smaller than part_size, an empty object is a single empty part
+        if buffer or not tasks:
+            await submit(bytes(buffer))
+        parts = await asyncio.gather(*tasks)
+        await storage.complete_multipart_upload(bucket, key, upload_id, parts)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await storage.abort_multipart_upload(bucket, key, upload_id)
+        except Exception as e:
+            logger.warning(f"Aborting multipart upload of {key} failed: {e}")
+        raise
 
-        s3_key = f"uploads/{account_uid}/{file.filename}"
+    return {"size": size, "content_hash": content_hash.hexdigest()}
 
-        s3.upload_fileobj(Fileobj=file.file, Bucket=BUCKET_NAME, Key=s3_key, Config=transfer_config)
+
+async def upload_s3(chunks: AsyncIterable[bytes], filename: str, account_uid: str):
+    logger.debug("Using S3 upload handler")
+
+    try:
+        s3_key = f"uploads/{account_uid}/{filename}"
+        result = await multipart_upload(get_async_storage("s3"), BUCKET_NAME, s3_key, chunks)
 
         return {
-            "name": file.filename,
+            "name": filename,
             "url": f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}",
             "storage_backend": "s3",
             "storage_uri": f"s3://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}",
+            "content_hash": result["content_hash"],
         }
 
-    except NoCredentialsError:
-        raise Exception("AWS credentials not found")
     except Exception as e:
         raise Exception(f"S3 upload failed: {str(e)}")
 
 
-# MinIO Config
-MINIO_ENDPOINT = minio_settings.MINIO_ENDPOINT
-MINIO_ACCESS_KEY = minio_settings.MINIO_ACCESS_KEY
-MINIO_SECRET_KEY = minio_settings.MINIO_SECRET_KEY
-MINIO_UPLOAD_BUCKET_NAME = "uploads"
-MINIO_SECURE = minio_settings.MINIO_SECURE
+async def handle_upload_s3(file: UploadFile, account_uid: str):
+    return await upload_s3(iter_upload_file(file), file.filename, account_uid)
+
 
-# MinIO client
-minio_client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=MINIO_SECURE,
-)
+MINIO_UPLOAD_BUCKET_NAME = "uploads"
 
 
-async def handle_upload_minio(file: UploadFile, uid: uuid.UUID = None):
+async def upload_minio(chunks: AsyncIterable[bytes], filename: str, uid: uuid.UUID = None):
     logger.debug("Using MinIO upload handler")
 
     try:
-        # Make sure the bucket exists
-        found = minio_client.bucket_exists(MINIO_UPLOAD_BUCKET_NAME)
-        if not found:
-            minio_client.make_bucket(MINIO_UPLOAD_BUCKET_NAME)
+        # Make sure the bucket exists, checked once per process
+        storage = get_async_storage("minio")
+        await storage.ensure_bucket(MINIO_UPLOAD_BUCKET_NAME)
 
-        _, extension = os.path.splitext(file.filename)
+        _, extension = os.path.splitext(filename)
 
         if not uid:
             uid = uuid.uuid4()
@@ -101,20 +187,14 @@ async def handle_upload_minio(file: UploadFile, uid: uuid.UUID = None):
         object_name = f"{uid}{extension}"
 
         # Upload the file
-        await file.seek(0)
-        minio_client.put_object(
-            bucket_name=MINIO_UPLOAD_BUCKET_NAME,
-            object_name=object_name,
-            data=file.file,
-            length=-1,  # unknown length (streaming)
-            part_size=10 * 1024 * 1024,  # 10 MB chunks
-        )
+        result = await multipart_upload(storage, MINIO_UPLOAD_BUCKET_NAME, object_name, chunks)
 
         return {
-            "name": file.filename,
+            "name": filename,
             "uid": uid,
             "storage_backend": "minio",
             "storage_uri": f"s3://{MINIO_UPLOAD_BUCKET_NAME}/{object_name}",
+            "content_hash": result["content_hash"],
         }
 
     except S3Error as e:
@@ -123,3 +203,369 @@ async def handle_upload_minio(file: UploadFile, uid: uuid.UUID = None):
     except Exception as e:
         logger.error(f"General error: {str(e)}")
         raise Exception(f"Upload failed: {str(e)}")
+
+
+async def handle_upload_minio(file: UploadFile, uid: uuid.UUID = None):
+    return await upload_minio(iter_upload_file(file), file.filename, uid)
+
+
+LOCAL_UPLOAD_BUCKET_NAME = "uploads"
+
+
+async def upload_local(chunks: AsyncIterable[bytes], filename: str, uid: uuid.UUID = None):
+    """Store the upload under STORAGE_LOCAL_ROOT, the temporal worker reads it from the same directory."""
+    logger.debug("Using local upload handler")
+
+    storage = get_async_storage("local")
+    uid = uid or uuid.uuid4()
+    _, extension = os.path.splitext(filename)
+    object_name = f"{uid}{extension}"
+    content_hash = hashlib.sha256()
+
+    async def hashed():
+        async for chunk in chunks:
+            content_hash.update(chunk)
+            yield chunk
+
+    try:
+        await storage.put_stream(LOCAL_UPLOAD_BUCKET_NAME, object_name, hashed())
+    except Exception as e:
+        logger.error(f"General error: {str(e)}")
+        raise Exception(f"Upload failed: {str(e)}")
+
+    return {
+        "name": filename,
+        "uid": uid,
+        "storage_backend": "local",
+        "storage_uri": storage.storage.uri(LOCAL_UPLOAD_BUCKET_NAME, object_name),
+        "content_hash": content_hash.hexdigest(),
+    }
+
+
+async def handle_upload_local(file: UploadFile, uid: uuid.UUID = None):
+    return await upload_local(iter_upload_file(file), file.filename, uid)
+
+
+# S3 limits of multipart uploads
+S3_MAX_PARTS = 10000
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def get_part_size(size: int) -> int:
+    """Configured part size, doubled until the file fits in the S3 part count limit."""
+    part_size = settings.UPLOAD_PART_SIZE
+    while math.ceil(size / part_size) > S3_MAX_PARTS:
+        part_size *= 2
+    return part_size
+
+
+# Upload backends the browser can send parts to directly, the ones keeping a resumable upload across requests and
+# the ones the API streams request bodies to
+PRESIGNED_UPLOAD_BACKENDS = {"minio", "s3"}
+RESUMABLE_UPLOAD_BACKENDS = {"minio", "local"}
+STREAM_UPLOAD_BACKENDS = {"minio", "s3", "local"}
+
+
+def get_upload_capabilities() -> dict:
+    """Upload methods the configured backend supports, the browser picks its uploader from them."""
+    return {
+        "backend": settings.UPLOAD_BACKEND,
+        "presigned": settings.UPLOAD_BACKEND in PRESIGNED_UPLOAD_BACKENDS,
+        "resumable": settings.UPLOAD_BACKEND in RESUMABLE_UPLOAD_BACKENDS,
+        "stream": settings.UPLOAD_BACKEND in STREAM_UPLOAD_BACKENDS,
+    }
+
+
+def read_content_hash(storage: ObjectStorage, bucket: str, key: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a stored object. Blocking, call it from the thread pool."""
+    content_hash = hashlib.sha256()
+    reader = storage.open(bucket, key)
+    try:
+        while chunk := reader.read(chunk_size):
+            content_hash.update(chunk)
+    finally:
+        reader.close()
+    return content_hash.hexdigest()
+
+
+async def get_content_hash(storage: AsyncObjectStorage, bucket: str, key: str) -> str:
+    """
+    SHA-256 of an upload whose bytes never passed through the API, read back from storage once it is assembled.
+    Identical uploads are only deduplicated by a hash the API computed itself.
+    """
+    return await asyncio.to_thread(read_content_hash, storage.storage, bucket, key)
+
+
+def get_upload_storage() -> tuple[AsyncObjectStorage, str]:
+    """Storage and bucket of resumable uploads, the backends storing uploads under `<uid><extension>`."""
+    if settings.UPLOAD_BACKEND not in ("minio", "local"):
+        raise NotImplementedError
+    bucket = MINIO_UPLOAD_BUCKET_NAME if settings.UPLOAD_BACKEND == "minio" else LOCAL_UPLOAD_BUCKET_NAME
+    return get_async_storage(settings.UPLOAD_BACKEND), bucket
+
+
+def get_account_upload_prefix(account_uid: str) -> str:
+    """Prefix of the keys of the direct uploads of an account."""
+    if settings.UPLOAD_BACKEND == "s3":
+        return f"uploads/{account_uid}/"
+    return f"{account_uid}/"
+
+
+def check_upload_key_account(key: str, account_uid: str):
+    """Raise ValueError unless a direct upload key belongs to the account, upload ids alone are not secret."""
+    if not key.startswith(get_account_upload_prefix(account_uid)):
+        raise ValueError("Upload key does not belong to the account")
+
+
+def get_upload_target(filename: str, uid: uuid.UUID, account_uid: str) -> dict:
+    """Storage, bucket and key an upload is stored at with the configured upload backend."""
+    if settings.UPLOAD_BACKEND in ("minio", "local"):
+        _, extension = os.path.splitext(filename)
+        object_name = f"{get_account_upload_prefix(account_uid)}{uid}{extension}"
+        storage, bucket = get_upload_storage()
+        return {
+            "storage": storage,
+            "bucket": bucket,
+            "key": object_name,
+            "storage_backend": settings.UPLOAD_BACKEND,
+            "storage_uri": storage.storage.uri(bucket, object_name),
+        }
+    elif settings.UPLOAD_BACKEND == "s3":
+        s3_key = f"{get_account_upload_prefix(account_uid)}{filename}"
+        return {
+            "storage": get_async_storage("s3"),
+            "bucket": BUCKET_NAME,
+            "key": s3_key,
+            "storage_backend": "s3",
+            "storage_uri": f"s3://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}",
+        }
+    raise NotImplementedError
+
+
+async def create_presigned_multipart_upload(filename: str, size: int, account_uid: str) -> dict:
+    """
+    Start a multipart upload the browser sends straight to object storage, one presigned PUT URL per part.
+
+    File bytes never pass through the API, it only signs URLs here and checks the parts on completion.
+    """
+    if settings.UPLOAD_BACKEND not in PRESIGNED_UPLOAD_BACKENDS:
+        raise NotImplementedError
+    uid = uuid.uuid4()
+    target = get_upload_target(filename, uid, account_uid)
+    storage, bucket, key = target["storage"], target["bucket"], target["key"]
+    await storage.ensure_bucket(bucket)
+
+    upload_id = await storage.create_multipart_upload(bucket, key)
+    part_size = get_part_size(size)
+    part_numbers = list(range(1, max(1, math.ceil(size / part_size)) + 1))
+    urls = await storage.presign_upload_parts(
+        bucket, key, upload_id, part_numbers, settings.UPLOAD_PRESIGNED_URL_EXPIRES
+    )
+
+    return {
+        "uid": uid,
+        "key": key,
+        "upload_id": upload_id,
+        "part_size": part_size,
+        "parts": [{"part_number": part_number, "url": url} for part_number, url in zip(part_numbers, urls)],
+    }
+
+
+def verify_uploaded_parts(upload: MultipartUploadComplete, uploaded: list[PartInfo], part_size: int):
+    """Raise ValueError unless storage holds exactly the parts the browser reported, covering the whole file."""
+    expected = {part.part_number: part.etag.strip('"') for part in upload.parts}
+    stored = {part.part_number: part for part in uploaded}
+    if sorted(stored) != list(range(1, len(stored) + 1)) or set(stored) != set(expected):
+        raise ValueError("Uploaded parts do not match the completed parts")
+    for part_number, part in stored.items():
+        if part.etag.strip('"') != expected[part_number]:
+            raise ValueError(f"Part {part_number} does not match its ETag")
+        if part_number < len(stored) and part.size != part_size:
+            raise ValueError(f"Part {part_number} has {part.size} bytes, expected {part_size}")
+    if sum(part.size for part in stored.values()) != upload.size:
+        raise ValueError("Uploaded parts do not add up to the file size")
+
+
+async def complete_presigned_multipart_upload(upload: MultipartUploadComplete, account_uid: str) -> dict:
+    check_upload_key_account(upload.key, account_uid)
+    target = get_upload_target(upload.filename, upload.uid, account_uid)
+    if target["key"] != upload.key:
+        raise ValueError("Upload key does not match the file")
+    storage, bucket, key = target["storage"], target["bucket"], target["key"]
+
+    uploaded = await storage.list_parts(bucket, key, upload.upload_id)
+    verify_uploaded_parts(upload, uploaded, get_part_size(upload.size))
+    await storage.complete_multipart_upload(bucket, key, upload.upload_id, uploaded)
+
+    return {
+        "name": upload.filename,
+        "uid": upload.uid,
+        "storage_backend": target["storage_backend"],
+        "storage_uri": target["storage_uri"],
+        "content_hash": await get_content_hash(storage, bucket, key),
+    }
+
+
+async def abort_presigned_multipart_upload(key: str, upload_id: str, account_uid: str):
+    if settings.UPLOAD_BACKEND not in PRESIGNED_UPLOAD_BACKENDS:
+        raise NotImplementedError
+    check_upload_key_account(key, account_uid)
+    bucket = MINIO_UPLOAD_BUCKET_NAME if settings.UPLOAD_BACKEND == "minio" else BUCKET_NAME
+    await get_async_storage(settings.UPLOAD_BACKEND).abort_multipart_upload(bucket, key, upload_id)
+
+
+# Resumable uploads are multipart uploads addressed by their object name, `<uid><extension>`
+RESUMABLE_UPLOAD_KEY_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(\.\w+)?$")
+
+
+async def get_resumable_upload(db: AsyncSession, key: str, account_id: int) -> ResumableUpload:
+    """Pending resumable upload of the account, uploads of other accounts are not found."""
+    if not RESUMABLE_UPLOAD_KEY_PATTERN.match(key):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    upload = (
+        await db.exec(
+            select(ResumableUpload).where(ResumableUpload.key == key, ResumableUpload.account_id == account_id)
+        )
+    ).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+async def record_resumable_upload(db: AsyncSession, upload: ResumableUpload) -> ResumableUpload:
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+async def remove_resumable_upload(db: AsyncSession, upload: ResumableUpload):
+    await db.delete(upload)
+    await db.commit()
+
+
+async def get_resumable_upload_id(key: str) -> str:
+    """Upload id of the pending multipart upload of `key`, storage keeps it across backend restarts."""
+    storage, bucket = get_upload_storage()
+    uploads = await storage.list_multipart_uploads(bucket, key)
+    uploads = [upload for upload in uploads if upload.key == key]
+    if not uploads:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return max(uploads, key=lambda upload: upload.initiated).upload_id
+
+
+def get_received_parts(uploaded: list[PartInfo]) -> list[PartInfo]:
+    """Parts numbered from 1 without a gap, in order."""
+    received = []
+    for part_number, part in enumerate(sorted(uploaded, key=lambda part: part.part_number), start=1):
+        if part.part_number != part_number:
+            break
+        received.append(part)
+    return received
+
+
+def get_upload_offset(uploaded: list[PartInfo]) -> int:
+    """Bytes received so far."""
+    return sum(part.size for part in get_received_parts(uploaded))
+
+
+async def create_resumable_upload(filename: str, size: int, account_id: int) -> ResumableUpload:
+    """
+    Start a resumable upload: the file is sent in chunks with PATCH, each chunk stored as one part of a multipart
+    upload. The parts live in storage, a chunk lost to a dropped connection is the only data sent again. Returns the
+    upload to record, its owner is checked on every later call.
+    """
+    if settings.UPLOAD_BACKEND not in RESUMABLE_UPLOAD_BACKENDS:
+        raise NotImplementedError
+    storage, bucket = get_upload_storage()
+    await storage.ensure_bucket(bucket)
+
+    uid = uuid.uuid4()
+    _, extension = os.path.splitext(filename)
+    key = f"{uid}{extension}"
+    await storage.create_multipart_upload(bucket, key)
+    # Every part but the last must reach the S3 minimum, whatever the configured part size
+    chunk_size = max(get_part_size(size), S3_MIN_PART_SIZE)
+    return ResumableUpload(key=key, account_id=account_id, filename=filename, size=size, chunk_size=chunk_size)
+
+
+async def get_resumable_upload_offset(upload: ResumableUpload) -> int:
+    storage, bucket = get_upload_storage()
+    upload_id = await get_resumable_upload_id(upload.key)
+    return get_upload_offset(await storage.list_parts(bucket, upload.key, upload_id))
+
+
+async def append_resumable_upload(
+    upload: ResumableUpload, offset: int, length: int, chunks: AsyncIterable[bytes]
+) -> int:
+    """
+    Store the chunk starting at `offset` as the next part, returns the new offset.
+
+    The chunk must start where the received bytes end and be `chunk_size` long unless it ends the file, a shorter
+    part could never be completed. It is stored only once it arrived whole, a chunk cut short is sent again from the
+    same offset.
+    """
+    if length > settings.UPLOAD_RESUMABLE_MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=413, detail="Chunk is too large")
+    if offset + length > upload.size:
+        raise HTTPException(status_code=400, detail="Chunk ends past the file size")
+    if offset + length < upload.size and length != upload.chunk_size:
+        raise HTTPException(status_code=400, detail=f"Chunks but the last must be {upload.chunk_size} bytes")
+    storage, bucket = get_upload_storage()
+    key = upload.key
+    upload_id = await get_resumable_upload_id(key)
+    uploaded = await storage.list_parts(bucket, key, upload_id)
+    current_offset = get_upload_offset(uploaded)
+    if offset != current_offset:
+        raise HTTPException(status_code=409, detail=f"Upload offset is {current_offset}")
+    part_number = len(get_received_parts(uploaded)) + 1
+    if part_number > S3_MAX_PARTS:
+        raise HTTPException(status_code=400, detail="Upload has too many chunks")
+
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > length:
+            break
+    if len(body) != length:
+        raise HTTPException(status_code=400, detail="Chunk size does not match Content-Length")
+
+    await storage.upload_part(bucket, key, upload_id, part_number, bytes(body))
+    return offset + length
+
+
+def verify_resumable_upload(uploaded: list[PartInfo], size: int) -> list[PartInfo]:
+    """
+    Raise ValueError unless the parts hold the whole file, all but the last at least the S3 minimum size. Returns the
+    parts to complete the upload with.
+    """
+    received = get_received_parts(uploaded)
+    if len(received) != len(uploaded) or sum(part.size for part in received) != size:
+        raise ValueError("Upload is incomplete")
+    for part in received[:-1]:
+        if part.size < S3_MIN_PART_SIZE:
+            raise ValueError(f"Chunk {part.part_number} is smaller than {S3_MIN_PART_SIZE} bytes")
+    return received
+
+
+async def complete_resumable_upload(upload: ResumableUpload) -> dict:
+    storage, bucket = get_upload_storage()
+    key = upload.key
+    upload_id = await get_resumable_upload_id(key)
+    parts = verify_resumable_upload(await storage.list_parts(bucket, key, upload_id), upload.size)
+    await storage.complete_multipart_upload(bucket, key, upload_id, parts)
+
+    uid, _ = os.path.splitext(key)
+    return {
+        "name": upload.filename,
+        "uid": uuid.UUID(uid),
+        "storage_backend": settings.UPLOAD_BACKEND,
+        "storage_uri": storage.storage.uri(bucket, key),
+        "content_hash": await get_content_hash(storage, bucket, key),
+    }
+
+
+async def abort_resumable_upload(upload: ResumableUpload):
+    storage, bucket = get_upload_storage()
+    upload_id = await get_resumable_upload_id(upload.key)
+    await storage.abort_multipart_upload(bucket, upload.key, upload_id)
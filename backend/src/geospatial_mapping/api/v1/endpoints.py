@@ -1,14 +1,27 @@
 from typing import List, Optional
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlmodel import Session, func, select
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from temporalio.client import Client as TemporalClient
+from temporalio.exceptions import WorkflowAlreadyStartedError
 from src.auth.models import Account
 from src.auth.services import get_current_active_account, get_current_active_account_or_400
 from src.core.logging import setup_logging, get_logger
-from src.database.session import get_db
+from src.database.session import get_async_db
 from src.dependencies import get_temporal_client
-from src.geospatial_mapping.models import Dataset, DatasetCreate, DatasetRead, DatasetUpdate
+from src.files.services import get_file_upload
+from src.geospatial_mapping.models import (
+    Dataset,
+    DatasetCreate,
+    DatasetIngest,
+    DatasetLayersCreate,
+    DatasetRead,
+    DatasetStatus,
+    DatasetUpdate,
+)
+from src.geospatial_mapping.schemas import TileCacheStats
+from src.geospatial_mapping.tile_cache import tile_cache
 from src.geospatial_mapping import services
 
 setup_logging()
@@ -24,12 +37,14 @@ router = APIRouter(
 @router.post("/datasets", status_code=status.HTTP_201_CREATED)
 async def create_dataset(
     dataset: DatasetCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account_or_400),
     temporal_client: TemporalClient = Depends(get_temporal_client),
 ):
     # check if record exists by file_name
-    db_dataset_count = db.exec(select(func.count(Dataset.id)).where(Dataset.file_name == dataset.file_name)).one()
+    db_dataset_count = (
+        await db.exec(select(func.count(Dataset.id)).where(Dataset.file_name == dataset.file_name))
+    ).one()
     dataset.account_id = account.id
 
     # increment default name + 1 if same filename uploaded more than once
@@ -38,12 +53,33 @@ async def create_dataset(
     elif db_dataset_count > 1:
         dataset.name = f"{dataset.name} ({db_dataset_count})"
 
-    db_dataset = services.create_dataset(db=db, dataset=dataset)
+    # The hash of the file is the one the upload endpoints computed, for uploads of this account only
+    file_upload = await get_file_upload(db, account_id=account.id, storage_uri=dataset.storage_uri)
+    db_dataset = await services.create_dataset(
+        db=db, dataset=dataset, content_hash=file_upload.content_hash if file_upload else None
+    )
+    workflow_input = db_dataset.model_dump(mode="json")
+
+    # The same file was already loaded for this account, the workflow copies that table instead of loading the file
+    if db_dataset.content_hash:
+        source_dataset = await services.get_dataset_by_content_hash(
+            db=db, account_id=account.id, content_hash=db_dataset.content_hash, exclude_uid=db_dataset.uid
+        )
+        # Every layer of a multi-layer source is cloned, a source with a layer that did not load is loaded again
+        source_layers = []
+        if source_dataset:
+            source_layers = [source_dataset] + await services.get_dataset_layers(db, parent_uid=source_dataset.uid)
+        if source_layers and all(layer.status == DatasetStatus.ready for layer in source_layers):
+            logger.info(f"Dataset {db_dataset.uid} has the same content as {source_dataset.uid}, cloning its tables")
+            workflow_input["source_dataset_uid"] = str(source_dataset.uid)
+            workflow_input["source_layers"] = [
+                {"uid": str(layer.uid), "layer_name": layer.layer_name} for layer in source_layers
+            ]
 
     # trigger temporal job async
     await temporal_client.start_workflow(
         "DatasetPostUploadWorkflow",
-        db_dataset.model_dump(mode="json"),
+        workflow_input,
         id=f"post-create-dataset-{uuid.uuid4()}",
         task_queue="default-queue",
     )
@@ -55,56 +91,131 @@ async def create_dataset(
 async def list_datasets(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
 ):
-    datasets = services.list_datasets(db, account_id=account.id, skip=skip, limit=limit)
+    datasets = await services.list_datasets(db, account_id=account.id, skip=skip, limit=limit)
     return datasets
 
 
 @router.put("/datasets/{dataset_uid}")
 async def update_dataset(
-    dataset_uid: str,
+    dataset_uid: uuid.UUID,
     dataset: DatasetUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
 ):
-    dataset = services.update_dataset(db, dataset_uid=dataset_uid, account_id=account.id, dataset=dataset)
+    dataset = await services.update_dataset(db, dataset_uid=str(dataset_uid), account_id=account.id, dataset=dataset)
     return dataset
 
 
+@router.post("/datasets/{dataset_uid}/layers", response_model=List[DatasetRead], status_code=status.HTTP_201_CREATED)
+async def create_dataset_layers(
+    dataset_uid: uuid.UUID,
+    layers: DatasetLayersCreate,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account),
+):
+    """Datasets of the extra layers of a multi-layer upload, created by the post-upload workflow."""
+    return await services.create_dataset_layers(db, dataset_uid=str(dataset_uid), layer_names=layers.layer_names)
+
+
+@router.post("/datasets/{dataset_uid}/ingest", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_dataset(
+    dataset_uid: uuid.UUID,
+    ingest: DatasetIngest,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account_or_400),
+    temporal_client: TemporalClient = Depends(get_temporal_client),
+):
+    """Append or upsert an uploaded delta file into the table of a ready dataset."""
+    dataset = await services.get_dataset_by_uid(db, dataset_uid=str(dataset_uid), account_id=account.id)
+    if dataset.status != DatasetStatus.ready or not dataset.primary_key_column:
+        raise HTTPException(status_code=409, detail="Dataset is not ready")
+    if ingest.key_column == dataset.primary_key_column:
+        raise HTTPException(status_code=400, detail="Upserts match rows on an attribute column, not the primary key")
+
+    # trigger temporal job async, one ingest at a time per dataset as they share the delta table
+    workflow_id = f"ingest-dataset-{dataset.uid}"
+    try:
+        await temporal_client.start_workflow(
+            "DatasetIngestWorkflow",
+            {
+                **ingest.model_dump(mode="json"),
+                "uid": str(dataset.uid),
+                "primary_key_column": dataset.primary_key_column,
+                "bbox": dict(dataset.bbox) if dataset.bbox else None,
+            },
+            id=workflow_id,
+            task_queue="default-queue",
+        )
+    except WorkflowAlreadyStartedError:
+        raise HTTPException(status_code=409, detail="An ingest is already running for this dataset")
+    return {"workflow_id": workflow_id}
+
+
 @router.get("/datasets/{dataset_uid}", response_model=DatasetRead)
 async def get_dataset_by_uid(
-    dataset_uid: str,
-    db: Session = Depends(get_db),
+    dataset_uid: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
 ):
-    dataset = services.get_dataset_by_uid(db, dataset_uid=dataset_uid, account_id=account.id)
+    dataset = await services.get_dataset_by_uid(db, dataset_uid=str(dataset_uid), account_id=account.id)
     return dataset
 
 
 @router.get("/datasets/{dataset_uid}/table")
 async def get_dataset_as_table_by_uid(
-    dataset_uid: str,
-    db: Session = Depends(get_db),
+    dataset_uid: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
     limit: int = Query(10, gt=0, le=10000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
 ):
-    res = services.get_dataset_as_table_by_uid(
-        db=db, dataset_uid=dataset_uid, account_id=account.id, limit=limit, offset=offset
+    res = await services.get_dataset_as_table_by_uid(
+        db=db, dataset_uid=str(dataset_uid), account_id=account.id, limit=limit, offset=offset, cursor=cursor
     )
     return res
 
 
+@router.get("/datasets/{dataset_uid}/arrow")
+async def get_dataset_as_arrow_by_uid(
+    dataset_uid: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account),
+):
+    return await services.get_dataset_as_arrow_by_uid(db=db, dataset_uid=str(dataset_uid), account_id=account.id)
+
+
+@router.get("/datasets/{dataset_uid}/geoparquet")
+async def get_dataset_as_geoparquet_by_uid(
+    dataset_uid: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
+    account: Account = Depends(get_current_active_account),
+):
+    return await services.get_dataset_as_geoparquet_by_uid(db=db, dataset_uid=str(dataset_uid), account_id=account.id)
+
+
 @router.get("/datasets/{dataset_uid}/features")
 async def get_dataset_as_geojson_by_uid(
-    dataset_uid: str,
-    db: Session = Depends(get_db),
+    dataset_uid: uuid.UUID,
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
     bbox: Optional[str] = Query(None, description="Bounding box: xmin,ymin,xmax,ymax"),
+    limit: int = Query(10000, gt=0, le=100000, description="Maximum number of features"),
+    precision: int = Query(6, ge=0, le=15, description="Number of decimal digits of the coordinates"),
+    properties: Optional[str] = Query(None, description="Comma separated columns to return as feature properties"),
 ):
-    res = services.get_dataset_as_geojson_by_uid(db=db, dataset_uid=dataset_uid, account_id=account.id, bbox=bbox)
+    res = await services.get_dataset_as_geojson_by_uid(
+        db=db,
+        dataset_uid=str(dataset_uid),
+        account_id=account.id,
+        bbox=bbox,
+        limit=limit,
+        precision=precision,
+        properties=properties,
+    )
     return res
 
 
@@ -115,13 +226,31 @@ async def get_dataset_as_mvt_by_uid(
     y: int,
     dataset_uid: uuid.UUID,
     primary_key_column: str = Query("ogc_fid"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     account: Account = Depends(get_current_active_account),
 ):
     try:
-        return services.get_dataset_as_mvt_by_uid(
-            db=db, dataset_uid=str(dataset_uid), primary_key_column=primary_key_column, z=z, x=x, y=y
+        return await services.get_dataset_as_mvt_by_uid(
+            db=db,
+            dataset_uid=str(dataset_uid),
+            account_id=account.id,
+            primary_key_column=primary_key_column,
+            z=z,
+            x=x,
+            y=y,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(str(e))
         raise HTTPException(status_code=500, detail=f"Tile generation failed: {str(e)}")
+
+
+@router.get("/tiles/cache/stats", response_model=TileCacheStats)
+async def get_tile_cache_stats():
+    return {
+        **tile_cache.stats(),
+        "renders": services.tile_render_flight.executions,
+        "coalesced_renders": services.tile_render_flight.coalesced,
+        "renders_in_flight": services.tile_render_flight.in_flight,
+    }
@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from sqlalchemy import JSON
 from sqlmodel import TIMESTAMP, Column, Relationship, SQLModel, Field
 from enum import Enum
@@ -9,6 +9,11 @@ from enum import Enum
 from src.auth.models import Account
 
 
+def utcnow() -> datetime:
+    # Columns are TIMESTAMP WITHOUT TIME ZONE, asyncpg rejects timezone-aware values for them
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class DatasetStatus(str, Enum):
     uploaded = "uploaded"
     processing = "processing"
@@ -19,11 +24,17 @@ class DatasetStatus(str, Enum):
 class StorageBackend(str, Enum):
     minio = "minio"
     s3 = "s3"
+    local = "local"
     https = "https"
     sql = "sql"
     bigquery = "bigquery"
 
 
+class IngestMode(str, Enum):
+    append = "append"
+    upsert = "upsert"
+
+
 class BoundingBox(BaseModel):
     xmin: float
     ymin: float
@@ -50,6 +61,16 @@ class DatasetCreate(DatasetBase):
 class DatasetRead(DatasetBase):
     uid: uuid.UUID
     account_id: int
+    # Set by the backend and the workflows only, never accepted on create
+    tile_archive_uri: Optional[str] = None
+    tile_archive_max_zoom: Optional[int] = None
+    # Load progress in percent while the dataset is processing
+    progress: Optional[int] = None
+    # SHA-256 of the uploaded file, identical uploads of an account reuse the loaded table
+    content_hash: Optional[str] = None
+    # Layer of a multi-layer upload, the other layers are datasets with the first one as parent
+    layer_name: Optional[str] = None
+    parent_uid: Optional[uuid.UUID] = None
     created_at: datetime
     updated_at: datetime
 
@@ -63,6 +84,36 @@ class DatasetUpdate(SQLModel):
     status: Optional[DatasetStatus] = None
     bbox: Optional[BoundingBox] = None
     primary_key_column: Optional[str] = None
+    tile_archive_uri: Optional[str] = None
+    tile_archive_max_zoom: Optional[int] = None
+    progress: Optional[int] = None
+    layer_name: Optional[str] = None
+    # Extent changed by an incremental ingest, only the cached tiles inside it are dropped. Not stored.
+    dirty_bbox: Optional[BoundingBox] = None
+
+
+class DatasetIngest(SQLModel):
+    """Delta file appended or upserted into the table of an existing dataset."""
+
+    file_name: str
+    storage_backend: StorageBackend
+    storage_uri: str
+    mode: IngestMode = IngestMode.append
+    # Attribute column matching delta rows to existing rows, required on upsert. Feature ids are not used, the delta
+    # file numbers them on its own (from 0 for a Shapefile) while the dataset primary key is a serial from 1.
+    key_column: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_key_column(self):
+        if self.mode == IngestMode.upsert and not self.key_column:
+            raise ValueError("key_column is required to upsert")
+        return self
+
+
+class DatasetLayersCreate(SQLModel):
+    """Layers of an upload loaded into datasets of their own, besides the first one kept by the upload dataset."""
+
+    layer_names: list[str]
 
 
 class Dataset(SQLModel, table=True):
@@ -79,9 +130,15 @@ class Dataset(SQLModel, table=True):
     status: DatasetStatus = Field(default=DatasetStatus.uploaded)
     bbox: Optional[BoundingBox] = Field(default=None, sa_column=Column(JSON))
     primary_key_column: Optional[str]
-
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    tile_archive_uri: Optional[str] = None
+    tile_archive_max_zoom: Optional[int] = None
+    progress: Optional[int] = None
+    content_hash: Optional[str] = Field(default=None, index=True)
+    layer_name: Optional[str] = None
+    parent_uid: Optional[uuid.UUID] = Field(default=None, index=True)
+
+    created_at: datetime = Field(default_factory=utcnow)
     updated_at: datetime = Field(
-        default_factory=lambda: datetime.now(timezone.utc),
-        sa_column=Column(TIMESTAMP, onupdate=datetime.now(timezone.utc)),
+        default_factory=utcnow,
+        sa_column=Column(TIMESTAMP, onupdate=utcnow),
     )
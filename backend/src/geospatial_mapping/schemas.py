@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+
+class TileCacheStats(BaseModel):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    memory_evictions: int
+    disk_evictions: int
+    invalidations: int
+    hit_ratio: float
+    memory_items: int
+    memory_bytes: int
+    memory_max_bytes: int
+    disk_items: int
+    disk_bytes: int
+    disk_max_bytes: int
+    renders: int
+    coalesced_renders: int
+    renders_in_flight: int
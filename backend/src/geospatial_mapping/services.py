@@ -1,52 +1,165 @@
 # import uuid
 import asyncio
 import uuid
+from datetime import datetime
 from fastapi import HTTPException, Response
 from fastapi.responses import StreamingResponse
-from sqlmodel import Session, select, text
-from src.geospatial_mapping.models import Dataset, DatasetCreate, DatasetUpdate
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import JSON
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql.elements import TextClause
+from sqlmodel import select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.config import geospatial_mapping_settings
+from src.geospatial_mapping.models import Dataset, DatasetCreate, DatasetStatus, DatasetUpdate
+from src.geospatial_mapping.table_export import arrow_schema, is_geometry_column, stream_arrow_ipc, stream_geoparquet
+from src.geospatial_mapping.tile_archive import TileArchiveUnavailable, tile_archives
+from src.geospatial_mapping.tile_cache import tile_cache
+from src.geospatial_mapping.utils import decode_table_cursor, encode_table_cursor, sanitize_dataset_name
 from src.core.logging import get_logger
-from src.utils import stream_json
+from src.utils import SingleFlight, stream_json
 
 logger = get_logger(__name__)
 
 
-def create_dataset(db: Session, dataset: DatasetCreate):
+async def create_dataset(db: AsyncSession, dataset: DatasetCreate, content_hash: str | None = None):
+    """`content_hash` comes from the upload record of the file, never from the client."""
     logger.debug(f"create_dataset {dataset}")
-    db_dataset = Dataset(**dataset.model_dump())
+    db_dataset = Dataset(**dataset.model_dump(), content_hash=content_hash)
     db.add(db_dataset)
-    db.commit()
-    db.refresh(db_dataset)
+    await db.commit()
+    await db.refresh(db_dataset)
     return db_dataset
 
 
-def list_datasets(db: Session, account_id: int, skip: int = 0, limit: int = 100):
-    return db.exec(select(Dataset).where(Dataset.account_id == account_id).offset(skip).limit(limit)).all()
+async def get_dataset_by_content_hash(db: AsyncSession, account_id: int, content_hash: str, exclude_uid: uuid.UUID):
+    """Latest ready dataset of the account loaded from a file with the same content."""
+    return (
+        await db.exec(
+            select(Dataset)
+            .where(
+                Dataset.account_id == account_id,
+                Dataset.content_hash == content_hash,
+                Dataset.status == DatasetStatus.ready,
+                Dataset.uid != exclude_uid,
+                Dataset.parent_uid.is_(None),
+            )
+            .order_by(Dataset.updated_at.desc())
+            .limit(1)
+        )
+    ).first()
 
 
-def update_dataset(db: Session, dataset_uid: str, account_id: int, dataset: DatasetUpdate):
+async def get_dataset_layers(db: AsyncSession, parent_uid: uuid.UUID) -> list[Dataset]:
+    """Datasets of the extra layers of a multi-layer upload, in the order they were created."""
+    return (await db.exec(select(Dataset).where(Dataset.parent_uid == parent_uid).order_by(Dataset.id))).all()
+
+
+async def create_dataset_layers(db: AsyncSession, dataset_uid: str, layer_names: list[str]) -> list[Dataset]:
+    """
+    One processing dataset per layer, sharing the uploaded file of the parent dataset. Layers that already have their
+    dataset are returned as they are, a retried request creates nothing twice.
+    """
+    parent = (await db.exec(select(Dataset).where(Dataset.uid == uuid.UUID(str(dataset_uid))))).first()
+    if not parent:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    existing = {
+        layer.layer_name: layer
+        for layer in (await db.exec(select(Dataset).where(Dataset.parent_uid == parent.uid))).all()
+    }
+    for layer_name in layer_names:
+        if layer_name not in existing:
+            existing[layer_name] = Dataset(
+                account_id=parent.account_id,
+                name=f"{parent.name} - {layer_name}",
+                description=parent.description,
+                file_name=parent.file_name,
+                storage_backend=parent.storage_backend,
+                storage_uri=parent.storage_uri,
+                status=DatasetStatus.processing,
+                layer_name=layer_name,
+                parent_uid=parent.uid,
+            )
+            db.add(existing[layer_name])
+    await db.commit()
+
+    layers = [existing[layer_name] for layer_name in layer_names]
+    for layer in layers:
+        await db.refresh(layer)
+    return layers
+
+
+async def list_datasets(db: AsyncSession, account_id: int, skip: int = 0, limit: int = 100):
+    return (await db.exec(select(Dataset).where(Dataset.account_id == account_id).offset(skip).limit(limit))).all()
+
+
+# Dataset fields whose update does not change the tiles
+TILE_NEUTRAL_UPDATES = {"progress", "tile_archive_uri", "tile_archive_max_zoom"}
+
+
+async def update_dataset(db: AsyncSession, dataset_uid: str, account_id: int, dataset: DatasetUpdate):
     logger.debug(f"update_dataset {dataset}")
 
-    db_dataset = db.exec(select(Dataset).where(Dataset.uid == dataset_uid)).first()
+    db_dataset = (await db.exec(select(Dataset).where(Dataset.uid == uuid.UUID(str(dataset_uid))))).first()
     if not db_dataset:
         raise HTTPException(status_code=404, detail="Not found")
 
+    previous_tile_archive_uri = db_dataset.tile_archive_uri
+    previous_updated_at = db_dataset.updated_at
+
     # Apply updates from the request payload
     update_data = dataset.model_dump(exclude_unset=True)
+    dirty_bbox = update_data.pop("dirty_bbox", None)
     print(update_data)
     for key, value in update_data.items():
         setattr(db_dataset, key, value)
 
+    # The archive was rendered from the rows as they were, tiles are rendered live until the next render stores one
+    tiles_changed = dirty_bbox is not None or bool(set(update_data) - TILE_NEUTRAL_UPDATES)
+    if tiles_changed and "tile_archive_uri" not in update_data:
+        db_dataset.tile_archive_uri = None
+        db_dataset.tile_archive_max_zoom = None
+
     # Commit the changes and refresh the instance
     db.add(db_dataset)
-    db.commit()
-    db.refresh(db_dataset)
+    await db.commit()
+    await db.refresh(db_dataset)
+
+    # Any change to the dataset (reload, status, bbox, primary key) makes its cached tiles stale. Progress reports and
+    # a new tile archive leave them as they are, an incremental ingest only the ones inside its extent.
+    if dirty_bbox is None and set(update_data) - TILE_NEUTRAL_UPDATES:
+        await run_in_threadpool(tile_cache.invalidate, str(db_dataset.uid))
+    else:
+        if db_dataset.primary_key_column:
+            await run_in_threadpool(
+                tile_cache.retain,
+                str(db_dataset.uid),
+                db_dataset.primary_key_column,
+                previous_updated_at,
+                db_dataset.updated_at,
+                dirty_bbox,
+            )
+
+    # Each render is stored under a new uri, the archive it replaces is not read anymore
+    if previous_tile_archive_uri and db_dataset.tile_archive_uri != previous_tile_archive_uri:
+        try:
+            await run_in_threadpool(tile_archives.remove, previous_tile_archive_uri)
+        except Exception as e:
+            logger.warning(f"Removing tile archive {previous_tile_archive_uri} failed: {e}")
+
+    # Fetch a new archive now rather than on the first tile request
+    if db_dataset.tile_archive_uri and db_dataset.tile_archive_uri != previous_tile_archive_uri:
+        try:
+            await run_in_threadpool(tile_archives.prefetch, db_dataset.tile_archive_uri)
+        except Exception as e:
+            logger.warning(f"Prefetching tile archive {db_dataset.tile_archive_uri} failed: {e}")
 
     return db_dataset
 
 
-def get_dataset_bbox(db: Session, dataset_uid: str) -> dict:
-    dataset = db.exec(select(Dataset).where(Dataset.uid == dataset_uid)).first()
+async def get_dataset_bbox(db: AsyncSession, dataset_uid: str) -> dict:
+    dataset = (await db.exec(select(Dataset).where(Dataset.uid == uuid.UUID(str(dataset_uid))))).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Not found")
     table_name = f"u_{str(dataset_uid).replace('-', '_')}"
@@ -63,36 +176,287 @@ def get_dataset_bbox(db: Session, dataset_uid: str) -> dict:
         FROM {table_name}
         ) AS sub"""
     )
-    result = db.exec(query).mappings().first()
-    return result.bbox
+    result = (await db.exec(query.columns(bbox=JSON))).mappings().first()
+    return result["bbox"]
 
 
-def get_dataset_by_uid(db: Session, dataset_uid: str, account_id: int):
-    db_dataset = db.exec(select(Dataset).where(Dataset.account_id == account_id, Dataset.uid == dataset_uid)).first()
+async def get_dataset_by_uid(db: AsyncSession, dataset_uid: str, account_id: int):
+    db_dataset = (
+        await db.exec(
+            select(Dataset).where(Dataset.account_id == account_id, Dataset.uid == uuid.UUID(str(dataset_uid)))
+        )
+    ).first()
     if not db_dataset:
         raise HTTPException(status_code=404, detail="Not found")
     return db_dataset
 
 
-def get_dataset_as_table_by_uid(db: Session, dataset_uid: str, account_id: int, limit: int, offset: int):
-    dataset = db.exec(select(Dataset).where(Dataset.account_id == account_id, Dataset.uid == dataset_uid)).first()
-    if not dataset:
-        raise HTTPException(status_code=404, detail="Not found")
+# Columns derived from `geom` during ingest, they are not part of the uploaded data
+DERIVED_GEOMETRY_COLUMNS = ("geom_3857", "geom_3857_z5", "geom_3857_z9", "geom_3857_z12")
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def get_dataset_schema(db: AsyncSession, table_name: str) -> list[dict]:
+    query = text(
+        """SELECT column_name, data_type, udt_name, numeric_precision, numeric_scale
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = :table_name
+        ORDER BY ordinal_position"""
+    )
+    columns = (await db.exec(query.params(table_name=table_name))).mappings().all()
+    return [dict(c) for c in columns if c["column_name"] not in DERIVED_GEOMETRY_COLUMNS]
+
+
+async def get_dataset_columns(db: AsyncSession, table_name: str) -> list[str]:
+    return [c["column_name"] for c in await get_dataset_schema(db, table_name)]
+
+
+TABLE_NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+async def stream_rows(engine: AsyncEngine, query: TextClause, batch_size: int):
+    """
+    Yields the rows of `query` in batches of `batch_size` through a server-side cursor.
+
+    The generator owns its connection: it outlives the request session, which is closed before the response body is
+    sent, and it is released as soon as the stream ends or the client goes away.
+    """
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.mappings().partitions():
+            yield partition
+
+
+async def get_dataset_as_table_by_uid(
+    db: AsyncSession, dataset_uid: str, account_id: int, limit: int, offset: int, cursor: str | None = None
+):
+    """
+    Returns a page of dataset rows ordered by the dataset primary key.
+
+    Pages are keyset paginated: the opaque cursor of the next page is returned in the `X-Next-Cursor` header and the
+    page query seeks the primary key index to it, so any page costs the same as the first one.
+    """
+    dataset = await get_dataset_by_uid(db, dataset_uid=dataset_uid, account_id=account_id)
 
     table_name = f"u_{dataset_uid.replace('-', '_')}"
-    query = text(f"SELECT * FROM {table_name} LIMIT :limit OFFSET :offset")
-    records = db.exec(query.params(limit=limit, offset=offset)).mappings().all()
+    columns = ", ".join(quote_identifier(c) for c in await get_dataset_columns(db, table_name))
+
+    if not dataset.primary_key_column:
+        # Datasets still being ingested have no primary key yet, they can only be paged by offset
+        if cursor is not None:
+            raise HTTPException(status_code=400, detail="Dataset has no primary key to paginate on")
+        query = text(f"SELECT {columns} FROM {table_name} LIMIT :limit OFFSET :offset")
+        return await stream_table_response(db, query.params(limit=limit, offset=offset))
+
+    primary_key = quote_identifier(dataset.primary_key_column)
+    params = {"limit": limit, "offset": offset}
+    where = ""
+    if cursor is not None:
+        try:
+            params["after"] = decode_table_cursor(cursor, dataset.primary_key_column)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+        where = f"WHERE {primary_key} > :after"
+
+    # Index-only probe for the last key of the page and whether any row follows it
+    probe = text(f"SELECT {primary_key} FROM {table_name} {where} ORDER BY {primary_key} LIMIT 2 OFFSET :probe_offset")
+    keys = (await db.exec(probe.params(**params, probe_offset=offset + limit - 1))).scalars().all()
 
-    return StreamingResponse(stream_json(records), media_type="application/json")
+    headers = {}
+    if len(keys) == 2:
+        headers[TABLE_NEXT_CURSOR_HEADER] = encode_table_cursor(dataset.primary_key_column, keys[0])
 
-EMPTY_TILE = b'\x1a\x00'
+    query = text(f"SELECT {columns} FROM {table_name} {where} ORDER BY {primary_key} LIMIT :limit OFFSET :offset")
+    return await stream_table_response(db, query.params(**params), headers=headers)
 
-def get_dataset_as_mvt_by_uid(db: Session, dataset_uid: str, primary_key_column: str, z: int, x: int, y: int):
+
+async def stream_table_response(db: AsyncSession, query: TextClause, headers: dict | None = None) -> StreamingResponse:
+    engine = db.bind
+    # The rows are read on a connection of their own, give the session connection back before streaming
+    await db.close()
+    batches = stream_rows(engine, query, geospatial_mapping_settings.TABLE_STREAM_BATCH_SIZE)
+    body = stream_json(batches, chunk_size=geospatial_mapping_settings.TABLE_STREAM_CHUNK_SIZE)
+    return StreamingResponse(body, media_type="application/json", headers=headers)
+
+
+async def get_dataset_export_stream(db: AsyncSession, dataset_uid: str, account_id: int):
+    """Returns the Arrow schema and the row batches of a whole dataset table, geometry read as WKB."""
+    dataset = await get_dataset_by_uid(db, dataset_uid=dataset_uid, account_id=account_id)
+
+    table_name = f"u_{dataset_uid.replace('-', '_')}"
+    columns = await get_dataset_schema(db, table_name)
+    schema = arrow_schema(columns, bbox=dict(dataset.bbox) if dataset.bbox else None)
+    select_list = ", ".join(
+        (
+            f"ST_AsBinary({quote_identifier(c['column_name'])}) AS {quote_identifier(c['column_name'])}"
+            if is_geometry_column(c)
+            else quote_identifier(c["column_name"])
+        )
+        for c in columns
+    )
+    query = text(f"SELECT {select_list} FROM {table_name}")
+
+    engine = db.bind
+    await db.close()
+    return dataset, schema, stream_rows(engine, query, geospatial_mapping_settings.TABLE_EXPORT_BATCH_SIZE)
+
+
+async def get_dataset_as_arrow_by_uid(db: AsyncSession, dataset_uid: str, account_id: int) -> StreamingResponse:
+    _, schema, batches = await get_dataset_export_stream(db, dataset_uid=dataset_uid, account_id=account_id)
+    return StreamingResponse(stream_arrow_ipc(schema, batches), media_type="application/vnd.apache.arrow.stream")
+
+
+async def get_dataset_as_geoparquet_by_uid(db: AsyncSession, dataset_uid: str, account_id: int) -> StreamingResponse:
+    dataset, schema, batches = await get_dataset_export_stream(db, dataset_uid=dataset_uid, account_id=account_id)
+    body = stream_geoparquet(
+        schema,
+        batches,
+        row_group_size=geospatial_mapping_settings.GEOPARQUET_ROW_GROUP_SIZE,
+        compression=geospatial_mapping_settings.GEOPARQUET_COMPRESSION,
+    )
+    file_name = f"{sanitize_dataset_name(dataset.name) or dataset_uid}.parquet"
+    return StreamingResponse(
+        body,
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+
+def parse_bbox(bbox: str) -> dict:
+    try:
+        xmin, ymin, xmax, ymax = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be xmin,ymin,xmax,ymax")
+    if xmin > xmax or ymin > ymax:
+        raise HTTPException(status_code=400, detail="bbox min must not be greater than max")
+    return {"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax}
+
+
+async def stream_feature_collection(batches):
+    """Wraps features already encoded as GeoJSON by PostGIS into a FeatureCollection, without parsing them."""
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    async for rows in batches:
+        if not rows:
+            continue
+        chunk = ",".join(row["feature"] for row in rows)
+        yield (chunk if first else "," + chunk).encode()
+        first = False
+    yield b"]}"
+
+
+async def get_dataset_as_geojson_by_uid(
+    db: AsyncSession,
+    dataset_uid: str,
+    account_id: int,
+    bbox: str | None = None,
+    limit: int = 10000,
+    precision: int = 6,
+    properties: str | None = None,
+) -> StreamingResponse:
+    """
+    Streams the dataset features intersecting `bbox` as a GeoJSON FeatureCollection.
+
+    Features are encoded by PostGIS and the bbox is matched with `&&` against the `geom` spatial index. Only the
+    `properties` columns are returned when given.
+    """
+    dataset = await get_dataset_by_uid(db, dataset_uid=dataset_uid, account_id=account_id)
+
+    table_name = f"u_{dataset_uid.replace('-', '_')}"
+    columns = [c for c in await get_dataset_columns(db, table_name) if c != "geom"]
+    if properties is not None:
+        requested = [c.strip() for c in properties.split(",") if c.strip()]
+        unknown = [c for c in requested if c not in columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown properties: {', '.join(unknown)}")
+        columns = requested
+
+    params = {"limit": limit, "precision": precision}
+    where = ""
+    if bbox:
+        params.update(parse_bbox(bbox))
+        where = "WHERE geom && ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 4326)"
+    order = f"ORDER BY {quote_identifier(dataset.primary_key_column)}" if dataset.primary_key_column else ""
+    select_list = ", ".join([quote_identifier(c) for c in columns] + ["geom"])
+    query = text(
+        f"""SELECT ST_AsGeoJSON(f.*, 'geom', CAST(:precision AS integer)) AS feature
+        FROM (SELECT {select_list} FROM {table_name} {where} {order} LIMIT :limit) AS f"""
+    ).params(**params)
+
+    engine = db.bind
+    await db.close()
+    batches = stream_rows(engine, query, geospatial_mapping_settings.TABLE_STREAM_BATCH_SIZE)
+    return StreamingResponse(stream_feature_collection(batches), media_type="application/geo+json")
+
+
+EMPTY_TILE = b"\x1a\x00"
+
+
+def get_dataset_tile_from_archive(dataset: Dataset, primary_key_column: str, z: int, x: int, y: int) -> bytes | None:
+    """
+    Returns the tile from the dataset pre-rendered archive, or None when the archive cannot serve it and the tile
+    has to be rendered live. Blocking, the first read of an archive opens it.
+    """
+    if (
+        not geospatial_mapping_settings.TILE_ARCHIVE_ENABLED
+        or not dataset.tile_archive_uri
+        or dataset.status != DatasetStatus.ready
+        or dataset.tile_archive_max_zoom is None
+        or z > dataset.tile_archive_max_zoom
+        or primary_key_column != dataset.primary_key_column
+    ):
+        return None
+    try:
+        tile = tile_archives.get_tile(dataset.tile_archive_uri, z, x, y)
+    except TileArchiveUnavailable:
+        return None
+    except Exception as e:
+        logger.warning(f"Reading tile archive {dataset.tile_archive_uri} failed, rendering live: {e}")
+        return None
+    # Empty tiles are not stored in the archive
+    return tile if tile is not None else EMPTY_TILE
+
+
+# Identical tiles requested concurrently are rendered once
+tile_render_flight = SingleFlight()
+
+
+async def render_dataset_tile(
+    db: AsyncSession, dataset_uid: str, primary_key_column: str, z: int, x: int, y: int, updated_at: datetime
+) -> bytes:
     relation_name = "u_" + dataset_uid.replace("-", "_")
     stmt = text("SELECT public.get_dataset_tile(:relation, :primary_key_column, :z, :x, :y)")
-    result = db.exec(stmt.params(relation=relation_name, primary_key_column=primary_key_column, z=z, x=x, y=y)).scalar()
+    result = (
+        await db.exec(stmt.params(relation=relation_name, primary_key_column=primary_key_column, z=z, x=x, y=y))
+    ).scalar()
+    # Release the connection as soon as the tile is built
+    await db.close()
+
+    tile = bytes(result) if result else EMPTY_TILE
+    await run_in_threadpool(tile_cache.set, dataset_uid, primary_key_column, z, x, y, updated_at, tile)
+    return tile
+
+
+async def get_dataset_as_mvt_by_uid(
+    db: AsyncSession, dataset_uid: str, account_id: int, primary_key_column: str, z: int, x: int, y: int
+):
+    dataset = await get_dataset_by_uid(db, dataset_uid=dataset_uid, account_id=account_id)
+    updated_at = dataset.updated_at
 
-    if not result or result is None:
-        return Response(content=EMPTY_TILE, media_type="application/x-protobuf")
+    # The disk tier reads files under the cache lock, keep it off the event loop like `set`
+    tile = await run_in_threadpool(tile_cache.get, dataset_uid, primary_key_column, z, x, y, updated_at)
+    if tile is None:
+        tile = await run_in_threadpool(get_dataset_tile_from_archive, dataset, primary_key_column, z, x, y)
+    if tile is None:
+        # Give the connection back to the pool before waiting, requests sharing another request's render must not
+        # hold one. The session checks a connection out again if this request ends up rendering.
+        await db.close()
+        tile = await tile_render_flight.do(
+            (dataset_uid, primary_key_column, z, x, y, updated_at),
+            lambda: render_dataset_tile(db, dataset_uid, primary_key_column, z, x, y, updated_at),
+        )
 
-    return Response(content=bytes(result), media_type="application/x-protobuf")
+    return Response(content=tile, media_type="application/x-protobuf")
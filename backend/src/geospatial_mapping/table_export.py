@@ -0,0 +1,140 @@
+import io
+import uuid
+from typing import AsyncIterable, Callable, Iterable, Mapping
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+from starlette.concurrency import run_in_threadpool
+from src.utils import dumps_json
+
+ARROW_TYPES = {
+    "smallint": pa.int16(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "real": pa.float32(),
+    "double precision": pa.float64(),
+    "boolean": pa.bool_(),
+    "text": pa.string(),
+    "character varying": pa.string(),
+    "character": pa.string(),
+    "date": pa.date32(),
+    "time without time zone": pa.time64("us"),
+    "timestamp without time zone": pa.timestamp("us"),
+    "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+    "bytea": pa.binary(),
+}
+
+# Geometry is exported as WKB, tagged so Arrow readers (GeoPandas, DuckDB, ...) know how to decode it
+GEOARROW_WKB_METADATA = {b"ARROW:extension:name": b"geoarrow.wkb", b"ARROW:extension:metadata": b"{}"}
+
+
+def is_geometry_column(column: Mapping) -> bool:
+    return column["udt_name"] == "geometry"
+
+
+def arrow_field(column: Mapping) -> pa.Field:
+    name = column["column_name"]
+    if is_geometry_column(column):
+        return pa.field(name, pa.binary(), metadata=GEOARROW_WKB_METADATA)
+    if column["data_type"] == "numeric" and column["numeric_precision"] and column["numeric_precision"] <= 38:
+        return pa.field(name, pa.decimal128(column["numeric_precision"], column["numeric_scale"] or 0))
+    # Anything without a direct Arrow counterpart (uuid, json, arrays, unbounded numeric, ...) is exported as text
+    return pa.field(name, ARROW_TYPES.get(column["data_type"], pa.string()))
+
+
+def arrow_schema(columns: Iterable[Mapping], bbox: Mapping | None = None) -> pa.Schema:
+    """
+    Arrow schema of a dataset table from its information_schema columns.
+
+    The GeoParquet `geo` metadata is attached when the table has a geometry column. Dataset geometries are EPSG:4326
+    longitude/latitude, which is the GeoParquet default CRS, so no `crs` is written.
+    """
+    columns = list(columns)
+    schema = pa.schema([arrow_field(c) for c in columns])
+
+    geometry_columns = [c["column_name"] for c in columns if is_geometry_column(c)]
+    if not geometry_columns:
+        return schema
+    geo = {
+        "version": "1.1.0",
+        "primary_column": geometry_columns[0],
+        "columns": {name: {"encoding": "WKB", "geometry_types": []} for name in geometry_columns},
+    }
+    if bbox:
+        geo["columns"][geometry_columns[0]]["bbox"] = [bbox["xmin"], bbox["ymin"], bbox["xmax"], bbox["ymax"]]
+    return schema.with_metadata({b"geo": orjson.dumps(geo)})
+
+
+def to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return dumps_json(value).decode()
+
+
+def converter(field: pa.Field) -> Callable:
+    if pa.types.is_string(field.type):
+        return to_text
+    if pa.types.is_binary(field.type):
+        return lambda value: bytes(value) if value is not None else None
+    return lambda value: value
+
+
+def to_record_batch(schema: pa.Schema, rows: list[Mapping]) -> pa.RecordBatch:
+    arrays = []
+    for field in schema:
+        convert = converter(field)
+        arrays.append(pa.array([convert(row[field.name]) for row in rows], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+async def stream_arrow_ipc(schema: pa.Schema, batches: AsyncIterable[list[Mapping]]):
+    """Streams rows as an Arrow IPC stream, one record batch per batch of rows."""
+    buffer = io.BytesIO()
+    writer = pa.ipc.new_stream(buffer, schema)
+    yield drain(buffer)
+    async for rows in batches:
+        if not rows:
+            continue
+        batch = await run_in_threadpool(to_record_batch, schema, rows)
+        await run_in_threadpool(writer.write_batch, batch)
+        yield drain(buffer)
+    writer.close()
+    yield drain(buffer)
+
+
+async def stream_geoparquet(
+    schema: pa.Schema, batches: AsyncIterable[list[Mapping]], row_group_size: int, compression: str = "zstd"
+):
+    """
+    Streams rows as a (Geo)Parquet file.
+
+    Parquet is written front to back, so every row group is sent as soon as it is complete. Only the rows of the row
+    group being filled are held in memory.
+    """
+    buffer = io.BytesIO()
+    writer = pq.ParquetWriter(buffer, schema, compression=compression)
+    pending = schema.empty_table()
+
+    async for rows in batches:
+        if not rows:
+            continue
+        batch = await run_in_threadpool(to_record_batch, schema, rows)
+        pending = pa.concat_tables([pending, pa.Table.from_batches([batch], schema=schema)])
+        if pending.num_rows >= row_group_size:
+            while pending.num_rows >= row_group_size:
+                await run_in_threadpool(writer.write_table, pending.slice(0, row_group_size), row_group_size)
+                pending = pending.slice(row_group_size)
+            yield drain(buffer)
+    if pending.num_rows:
+        await run_in_threadpool(writer.write_table, pending, row_group_size)
+    writer.close()
+    yield drain(buffer)
@@ -0,0 +1,188 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+from object_storage import parse_uri
+from src.core.config import geospatial_mapping_settings
+from src.core.logging import get_logger
+from src.core.storage import get_object_storage
+
+logger = get_logger(__name__)
+
+
+class TileArchiveUnavailable(Exception):
+    """The archive cannot serve tiles yet, it is still being downloaded or was just closed."""
+
+
+@dataclass
+class _Archive:
+    conn: sqlite3.Connection
+    # Downloaded copy removed when the archive is closed, None for archives read in place
+    local_copy: str | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    closed: bool = False
+
+
+class TileArchiveReader:
+    """
+    Serves tiles from the MBTiles archives pre-rendered by the post-upload workflow.
+
+    Archives stored in MinIO are downloaded into `cache_dir` by a background thread. Tiles of an archive still being
+    downloaded raise `TileArchiveUnavailable`, they are rendered live meanwhile. Archives are opened read-only and
+    immutable with SQLite memory-mapped I/O, so hot tiles are served straight from the page cache. Reads of an archive
+    hold its own lock only. At most `max_open` archives are kept open, least recently used first out along with their
+    downloaded copy.
+    """
+
+    def __init__(self, cache_dir: str, mmap_size: int, max_open: int, max_downloads: int = 2):
+        self.cache_dir = cache_dir
+        self.mmap_size = mmap_size
+        self.max_open = max_open
+        # Guards the archive and download registries, never held during I/O
+        self._lock = threading.Lock()
+        self._archives: OrderedDict[str, _Archive] = OrderedDict()
+        self._downloads: dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix="tile-archive")
+
+    def _cache_path(self, uri: str) -> str:
+        bucket_name, object_name = parse_uri(uri)
+        return os.path.join(self.cache_dir, bucket_name, object_name)
+
+    def _download(self, uri: str, local_path: str):
+        try:
+            logger.info(f"Downloading tile archive {uri}")
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            # Workers sharing the cache directory may download the same archive, each writes a file of its own
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in get_object_storage("minio").stream(*parse_uri(uri)):
+                        f.write(chunk)
+                os.replace(tmp_path, local_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        except Exception as e:
+            logger.warning(f"Downloading tile archive {uri} failed: {e}")
+        finally:
+            with self._lock:
+                self._downloads.pop(uri, None)
+
+    def prefetch(self, uri: str) -> bool:
+        """Start downloading an archive unless it is local already. True once it can be opened."""
+        parsed = urlparse(uri)
+        if parsed.scheme == "file":
+            return True
+        if parsed.scheme != "s3":
+            raise NotImplementedError(f"Unsupported tile archive uri {uri}")
+        local_path = self._cache_path(uri)
+        if os.path.exists(local_path):
+            return True
+        with self._lock:
+            if uri not in self._downloads:
+                self._downloads[uri] = self._executor.submit(self._download, uri, local_path)
+        return False
+
+    def _open(self, uri: str) -> _Archive:
+        if not self.prefetch(uri):
+            raise TileArchiveUnavailable(f"Tile archive {uri} is being downloaded")
+        parsed = urlparse(uri)
+        local_copy = self._cache_path(uri) if parsed.scheme == "s3" else None
+        conn = sqlite3.connect(
+            f"file:{local_copy or parsed.path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return _Archive(conn, local_copy)
+
+    def _archive(self, uri: str) -> _Archive:
+        with self._lock:
+            archive = self._archives.get(uri)
+            if archive is not None:
+                self._archives.move_to_end(uri)
+                return archive
+
+        opened = self._open(uri)
+        evicted = []
+        with self._lock:
+            archive = self._archives.get(uri)
+            if archive is None:
+                archive = self._archives[uri] = opened
+                while len(self._archives) > self.max_open:
+                    evicted.append(self._archives.popitem(last=False)[1])
+            else:
+                # Opened concurrently by another request
+                evicted.append(opened)
+        for other in evicted:
+            self._close(other, remove_copy=other is not opened)
+        return archive
+
+    @staticmethod
+    def _close(archive: _Archive, remove_copy: bool):
+        with archive.lock:
+            archive.closed = True
+            archive.conn.close()
+        if remove_copy and archive.local_copy:
+            try:
+                os.remove(archive.local_copy)
+            except FileNotFoundError:
+                pass
+
+    def get_tile(self, uri: str, z: int, x: int, y: int) -> bytes | None:
+        """
+        Returns the tile or None when the archive has no tile at z/x/y (an empty tile). Blocking, call it from the
+        thread pool.
+        """
+        archive = self._archive(uri)
+        with archive.lock:
+            if archive.closed:
+                raise TileArchiveUnavailable(f"Tile archive {uri} was closed")
+            # MBTiles rows are TMS, y axis flipped
+            row = archive.conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (2**z - 1) - y),
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def evict(self, uri: str):
+        """Close an archive and drop its downloaded copy, the next read fetches it again."""
+        with self._lock:
+            archive = self._archives.pop(uri, None)
+        if archive is not None:
+            self._close(archive, remove_copy=True)
+        elif urlparse(uri).scheme == "s3":
+            try:
+                os.remove(self._cache_path(uri))
+            except FileNotFoundError:
+                pass
+
+    def remove(self, uri: str):
+        """Evict an archive replaced by a newer render and delete it from storage."""
+        self.evict(uri)
+        parsed = urlparse(uri)
+        if parsed.scheme == "file":
+            try:
+                os.remove(parsed.path)
+            except FileNotFoundError:
+                pass
+        elif parsed.scheme == "s3":
+            get_object_storage("minio").delete(*parse_uri(uri))
+
+    def clear(self):
+        with self._lock:
+            archives = list(self._archives.values())
+            self._archives.clear()
+        for archive in archives:
+            self._close(archive, remove_copy=False)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+tile_archives = TileArchiveReader(
+    cache_dir=geospatial_mapping_settings.TILE_ARCHIVE_CACHE_DIR,
+    mmap_size=geospatial_mapping_settings.TILE_ARCHIVE_MMAP_SIZE,
+    max_open=geospatial_mapping_settings.TILE_ARCHIVE_MAX_OPEN,
+)
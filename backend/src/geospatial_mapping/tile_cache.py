@@ -0,0 +1,312 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from src.core.config import geospatial_mapping_settings
+from src.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def tile_intersects(z: int, x: int, y: int, bbox: dict) -> bool:
+    """Whether the XYZ tile overlaps a WGS84 bounding box, edges included."""
+    n = 2**z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west <= bbox["xmax"] and east >= bbox["xmin"] and south <= bbox["ymax"] and north >= bbox["ymin"]
+
+
+class TileCache:
+    """
+    Two-tier cache for dataset vector tiles.
+
+    Tiles are kept in a bounded in-process LRU in front of an on-disk store. Both tiers are bounded by size in bytes
+    and evict the least recently used tiles first. Entries are keyed by dataset uid, primary key column, z/x/y and the
+    dataset `updated_at`, so a changed dataset never serves stale tiles even before `invalidate` is called.
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: str | None, disk_max_bytes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] | None = None  # path -> size, loaded lazily
+        self._disk_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "invalidations": 0,
+        }
+
+    @property
+    def disk_enabled(self) -> bool:
+        return bool(self.disk_dir) and self.disk_max_bytes > 0
+
+    @staticmethod
+    def _scope(dataset_uid: str, primary_key_column: str, updated_at: datetime | None) -> str:
+        version = int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+        return f"{dataset_uid}/{version}/{primary_key_column}/"
+
+    @classmethod
+    def _key(
+        cls, dataset_uid: str, primary_key_column: str, z: int, x: int, y: int, updated_at: datetime | None
+    ) -> str:
+        return f"{cls._scope(dataset_uid, primary_key_column, updated_at)}{z}/{x}/{y}"
+
+    @staticmethod
+    def _disk_prefix(scope: str) -> str:
+        return hashlib.sha1(scope.split("/", 1)[1].encode()).hexdigest() + "_"
+
+    def _disk_path(self, key: str) -> str:
+        # The dataset uid is used verbatim so a whole dataset can be dropped with one rmtree, z/x/y so the tiles of
+        # an extent can be found
+        scope, z, x, y = key.rsplit("/", 3)
+        dataset_uid = scope.split("/", 1)[0]
+        return os.path.join(self.disk_dir, dataset_uid, f"{self._disk_prefix(scope + '/')}{z}_{x}_{y}.pbf")
+
+    def _load_disk_index(self):
+        """Scan the disk store once, oldest access first, so eviction order survives restarts."""
+        if self._disk is not None:
+            return
+        entries = []
+        if os.path.isdir(self.disk_dir):
+            for root, _, files in os.walk(self.disk_dir):
+                for name in files:
+                    if not name.endswith(".pbf"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        self._disk = OrderedDict((path, size) for _, path, size in entries)
+        self._disk_bytes = sum(self._disk.values())
+
+    def _memory_put(self, key: str, tile: bytes):
+        if len(tile) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = tile
+        self._memory_bytes += len(tile)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters["memory_evictions"] += 1
+
+    def _disk_put(self, key: str, tile: bytes):
+        self._load_disk_index()
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so concurrent readers never see a partial tile
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(tile)
+        os.replace(tmp_path, path)
+
+        self._disk_bytes -= self._disk.pop(path, 0)
+        self._disk[path] = len(tile)
+        self._disk_bytes += len(tile)
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            evicted_path, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._counters["disk_evictions"] += 1
+            try:
+                os.remove(evicted_path)
+            except FileNotFoundError:
+                pass
+
+    def _disk_get(self, key: str) -> bytes | None:
+        self._load_disk_index()
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                tile = f.read()
+        except FileNotFoundError:
+            self._disk_bytes -= self._disk.pop(path, 0)
+            return None
+        # The file may have been written by another worker sharing the same directory
+        self._disk_bytes += len(tile) - self._disk.get(path, 0)
+        self._disk[path] = len(tile)
+        self._disk.move_to_end(path)
+        os.utime(path)
+        return tile
+
+    def get(
+        self, dataset_uid: str, primary_key_column: str, z: int, x: int, y: int, updated_at: datetime | None
+    ) -> bytes | None:
+        if not self.enabled:
+            return None
+        key = self._key(dataset_uid, primary_key_column, z, x, y, updated_at)
+        with self._lock:
+            tile = self._memory.get(key)
+            if tile is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return tile
+
+            if self.disk_enabled:
+                try:
+                    tile = self._disk_get(key)
+                except OSError as e:
+                    logger.warning(f"Tile cache disk read failed: {e}")
+                    tile = None
+                if tile is not None:
+                    self._counters["disk_hits"] += 1
+                    self._memory_put(key, tile)
+                    return tile
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(
+        self,
+        dataset_uid: str,
+        primary_key_column: str,
+        z: int,
+        x: int,
+        y: int,
+        updated_at: datetime | None,
+        tile: bytes,
+    ):
+        if not self.enabled:
+            return
+        key = self._key(dataset_uid, primary_key_column, z, x, y, updated_at)
+        with self._lock:
+            self._memory_put(key, tile)
+            if self.disk_enabled:
+                try:
+                    self._disk_put(key, tile)
+                except OSError as e:
+                    logger.warning(f"Tile cache disk write failed: {e}")
+
+    def invalidate(self, dataset_uid: str):
+        """Drop every cached tile of a dataset from both tiers."""
+        prefix = f"{dataset_uid}/"
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                self._memory_bytes -= len(self._memory.pop(key))
+
+            if self.disk_enabled:
+                self._load_disk_index()
+                dataset_dir = os.path.join(self.disk_dir, str(dataset_uid))
+                for path in [p for p in self._disk if os.path.dirname(p) == dataset_dir]:
+                    self._disk_bytes -= self._disk.pop(path)
+                shutil.rmtree(dataset_dir, ignore_errors=True)
+
+            self._counters["invalidations"] += 1
+
+    def retain(
+        self,
+        dataset_uid: str,
+        primary_key_column: str,
+        from_updated_at: datetime | None,
+        to_updated_at: datetime | None,
+        dirty_bbox: dict | None = None,
+    ):
+        """
+        Carry the cached tiles of a dataset over to its new `updated_at`, except the tiles intersecting `dirty_bbox`.
+
+        For updates that leave most tiles as they are, such as an incremental ingest or a progress report. Only the
+        tiles of `primary_key_column` are kept, every other tile of the dataset is dropped.
+        """
+        if not self.enabled:
+            return
+        old_scope = self._scope(dataset_uid, primary_key_column, from_updated_at)
+        new_scope = self._scope(dataset_uid, primary_key_column, to_updated_at)
+
+        def keep(z, x, y) -> bool:
+            return dirty_bbox is None or not tile_intersects(int(z), int(x), int(y), dirty_bbox)
+
+        with self._lock:
+            memory = OrderedDict()
+            for key, tile in self._memory.items():
+                if not key.startswith(f"{dataset_uid}/"):
+                    memory[key] = tile
+                elif key.startswith(old_scope) and keep(*key.rsplit("/", 3)[1:]):
+                    memory[new_scope + key[len(old_scope) :]] = tile
+                else:
+                    self._memory_bytes -= len(tile)
+            self._memory = memory
+
+            if self.disk_enabled:
+                self._load_disk_index()
+                dataset_dir = os.path.join(self.disk_dir, str(dataset_uid))
+                old_prefix = self._disk_prefix(old_scope)
+                new_prefix = self._disk_prefix(new_scope)
+                try:
+                    names = os.listdir(dataset_dir)
+                except FileNotFoundError:
+                    names = []
+                # Other workers sharing the directory may have written tiles this one does not know about
+                for name in names:
+                    path = os.path.join(dataset_dir, name)
+                    size = self._disk.pop(path, None)
+                    if size is not None:
+                        self._disk_bytes -= size
+                    if name.startswith(old_prefix) and name.endswith(".pbf") and keep(*name[:-4].split("_")[1:]):
+                        new_path = os.path.join(dataset_dir, new_prefix + name[len(old_prefix) :])
+                        try:
+                            os.replace(path, new_path)
+                            size = os.path.getsize(new_path)
+                        except FileNotFoundError:
+                            continue
+                        self._disk[new_path] = size
+                        self._disk_bytes += size
+                    else:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+
+            self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.disk_enabled:
+                shutil.rmtree(self.disk_dir, ignore_errors=True)
+                self._disk = OrderedDict()
+                self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.disk_enabled:
+                self._load_disk_index()
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_items": len(self._disk) if self._disk is not None else 0,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_enabled else 0,
+            }
+
+
+tile_cache = TileCache(
+    memory_max_bytes=geospatial_mapping_settings.TILE_CACHE_MEMORY_MAX_BYTES,
+    disk_dir=geospatial_mapping_settings.TILE_CACHE_DISK_DIR,
+    disk_max_bytes=geospatial_mapping_settings.TILE_CACHE_DISK_MAX_BYTES,
+    enabled=geospatial_mapping_settings.TILE_CACHE_ENABLED,
+)
@@ -1,3 +1,5 @@
+import base64
+import json
 import os
 import re
 import unicodedata
@@ -20,3 +22,20 @@ def sanitize_dataset_name(filename, max_length=100):
     if len(base_name) > max_length:
         base_name = base_name[:max_length].rstrip()
     return base_name
+
+
+def encode_table_cursor(primary_key_column: str, value) -> str:
+    """Opaque cursor pointing after the row whose primary key is `value`."""
+    payload = json.dumps({"k": primary_key_column, "v": value}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_table_cursor(cursor: str, primary_key_column: str):
+    """Returns the primary key value of a cursor, raises ValueError when it is not a cursor of this column."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(payload, dict) or payload.get("k") != primary_key_column or "v" not in payload:
+        raise ValueError("Cursor does not belong to this dataset")
+    return payload["v"]
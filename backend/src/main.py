@@ -44,6 +44,7 @@ if settings.all_cors_origins:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Upload-Offset", "Location"],
     )
 logger.warning(f"BACKEND_CORS_ORIGINS={settings.BACKEND_CORS_ORIGINS}")
 logger.warning(f"FRONTEND_HOST={settings.FRONTEND_HOST}")
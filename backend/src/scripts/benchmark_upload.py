@@ -0,0 +1,99 @@
+"""
+Upload throughput against the configured MinIO.
+
+Streams generated data through `multipart_upload`, the path used by the upload endpoints, and reports MB/s per upload
+and for the whole worker, along with the worst event loop stall seen while uploading.
+
+    python -m src.scripts.benchmark_upload --size-mb 512 --uploads 1 4 --concurrent-parts 1 4 8
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from src.core.logging import get_logger, setup_logging
+from src.core.storage import get_async_storage, get_object_storage
+from src.files.services import MINIO_UPLOAD_BUCKET_NAME, multipart_upload
+
+setup_logging()
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def generate(size: int):
+    # Incompressible data, sent in chunks the size of an ASGI body message
+    block = os.urandom(4 * 1024 * 1024)
+    sent = 0
+    while sent < size:
+        for i in range(0, len(block), CHUNK_SIZE):
+            if sent >= size:
+                return
+            chunk = block[i : i + min(CHUNK_SIZE, size - sent)]
+            sent += len(chunk)
+            yield chunk
+            await asyncio.sleep(0)
+
+
+async def watch_event_loop(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Longest delay of a timer on the event loop, in seconds."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(size: int, uploads: int, part_size: int, concurrent_parts: int):
+    object_names = [f"benchmark/{uuid.uuid4()}" for _ in range(uploads)]
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_event_loop(stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            multipart_upload(
+                get_async_storage("minio"),
+                MINIO_UPLOAD_BUCKET_NAME,
+                object_name,
+                generate(size),
+                part_size=part_size,
+                max_concurrent_parts=concurrent_parts,
+            )
+            for object_name in object_names
+        )
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    stall = await watcher
+
+    for object_name in object_names:
+        get_object_storage("minio").delete(MINIO_UPLOAD_BUCKET_NAME, object_name)
+
+    total_mb = size * uploads / 1024 / 1024
+    print(
+        f"uploads={uploads} concurrent_parts={concurrent_parts} part_size={part_size // 1024 // 1024}MB "
+        f"total={total_mb:.0f}MB time={elapsed:.2f}s worker={total_mb / elapsed:.1f}MB/s "
+        f"per_upload={total_mb / uploads / elapsed:.1f}MB/s max_loop_stall={stall * 1000:.0f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256, help="size of each upload")
+    parser.add_argument("--uploads", type=int, nargs="+", default=[1], help="concurrent uploads")
+    parser.add_argument("--part-size-mb", type=int, default=16)
+    parser.add_argument("--concurrent-parts", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    get_object_storage("minio").ensure_bucket(MINIO_UPLOAD_BUCKET_NAME)
+
+    for uploads in args.uploads:
+        for concurrent_parts in args.concurrent_parts:
+            await run(args.size_mb * 1024 * 1024, uploads, args.part_size_mb * 1024 * 1024, concurrent_parts)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
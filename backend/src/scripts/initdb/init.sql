@@ -10,34 +10,63 @@ CREATE OR REPLACE FUNCTION public.get_dataset_tile(
     y integer
 ) RETURNS bytea
 LANGUAGE plpgsql
+STABLE
+PARALLEL SAFE
 AS $$
 DECLARE
     tile bytea;
+    geom_3857 text := 'ST_Transform(geom, 3857)';
+    tile_geom text;
+    generalized_column text;
 BEGIN
+    -- Prefer the Web Mercator geometry persisted at ingest so the tile filter can use its GiST index
+    IF EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = 'geom_3857'
+          AND NOT attisdropped
+    ) THEN
+        geom_3857 := 'geom_3857';
+    END IF;
+    tile_geom := geom_3857;
+
+    -- Low zoom tiles are cut from geometry simplified at ingest for their zoom band
+    generalized_column := CASE
+        WHEN z <= 5 THEN 'geom_3857_z5'
+        WHEN z <= 9 THEN 'geom_3857_z9'
+        WHEN z <= 12 THEN 'geom_3857_z12'
+    END;
+    IF generalized_column IS NOT NULL AND EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(quote_ident(relation))
+          AND attname = generalized_column
+          AND NOT attisdropped
+    ) THEN
+        tile_geom := generalized_column;
+    END IF;
+
     EXECUTE format(
         $f$
         WITH mvtgeom AS (
             SELECT ST_AsMVTGeom(
-                       ST_Transform(geom, 3857),
-                       ST_TileEnvelope(%s, %s, %s),
+                       %1$s,
+                       ST_TileEnvelope(%3$s, %4$s, %5$s),
                        4096,
                        0,
                        true
                    ) AS geom
-			,%s AS id
-			,*
-            FROM %s
-            WHERE ST_Intersects(
-                ST_Transform(geom, 3857),
-                ST_TileEnvelope(%s, %s, %s)
-            )
+			,%6$I AS id
+			,to_jsonb(t) - ARRAY['geom', 'geom_3857', 'geom_3857_z5', 'geom_3857_z9', 'geom_3857_z12'] AS attributes
+            FROM %7$I AS t
+            WHERE %2$s && ST_TileEnvelope(%3$s, %4$s, %5$s)
         )
         SELECT ST_AsMVT(mvtgeom, 'dataset', 4096, 'geom', 'id') FROM mvtgeom
         $f$,
+        tile_geom,
+        geom_3857,
         z, x, y,
 		primary_key_column,
-        quote_ident(relation),  -- Properly quote table name
-        z, x, y
+        relation
     ) INTO tile;
 
     IF tile IS NULL OR length(tile) = 0 THEN
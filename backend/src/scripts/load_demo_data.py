@@ -14,7 +14,8 @@ from src.apps.schemas import AppCreate
 from src.apps.services import create_app
 from src.auth.models import AccountType, UserProfile
 from src.core.config import secret_settings, postgis_settings, demo_settings
-from src.database.session import engine
+from src.database.session import async_engine, engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from src.core.logging import get_logger, setup_logging
 from src.geospatial_mapping.services import create_dataset, get_dataset_bbox, update_dataset
 
@@ -107,6 +108,22 @@ def ensure_id_column(session: Session, table_name: str):
     session.exec(query.params(table_name=table_name))
 
 
+def create_web_mercator_geometry(session: Session, table_name: str):
+    session.exec(
+        text(
+            f"""
+    ALTER TABLE "{table_name}"
+    ADD COLUMN IF NOT EXISTS geom_3857 geometry(Geometry, 3857)
+    GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED
+    """
+        )
+    )
+    session.exec(
+        text(f'CREATE INDEX IF NOT EXISTS "{table_name}_geom_3857_idx" ON "{table_name}" USING GIST (geom_3857)')
+    )
+    session.commit()
+
+
 def ogr2ogr_to_postgis(data: DatasetLoadOgr) -> DatasetLoadOgr:
     pg_table = get_table_name(str(data.uid))
     # Build the ogr2ogr command
@@ -169,7 +186,8 @@ async def load_geospatial_mapping_data(session: Session) -> None:
             d.storage_uri = upload_response["storage_uri"]
 
             # create Dataset record with status = 'uploaded'
-            created_dataset = create_dataset(db=session, dataset=d)
+            async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+                created_dataset = await create_dataset(db=async_session, dataset=d)
             logger.info(f"Dataset created: {created_dataset.name}")
 
         # load dataset to postgis via ogr2ogr
@@ -179,6 +197,9 @@ async def load_geospatial_mapping_data(session: Session) -> None:
             )
         )
 
+        # precompute Web Mercator geometry used by the tile function
+        create_web_mercator_geometry(session=session, table_name=pg_table)
+
         # make sure id column is available on new table
         logger.info("Getting primary key column...")
         inspector = inspect(engine)
@@ -187,17 +208,20 @@ async def load_geospatial_mapping_data(session: Session) -> None:
         pk_columns = pk_info.get("constrained_columns", [])
         primary_key_column = pk_columns[0]
 
-        bbox = get_dataset_bbox(db=session, dataset_uid=d.uid)
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            bbox = await get_dataset_bbox(db=async_session, dataset_uid=d.uid)
 
-        # update Dataset record status,bbox
-        updated_dataset = update_dataset(
-            db=session,
-            dataset_uid=d.uid,
-            account_id=d.account_id,
-            dataset=DatasetUpdate(status="ready", primary_key_column=primary_key_column, bbox=BoundingBox(**bbox)),
-        )
+            # update Dataset record status,bbox
+            updated_dataset = await update_dataset(
+                db=async_session,
+                dataset_uid=d.uid,
+                account_id=d.account_id,
+                dataset=DatasetUpdate(status="ready", primary_key_column=primary_key_column, bbox=BoundingBox(**bbox)),
+            )
         logger.info(f"updated_dataset {updated_dataset}")
 
+    await async_engine.dispose()
+
 
 def init() -> None:
     with Session(engine) as session:
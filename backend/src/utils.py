@@ -1,13 +1,99 @@
-import json
+import asyncio
+from decimal import Decimal
+from typing import Any, AsyncIterable, Awaitable, Callable, Hashable, Iterable, Mapping
+import orjson
 
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def stream_json(records):
-    yield "["
+
+def json_default(value: Any):
+    """Encodes the values orjson has no native support for."""
+    if isinstance(value, Decimal):
+        # Emitted verbatim as a JSON number, no precision lost through float
+        return orjson.Fragment(str(value)) if value.is_finite() else None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # Geometry read as WKB, rendered as hex WKB like PostGIS does
+        return bytes(value).hex()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps_json(value: Any) -> bytes:
+    return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+async def stream_json(
+    batches: AsyncIterable[Iterable[Mapping]],
+    dumps: Callable[[Any], bytes] = dumps_json,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+):
+    """
+    Streams batches of rows as a single JSON array, one batch in memory at a time.
+
+    Each batch is encoded with a single `dumps` call and the output is coalesced into chunks of about `chunk_size`
+    bytes, so the response is not written one row at a time.
+    """
+    buffer = bytearray(b"[")
     first = True
-    for row in records:
+    async for records in batches:
+        rows = [dict(row) for row in records]
+        if not rows:
+            continue
         if not first:
-            yield ","
+            buffer += b","
+        first = False
+        # Strip the brackets of the encoded batch, the rows go into the array already opened
+        buffer += memoryview(dumps(rows))[1:-1]
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key into a single execution.
+
+    The first caller of `do` for a key runs the function, every caller arriving while it runs awaits and shares its
+    result (or exception). If the running caller is cancelled, a waiting caller takes over.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while key in self._calls:
+            future = self._calls[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the running caller was cancelled, retry and possibly run it ourselves
+                self.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark exceptions retrieved, there may be nobody else waiting for them
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = future
+        self.executions += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
         else:
-            first = False
-        yield json.dumps(dict(row))
-    yield "]"
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -1,9 +1,13 @@
 import os
+import uuid
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 from sqlmodel import Session, delete, select
+from src.auth.models import Account
 from src.core.logging import get_logger
+from src.files.services import S3_MIN_PART_SIZE
+from src.files.models import ResumableUpload
 
 logger = get_logger(__name__)
 
@@ -28,3 +32,50 @@ def test_upload_file(test_account_authorized_headers, client: TestClient):
         )
     logger.info(f"response status_code={response.status_code} json={response.json()}")
     assert response.status_code == status.HTTP_200_OK
+
+
+def test_resumable_upload_of_another_account(
+    test_account_authorized_headers, client: TestClient, db: Session, local_uploads
+):
+    response = client.post(
+        "/api/v1/files/uploads/resumable",
+        headers=test_account_authorized_headers,
+        json={"filename": "data.gpkg", "size": 3},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    key = response.json()["key"]
+    response = client.head(f"/api/v1/files/uploads/resumable/{key}", headers=test_account_authorized_headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.headers["Upload-Offset"] == "0"
+
+    # Hand the upload over to another account, it is then unknown to the test account
+    other = Account(email=f"{uuid.uuid4()}@example.com", hashed_password="")
+    db.add(other)
+    db.commit()
+    upload = db.exec(select(ResumableUpload).where(ResumableUpload.key == key)).one()
+    upload.account_id = other.id
+    db.add(upload)
+    db.commit()
+
+    url = f"/api/v1/files/uploads/resumable/{key}"
+    headers = {**test_account_authorized_headers, "Upload-Offset": "0"}
+    assert client.head(url, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert client.patch(url, headers=headers, content=b"abc").status_code == status.HTTP_404_NOT_FOUND
+    assert client.post(f"{url}/complete", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert client.delete(url, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_resumable_upload_rejects_short_chunks(test_account_authorized_headers, client: TestClient, local_uploads):
+    response = client.post(
+        "/api/v1/files/uploads/resumable",
+        headers=test_account_authorized_headers,
+        json={"filename": "data.gpkg", "size": S3_MIN_PART_SIZE + 3},
+    )
+    key = response.json()["key"]
+
+    response = client.patch(
+        f"/api/v1/files/uploads/resumable/{key}",
+        headers={**test_account_authorized_headers, "Upload-Offset": "0"},
+        content=b"a" * 10,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
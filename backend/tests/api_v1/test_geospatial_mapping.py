@@ -1,6 +1,30 @@
+import hashlib
+import uuid
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlmodel import Session, text
+from src.dependencies import get_temporal_client
 from src.geospatial_mapping.models import DatasetCreate, DatasetStatus
+from src.main import app
+
+
+class FakeTemporalClient:
+    """Records the workflows started by the API instead of running them."""
+
+    def __init__(self):
+        self.started = []
+
+    async def start_workflow(self, workflow, arg, **kwargs):
+        self.started.append((workflow, arg))
+
+
+@pytest.fixture
+def temporal_client():
+    fake = FakeTemporalClient()
+    app.dependency_overrides[get_temporal_client] = lambda: fake
+    yield fake
+    app.dependency_overrides.pop(get_temporal_client)
 
 
 def test_create_dataset_process_and_read(
@@ -50,6 +74,35 @@ def test_create_dataset_process_and_read(
     print(response.json())
 
 
+def test_create_dataset_ignores_server_managed_fields(
+    test_account_authorized_headers, test_account_authorized_account_id, client: TestClient
+):
+    dataset = DatasetCreate(
+        account_id=test_account_authorized_account_id,
+        name="test-dataset-server-fields",
+        file_name="test-dataset-server-fields.txt",
+        storage_backend="minio",
+        storage_uri="s3://test-bucket/test-dataset-server-fields.txt",
+    )
+    response = client.post(
+        "/api/v1/geospatial-mapping/datasets",
+        headers=test_account_authorized_headers,
+        json={
+            **dataset.model_dump(mode="json"),
+            "tile_archive_uri": "file:///etc/passwd",
+            "tile_archive_max_zoom": 8,
+            "content_hash": "0" * 64,
+            "parent_uid": "19bea7c2-d17c-47b7-b88a-1fe5133cc1b6",
+        },
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    dataset_response = response.json()
+    assert dataset_response["tile_archive_uri"] is None
+    assert dataset_response["tile_archive_max_zoom"] is None
+    assert dataset_response["content_hash"] is None
+    assert dataset_response["parent_uid"] is None
+
+
 def test_get_dataset_content(test_account_authorized_headers, test_account_authorized_account_id, client: TestClient):
     demo_dataset_uid = "19bea7c2-d17c-47b7-b88a-1fe5133cc1b6"
     response = client.get(
@@ -57,3 +110,185 @@ def test_get_dataset_content(test_account_authorized_headers, test_account_autho
     )
 
     assert response.status_code == 200
+
+
+def test_ingest_dataset_upsert_requires_key_column(test_account_authorized_headers, client: TestClient):
+    demo_dataset_uid = "19bea7c2-d17c-47b7-b88a-1fe5133cc1b6"
+    response = client.post(
+        f"/api/v1/geospatial-mapping/datasets/{demo_dataset_uid}/ingest",
+        headers=test_account_authorized_headers,
+        json={
+            "file_name": "delta.shp",
+            "storage_backend": "minio",
+            "storage_uri": "s3://test-bucket/delta.shp",
+            "mode": "upsert",
+        },
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_create_dataset_clones_upload_with_same_content(
+    test_account_authorized_headers,
+    test_account_authorized_account_id,
+    client: TestClient,
+    temporal_client,
+    local_uploads,
+):
+    content = f'{{"type": "FeatureCollection", "features": [], "name": "{uuid.uuid4()}"}}'.encode()
+
+    def upload_and_create(name: str, **fields) -> dict:
+        response = client.post(
+            "/api/v1/files/upload/stream",
+            headers=test_account_authorized_headers,
+            params={"filename": f"{name}.geojson"},
+            content=content,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        dataset = DatasetCreate(
+            account_id=test_account_authorized_account_id,
+            name=name,
+            file_name=f"{name}.geojson",
+            storage_backend="local",
+            storage_uri=response.json()["storage_uri"],
+        )
+        response = client.post(
+            "/api/v1/geospatial-mapping/datasets",
+            headers=test_account_authorized_headers,
+            json={**dataset.model_dump(mode="json"), **fields},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.json()
+
+    # The hash is the one computed while the file was uploaded, the one sent by the client is ignored
+    source = upload_and_create("content-hash-source", content_hash="0" * 64)
+    assert source["content_hash"] == hashlib.sha256(content).hexdigest()
+    assert "source_dataset_uid" not in temporal_client.started[-1][1]
+
+    # Only ready datasets are cloned
+    response = client.put(
+        f"/api/v1/geospatial-mapping/datasets/{source['uid']}",
+        headers=test_account_authorized_headers,
+        json={"status": "ready"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    clone = upload_and_create("content-hash-clone")
+    assert clone["content_hash"] == source["content_hash"]
+    workflow, workflow_input = temporal_client.started[-1]
+    assert workflow == "DatasetPostUploadWorkflow"
+    assert workflow_input["uid"] == clone["uid"]
+    assert workflow_input["source_dataset_uid"] == source["uid"]
+    assert workflow_input["source_layers"] == [{"uid": source["uid"], "layer_name": None}]
+
+    # A multi-layer source is cloned with all its layers, once every one of them is ready
+    response = client.post(
+        f"/api/v1/geospatial-mapping/datasets/{source['uid']}/layers",
+        headers=test_account_authorized_headers,
+        json={"layer_names": ["rivers"]},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    layer = response.json()[0]
+    upload_and_create("content-hash-clone-processing-layer")
+    assert "source_dataset_uid" not in temporal_client.started[-1][1]
+
+    client.put(
+        f"/api/v1/geospatial-mapping/datasets/{layer['uid']}",
+        headers=test_account_authorized_headers,
+        json={"status": "ready"},
+    )
+    upload_and_create("content-hash-clone-layers")
+    assert temporal_client.started[-1][1]["source_layers"] == [
+        {"uid": source["uid"], "layer_name": None},
+        {"uid": layer["uid"], "layer_name": "rivers"},
+    ]
+
+
+def test_create_dataset_without_upload_record_is_not_cloned(
+    test_account_authorized_headers, test_account_authorized_account_id, client: TestClient, temporal_client
+):
+    dataset = DatasetCreate(
+        account_id=test_account_authorized_account_id,
+        name="test-dataset-unrecorded",
+        file_name="test-dataset-unrecorded.txt",
+        storage_backend="minio",
+        storage_uri=f"s3://test-bucket/{uuid.uuid4()}.txt",
+    )
+    response = client.post(
+        "/api/v1/geospatial-mapping/datasets",
+        headers=test_account_authorized_headers,
+        json=dataset.model_dump(mode="json"),
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["content_hash"] is None
+    assert "source_dataset_uid" not in temporal_client.started[-1][1]
+
+
+def test_get_dataset_features(
+    test_account_authorized_headers,
+    test_account_authorized_account_id,
+    client: TestClient,
+    db: Session,
+    temporal_client,
+):
+    dataset = DatasetCreate(
+        account_id=test_account_authorized_account_id,
+        name="test-dataset-features",
+        file_name="test-dataset-features.geojson",
+        storage_backend="minio",
+        storage_uri=f"s3://test-bucket/{uuid.uuid4()}.geojson",
+    )
+    response = client.post(
+        "/api/v1/geospatial-mapping/datasets",
+        headers=test_account_authorized_headers,
+        json=dataset.model_dump(mode="json"),
+    )
+    dataset_uid = response.json()["uid"]
+
+    # Table as loaded by the post-upload workflow
+    table_name = f"u_{dataset_uid.replace('-', '_')}"
+    db.exec(text(f"CREATE TABLE {table_name} (ogc_fid serial PRIMARY KEY, code varchar, value integer, geom geometry)"))
+    db.exec(text(f"""
+            INSERT INTO {table_name} (code, value, geom) VALUES
+            ('b', 2, ST_GeomFromText('POINT(1.123456 1)', 4326)),
+            ('a', 1, ST_GeomFromText('POINT(0 0)', 4326)),
+            ('c', 3, ST_GeomFromText('POINT(50 50)', 4326))
+            """))
+    client.put(
+        f"/api/v1/geospatial-mapping/datasets/{dataset_uid}",
+        headers=test_account_authorized_headers,
+        json={"status": "ready", "primary_key_column": "ogc_fid"},
+    )
+
+    try:
+        response = client.get(
+            f"/api/v1/geospatial-mapping/datasets/{dataset_uid}/features",
+            headers=test_account_authorized_headers,
+            params={"bbox": "-1,-1,2,2", "properties": "code", "precision": 2},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/geo+json"
+        collection = response.json()
+        assert collection["type"] == "FeatureCollection"
+        # Features in primary key order, only the requested properties, coordinates rounded to the precision
+        assert [(f["properties"], f["geometry"]["coordinates"]) for f in collection["features"]] == [
+            ({"code": "b"}, [1.12, 1]),
+            ({"code": "a"}, [0, 0]),
+        ]
+
+        response = client.get(
+            f"/api/v1/geospatial-mapping/datasets/{dataset_uid}/features",
+            headers=test_account_authorized_headers,
+            params={"limit": 1},
+        )
+        features = response.json()["features"]
+        assert len(features) == 1
+        assert features[0]["properties"] == {"ogc_fid": 1, "code": "b", "value": 2}
+
+        response = client.get(
+            f"/api/v1/geospatial-mapping/datasets/{dataset_uid}/features",
+            headers=test_account_authorized_headers,
+            params={"properties": "code,missing"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    finally:
+        db.exec(text(f"DROP TABLE {table_name}"))
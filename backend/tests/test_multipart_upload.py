@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import threading
+import uuid
+import pytest
+from object_storage import AsyncObjectStorage, LocalStorage, PartInfo
+from src.core.config import settings
+from src.files.models import ResumableUpload
+from src.files.schemas import MultipartUploadComplete, MultipartUploadPart
+from fastapi import HTTPException
+from src.files import services
+from src.files.services import (
+    S3_MAX_PARTS,
+    S3_MIN_PART_SIZE,
+    abort_presigned_multipart_upload,
+    append_resumable_upload,
+    complete_presigned_multipart_upload,
+    complete_resumable_upload,
+    create_resumable_upload,
+    get_part_size,
+    get_resumable_upload_offset,
+    get_upload_capabilities,
+    get_upload_offset,
+    multipart_upload,
+    read_content_hash,
+    verify_resumable_upload,
+    verify_uploaded_parts,
+)
+
+
+class RecordingStorage(LocalStorage):
+    """Local multipart uploads, a part may be made to fail."""
+
+    def __init__(self, root: str, fail_part: int | None = None):
+        super().__init__(root)
+        self.fail_part = fail_part
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+        self._parts_lock = threading.Lock()
+
+    def upload_part(self, bucket, key, upload_id, part_number, data):
+        if part_number == self.fail_part:
+            raise RuntimeError("part failed")
+        with self._parts_lock:
+            self.parts[part_number] = data
+        return super().upload_part(bucket, key, upload_id, part_number, data)
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts):
+        self.completed = parts
+        super().complete_multipart_upload(bucket, key, upload_id, parts)
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        self.aborted = True
+        super().abort_multipart_upload(bucket, key, upload_id)
+
+
+async def iter_chunks(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+def test_multipart_upload_streams_parts(tmp_path):
+    data = bytes(range(256)) * 1000
+    storage = RecordingStorage(str(tmp_path))
+
+    result = asyncio.run(
+        multipart_upload(
+            AsyncObjectStorage(storage),
+            "bucket",
+            "key",
+            iter_chunks(data, 7000),
+            part_size=50000,
+            max_concurrent_parts=2,
+        )
+    )
+
+    assert result == {"size": len(data), "content_hash": hashlib.sha256(data).hexdigest()}
+    assert [p.part_number for p in storage.completed] == list(range(1, 7))
+    assert all(len(storage.parts[n]) == 50000 for n in range(1, 6))
+    assert storage.read_range("bucket", "key", 0, len(data)) == data
+
+
+def test_multipart_upload_empty_file(tmp_path):
+    storage = RecordingStorage(str(tmp_path))
+    result = asyncio.run(
+        multipart_upload(AsyncObjectStorage(storage), "bucket", "key", iter_chunks(b"", 1), part_size=10)
+    )
+    assert result == {"size": 0, "content_hash": hashlib.sha256(b"").hexdigest()}
+    assert storage.parts == {1: b""}
+
+
+def test_multipart_upload_aborts_on_failure(tmp_path):
+    storage = RecordingStorage(str(tmp_path), fail_part=2)
+    with pytest.raises(RuntimeError):
+        asyncio.run(
+            multipart_upload(
+                AsyncObjectStorage(storage),
+                "bucket",
+                "key",
+                iter_chunks(b"x" * 100, 10),
+                part_size=10,
+                max_concurrent_parts=1,
+            )
+        )
+    assert storage.aborted
+    assert storage.completed is None
+    assert not storage.exists("bucket", "key")
+
+
+def test_get_part_size_fits_part_limit():
+    assert get_part_size(100) == settings.UPLOAD_PART_SIZE
+    size = settings.UPLOAD_PART_SIZE * S3_MAX_PARTS * 3
+    assert size / get_part_size(size) <= S3_MAX_PARTS
+
+
+def completed_upload(parts: list[tuple[int, str]], size: int) -> MultipartUploadComplete:
+    return MultipartUploadComplete(
+        uid=uuid.uuid4(),
+        filename="data.gpkg",
+        size=size,
+        key="data.gpkg",
+        upload_id="upload-1",
+        parts=[MultipartUploadPart(part_number=n, etag=etag) for n, etag in parts],
+    )
+
+
+def test_verify_uploaded_parts():
+    uploaded = [PartInfo(1, "a", 10), PartInfo(2, "b", 3)]
+    verify_uploaded_parts(completed_upload([(1, '"a"'), (2, "b")], 13), uploaded, part_size=10)
+
+    with pytest.raises(ValueError):
+        verify_uploaded_parts(completed_upload([(1, "a"), (2, "x")], 13), uploaded, part_size=10)
+    with pytest.raises(ValueError):
+        verify_uploaded_parts(completed_upload([(1, "a")], 10), uploaded, part_size=10)
+    with pytest.raises(ValueError):
+        verify_uploaded_parts(completed_upload([(1, "a"), (2, "b")], 20), uploaded, part_size=10)
+    with pytest.raises(ValueError):
+        verify_uploaded_parts(completed_upload([(1, "a"), (2, "b")], 13), uploaded, part_size=8)
+
+
+@pytest.mark.parametrize("backend", ["minio", "s3"])
+def test_presigned_upload_of_another_account(tmp_path, monkeypatch, backend):
+    storage = AsyncObjectStorage(RecordingStorage(str(tmp_path)))
+    monkeypatch.setattr(settings, "UPLOAD_BACKEND", backend)
+    monkeypatch.setattr(services, "get_async_storage", lambda backend: storage)
+    owner, other = str(uuid.uuid4()), str(uuid.uuid4())
+    upload = completed_upload([(1, "a")], 10)
+    upload.key = services.get_upload_target(upload.filename, upload.uid, owner)["key"]
+    assert upload.key.startswith(services.get_account_upload_prefix(owner))
+
+    with pytest.raises(ValueError):
+        asyncio.run(complete_presigned_multipart_upload(upload, account_uid=other))
+    with pytest.raises(ValueError):
+        asyncio.run(abort_presigned_multipart_upload(upload.key, "upload-1", account_uid=other))
+
+
+@pytest.fixture
+def upload_storage(tmp_path, monkeypatch):
+    """Uploads stored under `tmp_path` with the local backend."""
+    storage = AsyncObjectStorage(LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(settings, "UPLOAD_BACKEND", "local")
+    monkeypatch.setattr(services, "get_async_storage", lambda backend: storage)
+    return storage
+
+
+def test_get_upload_offset_stops_at_gap():
+    parts = [PartInfo(1, "a", 10), PartInfo(3, "c", 10), PartInfo(2, "b", 5)]
+    assert get_upload_offset(parts) == 25
+    assert get_upload_offset([PartInfo(2, "b", 10)]) == 0
+    assert get_upload_offset([]) == 0
+
+
+@pytest.fixture
+def chunk_size(monkeypatch):
+    """Resumable uploads sent in chunks of the S3 minimum part size."""
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", S3_MIN_PART_SIZE)
+    return S3_MIN_PART_SIZE
+
+
+def test_append_resumable_upload(upload_storage, chunk_size):
+    upload = asyncio.run(create_resumable_upload("data.gpkg", chunk_size + 3, account_id=1))
+    assert upload.chunk_size == chunk_size
+
+    assert asyncio.run(append_resumable_upload(upload, 0, chunk_size, iter_chunks(b"a" * chunk_size, 65536))) == (
+        chunk_size
+    )
+    assert asyncio.run(append_resumable_upload(upload, chunk_size, 3, iter_chunks(b"b" * 3, 4))) == chunk_size + 3
+    assert asyncio.run(get_resumable_upload_offset(upload)) == chunk_size + 3
+
+    # A chunk sent again after a lost response starts behind the received bytes
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(append_resumable_upload(upload, chunk_size, 3, iter_chunks(b"b" * 3, 4)))
+    assert e.value.status_code == 409
+
+
+def test_append_resumable_upload_rejects_short_chunks(upload_storage, chunk_size):
+    upload = asyncio.run(create_resumable_upload("data.gpkg", chunk_size + 3, account_id=1))
+
+    # Only the last chunk may be shorter than chunk_size, nor may a chunk end past the file
+    for offset, length in ((0, 10), (0, chunk_size - 1), (0, chunk_size + 10)):
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(append_resumable_upload(upload, offset, length, iter_chunks(b"a" * length, 65536)))
+        assert e.value.status_code == 400
+    assert asyncio.run(get_resumable_upload_offset(upload)) == 0
+
+    # A chunk cut short is not stored
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(append_resumable_upload(upload, 0, chunk_size, iter_chunks(b"c" * 6, 4)))
+    assert e.value.status_code == 400
+    assert asyncio.run(get_resumable_upload_offset(upload)) == 0
+
+
+def test_append_resumable_upload_unknown_key(upload_storage):
+    upload = ResumableUpload(key=f"{uuid.uuid4()}.gpkg", account_id=1, filename="data.gpkg", size=1, chunk_size=1)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(append_resumable_upload(upload, 0, 1, iter_chunks(b"a", 1)))
+    assert e.value.status_code == 404
+
+
+def test_complete_resumable_upload(upload_storage):
+    upload = asyncio.run(create_resumable_upload("data.gpkg", 3, account_id=1))
+    asyncio.run(append_resumable_upload(upload, 0, 3, iter_chunks(b"abc", 2)))
+
+    result = asyncio.run(complete_resumable_upload(upload))
+
+    assert result["name"] == "data.gpkg"
+    assert result["storage_uri"] == f"local://uploads/{upload.key}"
+    assert result["content_hash"] == hashlib.sha256(b"abc").hexdigest()
+    assert asyncio.run(upload_storage.read_range("uploads", upload.key, 0, 3)) == b"abc"
+
+
+def test_read_content_hash(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    data = bytes(range(256)) * 100
+    storage.put("uploads", "data.gpkg", data, len(data))
+    assert read_content_hash(storage, "uploads", "data.gpkg", chunk_size=1000) == hashlib.sha256(data).hexdigest()
+
+
+def test_get_upload_capabilities(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_BACKEND", "local")
+    assert get_upload_capabilities() == {"backend": "local", "presigned": False, "resumable": True, "stream": True}
+    monkeypatch.setattr(settings, "UPLOAD_BACKEND", "uploadthing")
+    assert get_upload_capabilities() == {
+        "backend": "uploadthing",
+        "presigned": False,
+        "resumable": False,
+        "stream": False,
+    }
+
+
+def test_verify_resumable_upload():
+    full = S3_MIN_PART_SIZE
+    parts = [PartInfo(1, "a", full), PartInfo(2, "b", 3)]
+    assert verify_resumable_upload(parts, full + 3) == parts
+
+    with pytest.raises(ValueError):
+        verify_resumable_upload(parts, full + 10)
+    with pytest.raises(ValueError):
+        verify_resumable_upload([PartInfo(1, "a", 3), PartInfo(2, "b", 3)], 6)
+    with pytest.raises(ValueError):
+        verify_resumable_upload([PartInfo(1, "a", full), PartInfo(3, "c", 3)], full + 3)
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from src.utils import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def render():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return b"tile"
+
+    async def main():
+        return await asyncio.gather(*[single_flight.do(("tile", 0, 0, 0), render) for _ in range(10)])
+
+    results = asyncio.run(main())
+    assert results == [b"tile"] * 10
+    assert calls == 1
+    assert single_flight.executions == 1
+    assert single_flight.coalesced == 9
+    assert single_flight.in_flight == 0
+
+
+def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight()
+
+    async def render():
+        await asyncio.sleep(0.01)
+        raise ValueError("render failed")
+
+    async def main():
+        return await asyncio.gather(*[single_flight.do("key", render) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert single_flight.executions == 1
+
+
+def test_single_flight_takes_over_cancelled_call():
+    single_flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "ok"
+
+    async def main():
+        leader = asyncio.create_task(single_flight.do("key", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(single_flight.do("key", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "ok"
+    assert single_flight.executions == 2
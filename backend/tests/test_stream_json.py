@@ -0,0 +1,43 @@
+import asyncio
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from src.utils import stream_json
+
+
+async def batches(*batches):
+    for batch in batches:
+        yield batch
+
+
+def collect(stream) -> bytes:
+    async def run():
+        return [chunk async for chunk in stream]
+
+    return asyncio.run(run())
+
+
+def test_stream_json_encodes_database_types():
+    row = {
+        "id": 1,
+        "uid": uuid.UUID("19bea7c2-d17c-47b7-b88a-1fe5133cc1b6"),
+        "price": Decimal("12345678901234567890.123"),
+        "day": date(2025, 4, 21),
+        "at": datetime(2025, 4, 21, 11, 28, 24),
+        "geom": memoryview(bytes.fromhex("0101000000000000000000f03f0000000000000040")),
+    }
+    body = b"".join(collect(stream_json(batches([row]))))
+    assert body == (
+        b'[{"id":1,"uid":"19bea7c2-d17c-47b7-b88a-1fe5133cc1b6","price":12345678901234567890.123,'
+        b'"day":"2025-04-21","at":"2025-04-21T11:28:24","geom":"0101000000000000000000f03f0000000000000040"}]'
+    )
+
+
+def test_stream_json_coalesces_chunks():
+    rows = [{"id": i} for i in range(100)]
+    chunks = collect(stream_json(batches(rows[:50], [], rows[50:]), chunk_size=256))
+    assert json.loads(b"".join(chunks)) == rows
+    assert len(chunks) < 10
+
+    assert collect(stream_json(batches())) == [b"[]"]
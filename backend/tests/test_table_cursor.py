@@ -0,0 +1,16 @@
+import pytest
+from src.geospatial_mapping.utils import decode_table_cursor, encode_table_cursor
+
+
+@pytest.mark.parametrize("value", [1, 9_007_199_254_740_993, "a/b+c", None])
+def test_table_cursor_roundtrip(value):
+    cursor = encode_table_cursor("ogc_fid", value)
+    assert "=" not in cursor
+    assert decode_table_cursor(cursor, "ogc_fid") == value
+
+
+def test_table_cursor_rejects_other_column_and_garbage():
+    with pytest.raises(ValueError):
+        decode_table_cursor(encode_table_cursor("ogc_fid", 1), "id")
+    with pytest.raises(ValueError):
+        decode_table_cursor("not-a-cursor", "ogc_fid")
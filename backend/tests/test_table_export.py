@@ -0,0 +1,65 @@
+import asyncio
+import io
+import json
+import uuid
+from decimal import Decimal
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.geospatial_mapping.table_export import arrow_schema, stream_arrow_ipc, stream_geoparquet
+
+COLUMNS = [
+    {"column_name": "ogc_fid", "data_type": "integer", "udt_name": "int4", "numeric_precision": 32, "numeric_scale": 0},
+    {"column_name": "name", "data_type": "character varying", "udt_name": "varchar"},
+    {"column_name": "price", "data_type": "numeric", "udt_name": "numeric", "numeric_precision": 10, "numeric_scale": 2},
+    {"column_name": "ref", "data_type": "uuid", "udt_name": "uuid"},
+    {"column_name": "geom", "data_type": "USER-DEFINED", "udt_name": "geometry"},
+]
+POINT_WKB = bytes.fromhex("0101000000000000000000f03f0000000000000040")
+BBOX = {"xmin": 1.0, "ymin": 2.0, "xmax": 1.0, "ymax": 2.0}
+
+
+def rows(n):
+    return [
+        {"ogc_fid": i, "name": f"n{i}", "price": Decimal("1.50"), "ref": uuid.UUID(int=i), "geom": POINT_WKB}
+        for i in range(n)
+    ]
+
+
+async def batches(*batches):
+    for batch in batches:
+        yield batch
+
+
+def collect(stream) -> bytes:
+    async def run():
+        return b"".join([chunk async for chunk in stream])
+
+    return asyncio.run(run())
+
+
+def test_arrow_schema():
+    schema = arrow_schema(COLUMNS, bbox=BBOX)
+    assert schema.field("ogc_fid").type == pa.int32()
+    assert schema.field("price").type == pa.decimal128(10, 2)
+    assert schema.field("ref").type == pa.string()
+    assert schema.field("geom").metadata[b"ARROW:extension:name"] == b"geoarrow.wkb"
+    geo = json.loads(schema.metadata[b"geo"])
+    assert geo["primary_column"] == "geom"
+    assert geo["columns"]["geom"]["bbox"] == [1.0, 2.0, 1.0, 2.0]
+
+
+def test_stream_arrow_ipc():
+    schema = arrow_schema(COLUMNS)
+    table = pa.ipc.open_stream(collect(stream_arrow_ipc(schema, batches(rows(3), rows(2))))).read_all()
+    assert table.num_rows == 5
+    assert table.column("ref")[1].as_py() == str(uuid.UUID(int=1))
+    assert table.column("geom")[0].as_py() == POINT_WKB
+
+
+def test_stream_geoparquet_row_groups():
+    schema = arrow_schema(COLUMNS, bbox=BBOX)
+    data = collect(stream_geoparquet(schema, batches(rows(3), rows(3), rows(1)), row_group_size=5))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_rows == 7
+    assert parquet.metadata.num_row_groups == 2
+    assert b"geo" in parquet.schema_arrow.metadata
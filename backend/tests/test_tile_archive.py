@@ -0,0 +1,72 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from object_storage import LocalStorage
+from src.geospatial_mapping import tile_archive
+from src.geospatial_mapping.tile_archive import TileArchiveReader, TileArchiveUnavailable
+
+
+def write_archive(path, tiles: dict[tuple[int, int, int], bytes]):
+    with closing(sqlite3.connect(path)) as mbtiles:
+        mbtiles.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+        mbtiles.executemany(
+            "INSERT INTO tiles VALUES (?, ?, ?, ?)", [(z, x, (2**z - 1) - y, t) for (z, x, y), t in tiles.items()]
+        )
+        mbtiles.commit()
+
+
+def test_tile_archive_reads_local_archive(tmp_path):
+    path = tmp_path / "archive.mbtiles"
+    write_archive(path, {(0, 0, 0): b"root", (1, 1, 0): b"north-east"})
+    reader = TileArchiveReader(cache_dir=str(tmp_path / "cache"), mmap_size=0, max_open=1)
+
+    assert reader.get_tile(f"file://{path}", 0, 0, 0) == b"root"
+    assert reader.get_tile(f"file://{path}", 1, 1, 0) == b"north-east"
+    assert reader.get_tile(f"file://{path}", 1, 0, 1) is None
+
+
+def test_tile_archive_downloads_in_background(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(tile_archive, "get_object_storage", lambda backend: storage)
+    path = tmp_path / "archive.mbtiles"
+    write_archive(path, {(0, 0, 0): b"root"})
+    storage.put_file("geodata", "tiles/archive.mbtiles", str(path))
+    reader = TileArchiveReader(cache_dir=str(tmp_path / "cache"), mmap_size=0, max_open=1)
+    uri = "s3://geodata/tiles/archive.mbtiles"
+
+    # Tiles are rendered live until the download is done
+    with pytest.raises(TileArchiveUnavailable):
+        reader.get_tile(uri, 0, 0, 0)
+    reader._executor.shutdown(wait=True)
+    assert reader.get_tile(uri, 0, 0, 0) == b"root"
+
+    # Closing an archive drops its downloaded copy
+    reader.evict(uri)
+    assert not (tmp_path / "cache" / "geodata" / "tiles" / "archive.mbtiles").exists()
+
+
+def test_tile_archive_closes_least_recently_used(tmp_path):
+    paths = []
+    for name in ("a", "b"):
+        paths.append(tmp_path / f"{name}.mbtiles")
+        write_archive(paths[-1], {(0, 0, 0): name.encode()})
+    reader = TileArchiveReader(cache_dir=str(tmp_path / "cache"), mmap_size=0, max_open=1)
+
+    assert reader.get_tile(f"file://{paths[0]}", 0, 0, 0) == b"a"
+    assert reader.get_tile(f"file://{paths[1]}", 0, 0, 0) == b"b"
+    assert list(reader._archives) == [f"file://{paths[1]}"]
+
+
+def test_tile_archive_remove_deletes_stored_archive(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(tile_archive, "get_object_storage", lambda backend: storage)
+    path = tmp_path / "archive.mbtiles"
+    write_archive(path, {(0, 0, 0): b"root"})
+    storage.put_file("geodata", "tiles/uid/1.mbtiles", str(path))
+    reader = TileArchiveReader(cache_dir=str(tmp_path / "cache"), mmap_size=0, max_open=1)
+
+    reader.remove("s3://geodata/tiles/uid/1.mbtiles")
+    assert not storage.exists("geodata", "tiles/uid/1.mbtiles")
+
+    reader.remove(f"file://{path}")
+    assert not path.exists()
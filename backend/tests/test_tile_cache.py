@@ -0,0 +1,71 @@
+from datetime import datetime
+from src.geospatial_mapping.tile_cache import TileCache
+
+DATASET_UID = "19bea7c2-d17c-47b7-b88a-1fe5133cc1b6"
+UPDATED_AT = datetime(2025, 4, 21, 11, 28, 24)
+
+
+def test_tile_cache_memory_and_disk_tiers(tmp_path):
+    cache = TileCache(memory_max_bytes=8, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT) is None
+
+    cache.set(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT, b"tile-a")
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT) == b"tile-a"
+
+    # second tile pushes the first out of memory, it is then served from disk
+    cache.set(DATASET_UID, "ogc_fid", 1, 1, 0, UPDATED_AT, b"tile-b")
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT) == b"tile-a"
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["memory_evictions"] >= 1
+    assert stats["disk_items"] == 2
+
+
+def test_tile_cache_disk_eviction(tmp_path):
+    cache = TileCache(memory_max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=10)
+    for x in range(4):
+        cache.set(DATASET_UID, "ogc_fid", 2, x, 0, UPDATED_AT, b"tile")
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 10
+    assert stats["disk_evictions"] == 2
+    assert cache.get(DATASET_UID, "ogc_fid", 2, 0, 0, UPDATED_AT) is None
+    assert cache.get(DATASET_UID, "ogc_fid", 2, 3, 0, UPDATED_AT) == b"tile"
+
+
+def test_tile_cache_invalidate(tmp_path):
+    cache = TileCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    cache.set(DATASET_UID, "ogc_fid", 0, 0, 0, UPDATED_AT, b"tile")
+
+    # a newer updated_at never hits the old version
+    assert cache.get(DATASET_UID, "ogc_fid", 0, 0, 0, datetime(2025, 4, 22)) is None
+
+    cache.invalidate(DATASET_UID)
+    assert cache.get(DATASET_UID, "ogc_fid", 0, 0, 0, UPDATED_AT) is None
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_tile_cache_retain_drops_dirty_extent(tmp_path):
+    cache = TileCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    # z1 tiles: x=0 is the western hemisphere, x=1 the eastern one
+    cache.set(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT, b"west")
+    cache.set(DATASET_UID, "ogc_fid", 1, 1, 0, UPDATED_AT, b"east")
+    cache.set(DATASET_UID, "id", 1, 0, 0, UPDATED_AT, b"other")
+
+    updated_at = datetime(2025, 4, 22)
+    cache.retain(
+        DATASET_UID, "ogc_fid", UPDATED_AT, updated_at, dirty_bbox={"xmin": 10, "ymin": 10, "xmax": 20, "ymax": 20}
+    )
+
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 0, 0, updated_at) == b"west"
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 1, 0, updated_at) is None
+    assert cache.get(DATASET_UID, "ogc_fid", 1, 0, 0, UPDATED_AT) is None
+    assert cache.get(DATASET_UID, "id", 1, 0, 0, UPDATED_AT) is None
+
+    # the retained tile was moved on disk as well
+    fresh = TileCache(memory_max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    assert fresh.get(DATASET_UID, "ogc_fid", 1, 0, 0, updated_at) == b"west"
+    assert fresh.stats()["disk_items"] == 1
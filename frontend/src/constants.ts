@@ -5,3 +5,6 @@ export const LOGIN_URL = "/login";
 export const STORAGE_BACKEND = import.meta.env.VITE_STORAGE_BACKEND || "minio";
 export const DEMO_USERNAME = import.meta.env.VITE_DEMO_USERNAME;
 export const DEMO_PASSWORD = import.meta.env.VITE_DEMO_PASSWORD;
+// Preferred upload method of the dataset page: "presigned" (straight to storage), "resumable" (chunks through the
+// API) or "stream" (one request through the API). Another one is used when the upload backend does not support it.
+export const UPLOAD_METHOD = import.meta.env.VITE_UPLOAD_METHOD || "presigned";
@@ -0,0 +1,55 @@
+import type { UploaderFn } from "@/lib/uploader";
+import { api } from "@/lib/api";
+import { UPLOAD_METHOD } from "@/constants";
+import {
+  backendApiUploader,
+  backendFormUploader,
+} from "@/lib/uploader/backend-uploader";
+import { presignedUploader } from "@/lib/uploader/presigned-uploader";
+import { resumableUploader } from "@/lib/uploader/resumable-uploader";
+
+interface UploadCapabilities {
+  backend: string;
+  presigned: boolean;
+  resumable: boolean;
+  stream: boolean;
+}
+
+type UploadMethod = "presigned" | "resumable" | "stream";
+
+const uploaders: Record<UploadMethod, UploaderFn> = {
+  presigned: presignedUploader,
+  resumable: resumableUploader,
+  stream: backendApiUploader,
+};
+
+// Fetched once, the upload backend only changes with a backend restart
+let capabilities: Promise<UploadCapabilities> | null = null;
+
+const getCapabilities = (headers: Record<string, string>) => {
+  if (!capabilities) {
+    capabilities = api
+      .get<UploadCapabilities>("files/uploads/capabilities", { headers })
+      .then((res) => res.data)
+      .catch((error) => {
+        // Asked again on the next upload
+        capabilities = null;
+        throw error;
+      });
+  }
+  return capabilities;
+};
+
+/**
+ * Uploads with `UPLOAD_METHOD` when the upload backend supports it, otherwise with the first method it supports:
+ * presigned, resumable, then streamed through the API. Backends supporting none of them take form uploads.
+ */
+export const autoUploader: UploaderFn = async (files, options = {}) => {
+  const supported = await getCapabilities(options.headers ?? {});
+  const method = [UPLOAD_METHOD, "presigned", "resumable", "stream"].find(
+    (candidate): candidate is UploadMethod =>
+      candidate in uploaders && supported[candidate as UploadMethod],
+  );
+  const uploader = method ? uploaders[method] : backendFormUploader;
+  return uploader(files, options);
+};
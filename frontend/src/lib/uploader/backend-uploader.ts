@@ -7,6 +7,35 @@ export const backendApiUploader: UploaderFn = async (
 ) => {
   const uploaded: UploadedFile[] = [];
 
+  for (const file of files) {
+    // The raw file is sent as the body, the backend relays it to storage as it arrives
+    const res = await api.post<UploadedFile>("files/upload/stream", file, {
+      params: { filename: file.name },
+      headers: {
+        "Content-Type": "application/octet-stream",
+        ...headers,
+      },
+      onUploadProgress: (e) => {
+        if (e.total) {
+          const progress = (e.loaded / e.total) * 100;
+          onProgress?.(file, progress);
+        }
+      },
+    });
+
+    uploaded.push(res.data);
+  }
+
+  return uploaded;
+};
+
+// Form upload to /files/upload, the only method of upload backends that take no streamed body such as UploadThing
+export const backendFormUploader: UploaderFn = async (
+  files,
+  { headers = {}, onProgress } = {},
+) => {
+  const uploaded: UploadedFile[] = [];
+
   for (const file of files) {
     const form = new FormData();
     form.append("files", file);
@@ -0,0 +1,84 @@
+import axios from "axios";
+import type { UploadedFile, UploaderFn } from "@/lib/uploader";
+import { api } from "@/lib/api";
+
+// Parts of one file sent at once
+const MAX_CONCURRENT_PARTS = 4;
+
+interface MultipartUpload {
+  uid: string;
+  key: string;
+  upload_id: string;
+  part_size: number;
+  parts: { part_number: number; url: string }[];
+}
+
+/**
+ * Uploads every file straight to object storage: the backend only hands out presigned part URLs and checks the
+ * parts once they are all stored. The bucket CORS policy must expose the `ETag` header.
+ */
+export const presignedUploader: UploaderFn = async (
+  files,
+  { headers = {}, onProgress } = {},
+) => {
+  const uploaded: UploadedFile[] = [];
+
+  for (const file of files) {
+    const { data: upload } = await api.post<MultipartUpload>(
+      "files/uploads/multipart",
+      { filename: file.name, size: file.size },
+      { headers },
+    );
+
+    const loaded = new Map<number, number>();
+    const reportProgress = () => {
+      const total = [...loaded.values()].reduce((sum, bytes) => sum + bytes, 0);
+      onProgress?.(file, file.size ? (total / file.size) * 100 : 100);
+    };
+
+    const uploadPart = async ({ part_number, url }: MultipartUpload["parts"][number]) => {
+      const start = (part_number - 1) * upload.part_size;
+      // Presigned URLs carry their own signature, no API headers are sent along
+      const res = await axios.put(url, file.slice(start, start + upload.part_size), {
+        onUploadProgress: (e) => {
+          loaded.set(part_number, e.loaded);
+          reportProgress();
+        },
+      });
+      return { part_number, etag: res.headers["etag"] as string };
+    };
+
+    try {
+      const queue = [...upload.parts];
+      const completed: { part_number: number; etag: string }[] = [];
+      await Promise.all(
+        Array.from({ length: Math.min(MAX_CONCURRENT_PARTS, queue.length) }, async () => {
+          for (let part = queue.shift(); part; part = queue.shift()) {
+            completed.push(await uploadPart(part));
+          }
+        }),
+      );
+
+      const res = await api.post<UploadedFile>(
+        "files/uploads/multipart/complete",
+        {
+          uid: upload.uid,
+          filename: file.name,
+          size: file.size,
+          key: upload.key,
+          upload_id: upload.upload_id,
+          parts: completed,
+        },
+        { headers },
+      );
+      uploaded.push(res.data);
+    } catch (error) {
+      await api
+        .post("files/uploads/multipart/abort", { key: upload.key, upload_id: upload.upload_id }, { headers })
+        .catch(() => undefined);
+      throw error;
+    }
+  }
+
+  return uploaded;
+};
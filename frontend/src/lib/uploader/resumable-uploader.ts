@@ -0,0 +1,92 @@
+import axios from "axios";
+import type { UploadedFile, UploaderFn } from "@/lib/uploader";
+import { api } from "@/lib/api";
+
+// Attempts at a chunk before the upload fails, the wait doubles after each one
+const MAX_CHUNK_ATTEMPTS = 5;
+const RETRY_DELAY_MS = 1000;
+
+interface ResumableUpload {
+  key: string;
+  chunk_size: number;
+  offset: number;
+}
+
+// Uploads are picked up again after a page reload when the same file is chosen
+const storageKey = (file: File) =>
+  `resumable-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function getOffset(key: string, headers: Record<string, string>) {
+  const res = await api.head(`files/uploads/resumable/${key}`, { headers });
+  return Number(res.headers["upload-offset"]);
+}
+
+async function startUpload(file: File, headers: Record<string, string>): Promise<ResumableUpload> {
+  const saved = localStorage.getItem(storageKey(file));
+  if (saved) {
+    const upload: ResumableUpload = JSON.parse(saved);
+    try {
+      return { ...upload, offset: await getOffset(upload.key, headers) };
+    } catch (error) {
+      // The upload was completed or aborted, start over
+      if (!axios.isAxiosError(error) || error.response?.status !== 404) throw error;
+    }
+  }
+  const { data: upload } = await api.post<ResumableUpload>(
+    "files/uploads/resumable",
+    { filename: file.name, size: file.size },
+    { headers },
+  );
+  localStorage.setItem(storageKey(file), JSON.stringify(upload));
+  return upload;
+}
+
+/**
+ * Sends every file in chunks the backend stores as they arrive. A chunk that fails is sent again from the offset the
+ * backend reports, so a dropped connection costs at most one chunk.
+ */
+export const resumableUploader: UploaderFn = async (
+  files,
+  { headers = {}, onProgress } = {},
+) => {
+  const uploaded: UploadedFile[] = [];
+
+  for (const file of files) {
+    const upload = await startUpload(file, headers);
+    let offset = upload.offset;
+    let attempt = 0;
+
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + upload.chunk_size);
+      try {
+        const res = await api.patch(`files/uploads/resumable/${upload.key}`, chunk, {
+          headers: {
+            "Content-Type": "application/offset+octet-stream",
+            "Upload-Offset": String(offset),
+            ...headers,
+          },
+          onUploadProgress: (e) => onProgress?.(file, ((offset + e.loaded) / file.size) * 100),
+        });
+        offset = Number(res.headers["upload-offset"]);
+        attempt = 0;
+      } catch (error) {
+        if (++attempt >= MAX_CHUNK_ATTEMPTS) throw error;
+        await sleep(RETRY_DELAY_MS * 2 ** (attempt - 1));
+        offset = await getOffset(upload.key, headers);
+      }
+    }
+
+    const res = await api.post<UploadedFile>(
+      `files/uploads/resumable/${upload.key}/complete`,
+      null,
+      { headers },
+    );
+    localStorage.removeItem(storageKey(file));
+    onProgress?.(file, 100);
+    uploaded.push(res.data);
+  }
+
+  return uploaded;
+};
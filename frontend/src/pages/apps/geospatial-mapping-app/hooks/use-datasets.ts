@@ -20,6 +20,10 @@ export interface Dataset {
   status: "uploaded" | "processing" | "ready" | "failed";
   bbox: BBox;
   primary_key_column: string;
+  progress?: number | null;
+  content_hash?: string | null;
+  layer_name?: string | null;
+  parent_uid?: string | null;
   created_at?: string;
   updated_at?: string;
 }
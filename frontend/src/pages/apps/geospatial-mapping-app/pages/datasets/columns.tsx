@@ -19,6 +19,10 @@ export const columns: ColumnDef<Dataset>[] = [
   {
     accessorKey: "status",
     header: "Status",
+    cell: ({ row }) => {
+      const { status, progress } = row.original;
+      return status === "processing" && progress != null ? `${status} (${progress}%)` : status;
+    },
   },
   {
     accessorKey: "updated_at",
@@ -13,7 +13,7 @@ import {
 } from "@/components/ui/dialog";
 import { STORAGE_BACKEND } from "@/constants";
 import { useUploadFile } from "@/hooks/use-upload-file";
-import { backendApiUploader } from "@/lib/uploader/backend-uploader";
+import { autoUploader } from "@/lib/uploader/auto-uploader";
 import { UploadProvider } from "@/lib/uploader/context";
 import { GeospatialMappingAppSidebar } from "@/pages/apps/geospatial-mapping-app/components/app-sidebar";
 import {
@@ -25,7 +25,7 @@ import { columns } from "./columns";
 
 export default function Page() {
   return (
-    <UploadProvider uploader={backendApiUploader}>
+    <UploadProvider uploader={autoUploader}>
       <PageContent />
     </UploadProvider>
   );
@@ -58,7 +58,7 @@ function PageContent() {
           account_id: user.account_id,
           file_name: item.name,
           status: "uploaded" as const,
-          storage_backend: STORAGE_BACKEND,
+          storage_backend: item.storage_backend ?? STORAGE_BACKEND,
           storage_uri: item.storage_uri,
         };
 
@@ -0,0 +1,694 @@
+"""
+Object storage shared by the backend and the temporal worker.
+
+Both services install this package as a path dependency and build their storages from their own settings. It depends
+on the MinIO SDK only, which speaks to AWS S3 as well.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Iterator
+from urllib.parse import unquote, urlparse
+import urllib3
+from minio import Minio
+from minio.credentials import ChainedProvider, EnvAWSProvider, IamAwsProvider
+from minio.datatypes import Part
+from minio.error import S3Error
+
+CHUNK_SIZE = 1024 * 1024
+# Read-ahead of seekable readers, large enough to read a zip central directory in a few requests
+SEEKABLE_BUFFER_SIZE = 256 * 1024
+# Part size of uploads of unknown length
+PUT_PART_SIZE = 16 * 1024 * 1024
+
+
+@dataclass
+class ObjectInfo:
+    size: int
+    etag: str | None = None
+    content_type: str | None = None
+
+
+@dataclass
+class PartInfo:
+    """Stored part of a multipart upload, ETags are unquoted."""
+
+    part_number: int
+    etag: str
+    size: int | None = None
+
+
+@dataclass
+class MultipartUploadInfo:
+    key: str
+    upload_id: str
+    initiated: datetime | None = None
+
+
+def parse_uri(uri: str) -> tuple[str, str]:
+    """
+    Bucket and key of a `s3://<bucket>/<key>` or `local://<bucket>/<key>` uri, the `<bucket>.s3.amazonaws.com` host
+    form included.
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme not in ("s3", "local"):
+        raise ValueError(f"Unsupported object uri {uri}")
+    bucket = parsed.netloc.split(".s3.amazonaws.com")[0]
+    return bucket, unquote(parsed.path.lstrip("/"))
+
+
+class ObjectStorage:
+    """
+    Blocking storage primitives, safe to call from any thread. `AsyncObjectStorage` runs them off the event loop.
+
+    Bucket existence is checked once per bucket and remembered. Missing objects raise `FileNotFoundError` whatever
+    the backend.
+    """
+
+    def __init__(self):
+        self._buckets: set[str] = set()
+        self._lock = threading.Lock()
+
+    def ensure_bucket(self, bucket: str):
+        if bucket in self._buckets:
+            return
+        with self._lock:
+            if bucket not in self._buckets:
+                self._ensure_bucket(bucket)
+                self._buckets.add(bucket)
+
+    def stream(
+        self, bucket: str, key: str, offset: int = 0, length: int | None = None, chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Yield the object from `offset`, `length` bytes or up to its end, in chunks of at most `chunk_size`."""
+        reader = self.open(bucket, key, offset, length)
+        try:
+            while chunk := reader.read(chunk_size):
+                yield chunk
+        finally:
+            reader.close()
+
+    def read_range(self, bucket: str, key: str, offset: int, length: int) -> bytes:
+        return b"".join(self.stream(bucket, key, offset, length))
+
+    def open_seekable(self, bucket: str, key: str) -> BinaryIO:
+        """Seekable file object over the object, every read past the buffer is a range request."""
+        return io.BufferedReader(
+            _RangeReader(self, bucket, key, self.stat(bucket, key).size), buffer_size=SEEKABLE_BUFFER_SIZE
+        )
+
+    def put(self, bucket: str, key: str, data: bytes | BinaryIO, length: int = -1, content_type: str | None = None):
+        """Store `data`, a file object of unknown `length` is read until it is exhausted."""
+        if isinstance(data, bytes):
+            data, length = _BytesReader(data), len(data)
+        self.ensure_bucket(bucket)
+        self._put(bucket, key, data, length, content_type or "application/octet-stream")
+
+    def put_file(self, bucket: str, key: str, path: str, content_type: str | None = None):
+        with open(path, "rb") as f:
+            self.put(bucket, key, f, os.path.getsize(path), content_type)
+
+    def get_file(self, bucket: str, key: str, path: str):
+        """Download the object to `path`, written in place only once complete."""
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in self.stream(bucket, key):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def exists(self, bucket: str, key: str) -> bool:
+        try:
+            self.stat(bucket, key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def uri(self, bucket: str, key: str) -> str:
+        return f"s3://{bucket}/{key}"
+
+    def stat(self, bucket: str, key: str) -> ObjectInfo:
+        raise NotImplementedError
+
+    def open(self, bucket: str, key: str, offset: int = 0, length: int | None = None) -> BinaryIO:
+        """Readable file object over the object from `offset`, close it once done."""
+        raise NotImplementedError
+
+    def delete(self, bucket: str, key: str):
+        raise NotImplementedError
+
+    # Multipart uploads, the object is assembled from parts sent separately, in any order and from anywhere
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        """Start a multipart upload, returns its upload id."""
+        raise NotImplementedError
+
+    def upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """Store a part numbered from 1, returns its ETag."""
+        raise NotImplementedError
+
+    def list_parts(self, bucket: str, key: str, upload_id: str) -> list[PartInfo]:
+        """Parts stored so far, by part number."""
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts: list[PartInfo]):
+        """Assemble the object from `parts` in the given order."""
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str):
+        raise NotImplementedError
+
+    def list_multipart_uploads(self, bucket: str, prefix: str) -> list[MultipartUploadInfo]:
+        """Pending uploads of the keys starting with `prefix`."""
+        raise NotImplementedError
+
+    def presign_upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, expires: int) -> str:
+        """URL a client PUTs a part to directly for `expires` seconds, without credentials of its own."""
+        raise NotImplementedError
+
+    def _ensure_bucket(self, bucket: str):
+        raise NotImplementedError
+
+    def _put(self, bucket: str, key: str, data: BinaryIO, length: int, content_type: str):
+        raise NotImplementedError
+
+
+class MinioStorage(ObjectStorage):
+    """MinIO through a pooled client, `max_connections` requests run at once."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+        secure: bool = False,
+        region: str | None = None,
+        max_connections: int = 10,
+        public_endpoint: str | None = None,
+    ):
+        super().__init__()
+        http_client = urllib3.PoolManager(
+            maxsize=max_connections,
+            block=True,
+            timeout=urllib3.Timeout(connect=10, read=300),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+        self.client = Minio(
+            endpoint,
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=secure,
+            region=region,
+            http_client=http_client,
+            # Credentials of the environment or the instance role when no keys are given
+            credentials=None if access_key else ChainedProvider([EnvAWSProvider(), IamAwsProvider()]),
+        )
+        # Presigned URLs are signed for the host clients send them to. Signing is local, the region is given so that
+        # it does not look the bucket location up.
+        self.presign_client = (
+            Minio(
+                public_endpoint,
+                access_key=access_key,
+                secret_key=secret_key,
+                secure=secure,
+                region=region or "us-east-1",
+                credentials=None if access_key else ChainedProvider([EnvAWSProvider(), IamAwsProvider()]),
+            )
+            if public_endpoint
+            else self.client
+        )
+
+    def stat(self, bucket: str, key: str) -> ObjectInfo:
+        try:
+            info = self.client.stat_object(bucket, key)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                raise FileNotFoundError(self.uri(bucket, key)) from e
+            raise
+        return ObjectInfo(size=info.size, etag=info.etag, content_type=info.content_type)
+
+    def open(self, bucket: str, key: str, offset: int = 0, length: int | None = None) -> BinaryIO:
+        try:
+            response = self.client.get_object(bucket, key, offset=offset, length=length or 0)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                raise FileNotFoundError(self.uri(bucket, key)) from e
+            raise
+        return _ResponseReader(response)
+
+    def delete(self, bucket: str, key: str):
+        self.client.remove_object(bucket, key)
+
+    # The SDK only exposes multipart uploads through put_object, these are its S3 API calls
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        return self.client._create_multipart_upload(bucket, key, {})
+
+    def upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.client._upload_part(bucket, key, data, None, upload_id, part_number).strip('"')
+
+    def list_parts(self, bucket: str, key: str, upload_id: str) -> list[PartInfo]:
+        parts, marker = [], None
+        while True:
+            result = self.client._list_parts(bucket, key, upload_id, part_number_marker=marker)
+            parts += [PartInfo(part.part_number, part.etag, part.size) for part in result.parts]
+            if not result.is_truncated:
+                return parts
+            marker = result.next_part_number_marker
+
+    def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts: list[PartInfo]):
+        self.client._complete_multipart_upload(
+            bucket, key, upload_id, [Part(part.part_number, part.etag) for part in parts]
+        )
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str):
+        self.client._abort_multipart_upload(bucket, key, upload_id)
+
+    def list_multipart_uploads(self, bucket: str, prefix: str) -> list[MultipartUploadInfo]:
+        uploads, key_marker, upload_id_marker = [], None, None
+        while True:
+            result = self.client._list_multipart_uploads(
+                bucket, prefix=prefix, key_marker=key_marker, upload_id_marker=upload_id_marker
+            )
+            uploads += [MultipartUploadInfo(u.object_name, u.upload_id, u.initiated_time) for u in result.uploads]
+            if not result.is_truncated or not result.uploads:
+                return uploads
+            key_marker, upload_id_marker = result.uploads[-1].object_name, result.uploads[-1].upload_id
+
+    def presign_upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, expires: int) -> str:
+        return self.presign_client.get_presigned_url(
+            "PUT",
+            bucket,
+            key,
+            expires=timedelta(seconds=expires),
+            extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)},
+        )
+
+    def _ensure_bucket(self, bucket: str):
+        if not self.client.bucket_exists(bucket):
+            self.client.make_bucket(bucket)
+
+    def _put(self, bucket: str, key: str, data: BinaryIO, length: int, content_type: str):
+        self.client.put_object(
+            bucket, key, data, length, content_type=content_type, part_size=PUT_PART_SIZE if length < 0 else 0
+        )
+
+
+class S3Storage(MinioStorage):
+    """AWS S3, buckets are created out of band and never checked."""
+
+    def __init__(self, region: str | None = None, access_key: str | None = None, secret_key: str | None = None, **kw):
+        super().__init__("s3.amazonaws.com", access_key, secret_key, secure=True, region=region, **kw)
+
+    def _ensure_bucket(self, bucket: str):
+        pass
+
+
+class LocalStorage(ObjectStorage):
+    """
+    Buckets are directories under `root`, for development and tests without a network. Objects are written to a
+    temporary file first, a reader never sees one half written. Uris are relative to the root, services sharing the
+    directory may mount it anywhere.
+    """
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = os.path.abspath(root)
+
+    def path(self, bucket: str, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise ValueError(f"Invalid object key {key}")
+        return path
+
+    def uri(self, bucket: str, key: str) -> str:
+        return f"local://{bucket}/{key}"
+
+    def stat(self, bucket: str, key: str) -> ObjectInfo:
+        return ObjectInfo(size=os.path.getsize(self.path(bucket, key)))
+
+    def open(self, bucket: str, key: str, offset: int = 0, length: int | None = None) -> BinaryIO:
+        f = open(self.path(bucket, key), "rb")
+        f.seek(offset)
+        return f if length is None else _LimitedReader(f, length)
+
+    def delete(self, bucket: str, key: str):
+        try:
+            os.remove(self.path(bucket, key))
+        except FileNotFoundError:
+            pass
+
+    def open_seekable(self, bucket: str, key: str) -> BinaryIO:
+        return open(self.path(bucket, key), "rb")
+
+    # Parts of a pending upload are files of `<bucket>/.multipart/<upload id>`, next to the key they are assembled to
+
+    def _upload_path(self, bucket: str, upload_id: str) -> str:
+        if not _LOCAL_UPLOAD_ID_PATTERN.match(upload_id):
+            raise FileNotFoundError(f"Unknown upload {upload_id}")
+        return os.path.join(self.root, bucket, ".multipart", upload_id)
+
+    def _upload_key(self, bucket: str, upload_id: str) -> str:
+        with open(os.path.join(self._upload_path(bucket, upload_id), "key")) as f:
+            return f.read()
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        self.path(bucket, key)
+        upload_id = uuid.uuid4().hex
+        upload_path = self._upload_path(bucket, upload_id)
+        os.makedirs(upload_path)
+        with open(os.path.join(upload_path, "key"), "w") as f:
+            f.write(key)
+        return upload_id
+
+    def upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        if self._upload_key(bucket, upload_id) != key:
+            raise FileNotFoundError(f"Unknown upload {upload_id}")
+        upload_path = self._upload_path(bucket, upload_id)
+        fd, tmp_path = tempfile.mkstemp(dir=upload_path, prefix=".part-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(upload_path, str(part_number)))
+        return hashlib.md5(data).hexdigest()
+
+    def list_parts(self, bucket: str, key: str, upload_id: str) -> list[PartInfo]:
+        if self._upload_key(bucket, upload_id) != key:
+            raise FileNotFoundError(f"Unknown upload {upload_id}")
+        upload_path = self._upload_path(bucket, upload_id)
+        parts = []
+        for name in sorted((name for name in os.listdir(upload_path) if name.isdigit()), key=int):
+            with open(os.path.join(upload_path, name), "rb") as f:
+                data = f.read()
+            parts.append(PartInfo(int(name), hashlib.md5(data).hexdigest(), len(data)))
+        return parts
+
+    def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts: list[PartInfo]):
+        stored = {part.part_number: part for part in self.list_parts(bucket, key, upload_id)}
+        for part in parts:
+            if part.part_number not in stored or stored[part.part_number].etag != part.etag.strip('"'):
+                raise ValueError(f"Part {part.part_number} does not match the stored part")
+        upload_path = self._upload_path(bucket, upload_id)
+        readers = [open(os.path.join(upload_path, str(part.part_number)), "rb") for part in parts]
+        try:
+            self.put(bucket, key, _ConcatReader(readers))
+        finally:
+            for reader in readers:
+                reader.close()
+        shutil.rmtree(upload_path)
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str):
+        if self._upload_key(bucket, upload_id) != key:
+            raise FileNotFoundError(f"Unknown upload {upload_id}")
+        shutil.rmtree(self._upload_path(bucket, upload_id))
+
+    def list_multipart_uploads(self, bucket: str, prefix: str) -> list[MultipartUploadInfo]:
+        uploads_path = os.path.join(self.root, bucket, ".multipart")
+        uploads = []
+        for upload_id in os.listdir(uploads_path) if os.path.isdir(uploads_path) else []:
+            try:
+                key = self._upload_key(bucket, upload_id)
+                initiated = datetime.fromtimestamp(os.path.getmtime(self._upload_path(bucket, upload_id)), timezone.utc)
+            except FileNotFoundError:
+                continue
+            if key.startswith(prefix):
+                uploads.append(MultipartUploadInfo(key, upload_id, initiated))
+        return uploads
+
+    def get_file(self, bucket: str, key: str, path: str):
+        shutil.copyfile(self.path(bucket, key), path)
+
+    def _ensure_bucket(self, bucket: str):
+        os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+
+    def _put(self, bucket: str, key: str, data: BinaryIO, length: int, content_type: str):
+        path = self.path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".put-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+_LOCAL_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class AsyncObjectStorage:
+    """
+    Awaitable primitives of a storage. Calls run on the default thread pool and share the pooled client of the
+    storage, the event loop never waits on I/O.
+    """
+
+    def __init__(self, storage: ObjectStorage):
+        self.storage = storage
+
+    async def ensure_bucket(self, bucket: str):
+        if bucket not in self.storage._buckets:
+            await asyncio.to_thread(self.storage.ensure_bucket, bucket)
+
+    async def stat(self, bucket: str, key: str) -> ObjectInfo:
+        return await asyncio.to_thread(self.storage.stat, bucket, key)
+
+    async def exists(self, bucket: str, key: str) -> bool:
+        return await asyncio.to_thread(self.storage.exists, bucket, key)
+
+    async def read_range(self, bucket: str, key: str, offset: int, length: int) -> bytes:
+        return await asyncio.to_thread(self.storage.read_range, bucket, key, offset, length)
+
+    async def stream(
+        self, bucket: str, key: str, offset: int = 0, length: int | None = None, chunk_size: int = CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        reader = await asyncio.to_thread(self.storage.open, bucket, key, offset, length)
+        try:
+            while chunk := await asyncio.to_thread(reader.read, chunk_size):
+                yield chunk
+        finally:
+            await asyncio.to_thread(reader.close)
+
+    async def put(self, bucket: str, key: str, data: bytes, content_type: str | None = None):
+        await asyncio.to_thread(self.storage.put, bucket, key, data, len(data), content_type)
+
+    async def put_stream(
+        self, bucket: str, key: str, chunks: AsyncIterable[bytes], content_type: str | None = None, max_queued: int = 4
+    ):
+        """
+        Store `chunks` as they arrive. A thread writes them to storage while the next ones are received, at most
+        `max_queued` chunks wait in memory. Nothing is stored when receiving fails.
+        """
+        reader = _QueueReader(max_queued)
+        writer = asyncio.ensure_future(asyncio.to_thread(self.storage.put, bucket, key, reader, -1, content_type))
+        try:
+            async for chunk in chunks:
+                if not await asyncio.to_thread(reader.feed, chunk, writer.done):
+                    break
+            await asyncio.to_thread(reader.feed, None, writer.done)
+        except BaseException:
+            reader.abort()
+            await asyncio.gather(writer, return_exceptions=True)
+            raise
+        await writer
+
+    async def delete(self, bucket: str, key: str):
+        await asyncio.to_thread(self.storage.delete, bucket, key)
+
+    async def create_multipart_upload(self, bucket: str, key: str) -> str:
+        return await asyncio.to_thread(self.storage.create_multipart_upload, bucket, key)
+
+    async def upload_part(self, bucket: str, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return await asyncio.to_thread(self.storage.upload_part, bucket, key, upload_id, part_number, data)
+
+    async def list_parts(self, bucket: str, key: str, upload_id: str) -> list[PartInfo]:
+        return await asyncio.to_thread(self.storage.list_parts, bucket, key, upload_id)
+
+    async def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts: list[PartInfo]):
+        await asyncio.to_thread(self.storage.complete_multipart_upload, bucket, key, upload_id, parts)
+
+    async def abort_multipart_upload(self, bucket: str, key: str, upload_id: str):
+        await asyncio.to_thread(self.storage.abort_multipart_upload, bucket, key, upload_id)
+
+    async def list_multipart_uploads(self, bucket: str, prefix: str) -> list[MultipartUploadInfo]:
+        return await asyncio.to_thread(self.storage.list_multipart_uploads, bucket, prefix)
+
+    async def presign_upload_parts(
+        self, bucket: str, key: str, upload_id: str, part_numbers: list[int], expires: int
+    ) -> list[str]:
+        def presign():
+            return [
+                self.storage.presign_upload_part(bucket, key, upload_id, part_number, expires)
+                for part_number in part_numbers
+            ]
+
+        return await asyncio.to_thread(presign)
+
+
+class _BytesReader:
+    def __init__(self, data: bytes):
+        self._view = memoryview(data)
+        self._position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        chunk = bytes(self._view[self._position : end])
+        self._position += len(chunk)
+        return chunk
+
+
+class _ResponseReader:
+    """urllib3 response returning its connection to the pool on close."""
+
+    def __init__(self, response):
+        self._response = response
+
+    def read(self, size: int = -1) -> bytes:
+        return self._response.read(None if size < 0 else size)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    @property
+    def closed(self) -> bool:
+        return self._response.closed
+
+    def close(self):
+        self._response.close()
+        self._response.release_conn()
+
+
+class _RangeReader(io.RawIOBase):
+    def __init__(self, storage: ObjectStorage, bucket: str, key: str, size: int):
+        self._storage = storage
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self._size - self._position)
+        if length <= 0:
+            return 0
+        data = self._storage.read_range(self._bucket, self._key, self._position, length)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class _LimitedReader:
+    def __init__(self, f: BinaryIO, length: int):
+        self._f = f
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        chunk = self._f.read(size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    @property
+    def closed(self) -> bool:
+        return self._f.closed
+
+    def close(self):
+        self._f.close()
+
+
+class _ConcatReader:
+    """Readers read one after the other."""
+
+    def __init__(self, readers: list[BinaryIO]):
+        self._readers = list(readers)
+
+    def read(self, size: int = -1) -> bytes:
+        while self._readers:
+            chunk = self._readers[0].read(size)
+            if chunk:
+                return chunk
+            self._readers.pop(0)
+        return b""
+
+
+class _QueueReader:
+    """File object read by a storage `put` on one thread, fed chunks from another."""
+
+    def __init__(self, max_queued: int):
+        self._queue: queue.Queue = queue.Queue(max_queued)
+        self._buffer = bytearray()
+        self._eof = False
+        self._aborted = threading.Event()
+
+    def feed(self, chunk: bytes | None, writer_done) -> bool:
+        """Queue a chunk, None ends the object. False when the writer stopped reading."""
+        while not writer_done():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def abort(self):
+        self._aborted.set()
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._aborted.is_set():
+                    raise IOError("Upload aborted")
+                continue
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size is None or size < 0:
+            size = len(self._buffer)
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
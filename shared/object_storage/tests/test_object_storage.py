@@ -0,0 +1,108 @@
+import asyncio
+import io
+import pytest
+from object_storage import (
+    SEEKABLE_BUFFER_SIZE,
+    AsyncObjectStorage,
+    LocalStorage,
+    ObjectStorage,
+    PartInfo,
+    parse_uri,
+)
+
+
+async def iter_chunks(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        yield data[i : i + chunk_size]
+
+
+def test_local_storage_read_range_and_stream(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    data = bytes(range(256)) * 100
+    storage.put("bucket", "a/b.bin", data)
+
+    assert storage.stat("bucket", "a/b.bin").size == len(data)
+    assert storage.read_range("bucket", "a/b.bin", 1000, 10) == data[1000:1010]
+    assert b"".join(storage.stream("bucket", "a/b.bin", offset=500, chunk_size=7)) == data[500:]
+    assert storage.uri("bucket", "a/b.bin") == "local://bucket/a/b.bin"
+    assert storage.path("bucket", "a/b.bin") == f"{tmp_path}/bucket/a/b.bin"
+
+    storage.delete("bucket", "a/b.bin")
+    assert not storage.exists("bucket", "a/b.bin")
+    with pytest.raises(FileNotFoundError):
+        storage.read_range("bucket", "a/b.bin", 0, 1)
+    with pytest.raises(ValueError):
+        storage.put("bucket", "../escape", b"x")
+
+
+def test_put_stream(tmp_path):
+    storage = AsyncObjectStorage(LocalStorage(str(tmp_path)))
+    data = b"0123456789" * 10000
+
+    asyncio.run(storage.put_stream("bucket", "key", iter_chunks(data, 333), max_queued=2))
+
+    assert asyncio.run(storage.read_range("bucket", "key", 0, len(data))) == data
+
+
+def test_put_stream_stores_nothing_on_failure(tmp_path):
+    storage = AsyncObjectStorage(LocalStorage(str(tmp_path)))
+
+    async def failing():
+        yield b"partial"
+        raise ConnectionError("client went away")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(storage.put_stream("bucket", "key", failing()))
+    assert not storage.storage.exists("bucket", "key")
+    assert list((tmp_path / "bucket").iterdir()) == []
+
+
+def test_bucket_existence_is_cached(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    calls = []
+    storage._ensure_bucket = calls.append
+    storage.ensure_bucket("bucket")
+    storage.ensure_bucket("bucket")
+    assert calls == ["bucket"]
+
+
+def test_parse_uri():
+    assert parse_uri("s3://uploads/a/b.gpkg") == ("uploads", "a/b.gpkg")
+    assert parse_uri("s3://bucket.s3.amazonaws.com/uploads/x.csv") == ("bucket", "uploads/x.csv")
+    assert parse_uri("local://uploads/x.csv") == ("uploads", "x.csv")
+
+
+def test_open_seekable_reads_ranges(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    data = bytes(range(256)) * 4000
+    storage.put("bucket", "key", data)
+    reads = []
+    read_range = storage.read_range
+    storage.read_range = lambda *args: reads.append(args) or read_range(*args)
+
+    # The range reader of remote storages, over the local one
+    with ObjectStorage.open_seekable(storage, "bucket", "key") as f:
+        f.seek(-100, io.SEEK_END)
+        assert f.read() == data[-100:]
+        f.seek(5000)
+        assert f.read(10) == data[5000:5010]
+    assert all(length <= SEEKABLE_BUFFER_SIZE for _, _, _, length in reads)
+
+
+def test_local_storage_multipart_upload(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    upload_id = storage.create_multipart_upload("bucket", "a/b.bin")
+    second = storage.upload_part("bucket", "a/b.bin", upload_id, 2, b"world")
+    first = storage.upload_part("bucket", "a/b.bin", upload_id, 1, b"hello ")
+
+    assert [(u.key, u.upload_id) for u in storage.list_multipart_uploads("bucket", "a/")] == [("a/b.bin", upload_id)]
+    assert storage.list_parts("bucket", "a/b.bin", upload_id) == [PartInfo(1, first, 6), PartInfo(2, second, 5)]
+    with pytest.raises(FileNotFoundError):
+        storage.list_parts("bucket", "other", upload_id)
+
+    storage.complete_multipart_upload("bucket", "a/b.bin", upload_id, [PartInfo(1, first), PartInfo(2, second)])
+    assert storage.read_range("bucket", "a/b.bin", 0, 11) == b"hello world"
+    assert storage.list_multipart_uploads("bucket", "") == []
+    with pytest.raises(FileNotFoundError):
+        storage.upload_part("bucket", "a/b.bin", "../../escape", 1, b"x")
+
@@ -1,11 +1,17 @@
 import asyncio
 import logging
+import multiprocessing
 import os
 import signal
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import URL, Engine, create_engine
 from temporalio.client import Client
 from temporalio.contrib.pydantic import pydantic_data_converter
-from temporalio.worker import Worker
+from temporalio.worker import SharedStateManager, Worker
+from object_storage import LocalStorage, MinioStorage, ObjectStorage, S3Storage
 
 
 logging.basicConfig(
@@ -24,6 +30,19 @@ class Settings(BaseSettings):
     TEMPORAL_ADDRESS: str = "localhost:7233"
     BACKEND_API_BASE_URL: str = "http://localhost:8000"
     BACKEND_API_KEY: str = "changeme"
+    # Activities run at once on the task queue, sync activities get one thread each
+    WORKER_MAX_CONCURRENT_ACTIVITIES: int = 8
+    # Processes of the CPU task queue, 0 means one per CPU
+    WORKER_CPU_ACTIVITY_PROCESSES: int = 0
+    # Connection pools shared by the activities of a worker process
+    WORKER_DB_POOL_SIZE: int = 5
+    WORKER_DB_MAX_OVERFLOW: int = 10
+    WORKER_HTTP_MAX_CONNECTIONS: int = 20
+    WORKER_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    WORKER_HTTP_TIMEOUT: float = 30.0
+    WORKER_STORAGE_MAX_CONNECTIONS: int = 20
+    # Root directory of the local storage backend, shared with the backend
+    STORAGE_LOCAL_ROOT: str = "./data/storage"
 
 
 class MinioSettings(BaseSettings):
@@ -57,21 +76,148 @@ minio_settings = MinioSettings()
 postgis_settings = PostgisSettings()
 
 
+class WorkerResources:
+    """
+    PostGIS engine, backend HTTP client and object storages shared by the activities of a worker process.
+
+    All are created on first use and keep their connections pooled. A process forked from the worker (the CPU
+    activity pool) starts its own pools instead of sharing the parent connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._engine: Engine | None = None
+        self._http_client: httpx.Client | None = None
+        self._storages: dict[str, ObjectStorage] = {}
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            if self._engine is not None:
+                # Leave the parent connections alone, only forget them
+                self._engine.dispose(close=False)
+            self._pid = os.getpid()
+            self._engine = None
+            self._http_client = None
+            self._storages = {}
+
+    @property
+    def engine(self) -> Engine:
+        with self._lock:
+            self._check_fork()
+            if self._engine is None:
+                db_url = URL.create(
+                    drivername="postgresql+psycopg2",
+                    username=postgis_settings.POSTGIS_USER,
+                    password=postgis_settings.POSTGIS_PASSWORD,
+                    host=postgis_settings.POSTGIS_HOST,
+                    port=postgis_settings.POSTGIS_PORT,
+                    database=postgis_settings.POSTGIS_DB,
+                )
+                self._engine = create_engine(
+                    db_url,
+                    pool_size=settings.WORKER_DB_POOL_SIZE,
+                    max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+                    pool_pre_ping=True,
+                )
+            return self._engine
+
+    @property
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            self._check_fork()
+            if self._http_client is None:
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings.WORKER_HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.WORKER_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    ),
+                    timeout=settings.WORKER_HTTP_TIMEOUT,
+                )
+            return self._http_client
+
+    def storage(self, backend: str) -> ObjectStorage:
+        """Storage of a `storage_backend`."""
+        with self._lock:
+            self._check_fork()
+            if backend not in self._storages:
+                if backend == "minio":
+                    self._storages[backend] = MinioStorage(
+                        minio_settings.MINIO_ENDPOINT,
+                        access_key=minio_settings.MINIO_ACCESS_KEY,
+                        secret_key=minio_settings.MINIO_SECRET_KEY,
+                        secure=minio_settings.MINIO_SECURE,
+                        max_connections=settings.WORKER_STORAGE_MAX_CONNECTIONS,
+                    )
+                elif backend == "s3":
+                    self._storages[backend] = S3Storage(
+                        region=os.getenv("AWS_REGION"), max_connections=settings.WORKER_STORAGE_MAX_CONNECTIONS
+                    )
+                elif backend == "local":
+                    self._storages[backend] = LocalStorage(settings.STORAGE_LOCAL_ROOT)
+                else:
+                    raise NotImplementedError(f"Unsupported storage backend {backend}")
+            return self._storages[backend]
+
+    def close(self):
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            self._storages = {}
+
+
+resources = WorkerResources()
+
+
+# CPU-heavy activities are served by a sibling task queue backed by a process pool
+CPU_TASK_QUEUE_SUFFIX = "-cpu"
+
+
+def get_cpu_task_queue(task_queue: str) -> str:
+    return task_queue + CPU_TASK_QUEUE_SUFFIX
+
+
 class WorkerApp:
+    """
+    Runs the workflows and activities of a task queue.
+
+    Sync (`def`) activities run on a thread pool sized to `max_concurrent_activities`, so blocking I/O never stalls
+    the event loop. Activities listed in `cpu_activities` run in a process pool on the `<task_queue>-cpu` task queue,
+    workflows schedule them there with `get_cpu_task_queue`.
+    """
+
     def __init__(
-        self, workflows, activities, task_queue="default-queue", server="localhost:7233"
+        self,
+        workflows,
+        activities,
+        task_queue="default-queue",
+        server="localhost:7233",
+        cpu_activities=(),
+        max_concurrent_activities=settings.WORKER_MAX_CONCURRENT_ACTIVITIES,
+        cpu_activity_processes=settings.WORKER_CPU_ACTIVITY_PROCESSES,
     ):
         self.workflows = workflows
         self.activities = activities
+        self.cpu_activities = list(cpu_activities)
         self.task_queue = task_queue
         self.server = server
+        self.max_concurrent_activities = max_concurrent_activities
+        self.cpu_activity_processes = cpu_activity_processes or os.cpu_count() or 1
         self.client = None
-        self.worker = None
+        self.workers: list[Worker] = []
+        self.executors: list[Executor] = []
 
     async def shutdown(self):
         """Gracefully shuts down the worker."""
         logging.info("🚨 Shutdown signal received. Gracefully stopping worker...")
-        await self.worker.shutdown()  # Graceful shutdown of worker
+        await asyncio.gather(*(worker.shutdown() for worker in self.workers))  # Graceful shutdown of workers
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        resources.close()
         logging.info("✅ Worker stopped gracefully.")
 
     def handle_shutdown_signal(self):
@@ -89,19 +235,44 @@ class WorkerApp:
             data_converter=pydantic_data_converter,
         )
 
-        # Set up the worker
-        self.worker = Worker(
-            self.client,
-            task_queue=self.task_queue,
-            workflows=self.workflows,
-            activities=self.activities,
+        # Set up the worker, blocking activities run on its thread pool
+        activity_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_activities, thread_name_prefix="activity"
+        )
+        self.executors.append(activity_executor)
+        self.workers.append(
+            Worker(
+                self.client,
+                task_queue=self.task_queue,
+                workflows=self.workflows,
+                activities=self.activities,
+                activity_executor=activity_executor,
+                max_concurrent_activities=self.max_concurrent_activities,
+            )
         )
         logging.info(f"🚀 Worker running for task_queue: {self.task_queue}...")
 
+        if self.cpu_activities:
+            cpu_task_queue = get_cpu_task_queue(self.task_queue)
+            cpu_executor = ProcessPoolExecutor(max_workers=self.cpu_activity_processes)
+            self.executors.append(cpu_executor)
+            self.workers.append(
+                Worker(
+                    self.client,
+                    task_queue=cpu_task_queue,
+                    activities=self.cpu_activities,
+                    activity_executor=cpu_executor,
+                    # Heartbeats and cancellation of activities running in other processes
+                    shared_state_manager=SharedStateManager.create_from_multiprocessing(multiprocessing.Manager()),
+                    max_concurrent_activities=self.cpu_activity_processes,
+                )
+            )
+            logging.info(f"🚀 Worker running for task_queue: {cpu_task_queue}...")
+
         # Register signal handlers for graceful shutdown
         loop = asyncio.get_event_loop()
         loop.add_signal_handler(signal.SIGINT, self.handle_shutdown_signal)
         loop.add_signal_handler(signal.SIGTERM, self.handle_shutdown_signal)
 
-        # Start the worker
-        await self.worker.run()
+        # Start the workers
+        await asyncio.gather(*(worker.run() for worker in self.workers))
@@ -0,0 +1,412 @@
+import csv
+import io
+import json
+import logging
+import os
+import re
+from typing import Callable
+from sqlalchemy import text
+
+from base import resources
+from geospatial_mapping_app.functions import get_next_table, get_postgis_engine
+from geospatial_mapping_app.models import BulkLoadChunk, BulkLoadPlan, Dataset, DatasetLoadOgr
+from object_storage import parse_uri
+
+# Files at least this large are split into chunks of this size and loaded in parallel, smaller ones use ogr2ogr
+BULK_LOAD_ENABLED = os.getenv("GEOSPATIAL_MAPPING_APP_BULK_LOAD_ENABLED", "true").lower() == "true"
+BULK_LOAD_CHUNK_SIZE = int(os.getenv("GEOSPATIAL_MAPPING_APP_BULK_LOAD_CHUNK_SIZE", str(64 * 1024 * 1024)))
+# Rows sent per COPY statement, each COPY is committed and checkpointed
+BULK_LOAD_COPY_ROWS = 10000
+BULK_LOAD_CHUNK_MAX_ATTEMPTS = 3
+
+GEOJSONSEQ_EXTENSIONS = (".geojsonl", ".geojsons", ".geojsonseq", ".ndjson", ".jsonl")
+GEOJSON_EXTENSIONS = (".geojson", ".json")
+CSV_GEOMETRY_COLUMNS = ("wkt", "geometry", "geom", "the_geom")
+SNIFF_SIZE = 1024 * 1024
+# Nesting of the coordinates of each GeoJSON geometry type, a Point is a single position
+GEOJSON_COORDINATE_NESTING = {
+    "Point": 0,
+    "MultiPoint": 1,
+    "LineString": 1,
+    "MultiLineString": 2,
+    "Polygon": 2,
+    "MultiPolygon": 3,
+}
+
+
+class BulkLoadUnsupported(ValueError):
+    """The file cannot be split into lines, it is loaded with ogr2ogr instead."""
+
+
+def get_staging_table(uid: str) -> str:
+    return "u_" + str(uid).replace("-", "_") + "_load"
+
+
+def parse_feature_line(line: bytes, strict: bool) -> dict | None:
+    """
+    Parse one line holding a GeoJSON Feature. GeoJSON files written one feature per line (as GDAL does) are read
+    the same way as GeoJSONSeq, the FeatureCollection header and footer lines are skipped.
+    """
+    line = line.strip().lstrip(b"\x1e").rstrip(b",")
+    if not line:
+        return None
+    try:
+        feature = json.loads(line)
+    except ValueError:
+        if strict or b'"Feature"' in line:
+            raise
+        return None
+    if not isinstance(feature, dict) or feature.get("type") != "Feature":
+        if strict:
+            raise ValueError(f"Not a GeoJSON Feature: {line[:100]!r}")
+        return None
+    return feature
+
+
+def is_csv_record_split(line: str) -> bool:
+    """Whether a CSV line ends inside a quoted field, its record goes on over the next lines."""
+    return line.count('"') % 2 == 1
+
+
+def get_csv_columns(header: list[str], geometry_column: str) -> list[str]:
+    """Columns of the CSV values other than the geometry, laundered like ogr2ogr names them."""
+    taken = {"ogc_fid", "geom"}
+    return [launder_column_name(name, taken) for name in header if name != geometry_column]
+
+
+def detect_bulk_load_format(file_name: str, head: bytes) -> tuple[str | None, list[str] | None, str | None]:
+    """Returns the bulk load format of a file with its CSV header and geometry column, format is None if unsupported."""
+    name = file_name.lower()
+    if name.endswith(GEOJSONSEQ_EXTENSIONS):
+        return "geojsonseq", None, None
+
+    if name.endswith(GEOJSON_EXTENSIONS):
+        # Only FeatureCollections with one feature per line can be split, minified files are left to ogr2ogr
+        lines = head.split(b"\n")[:-1]
+        for line in lines:
+            try:
+                if parse_feature_line(line, strict=False) is not None:
+                    return "geojson", None, None
+            except ValueError:
+                return None, None, None
+        return None, None, None
+
+    if name.endswith(".csv"):
+        header_line = head.split(b"\n", 1)[0].decode("utf-8-sig").rstrip("\r")
+        header = next(csv.reader([header_line]))
+        # Records spanning lines cannot be split at line ends
+        if any(is_csv_record_split(line.decode("utf-8", "replace")) for line in head.split(b"\n")[:-1]):
+            return None, None, None
+        for column in header:
+            if column.lower() in CSV_GEOMETRY_COLUMNS:
+                return "csv", header, column
+    return None, None, None
+
+
+def plan_bulk_load(dataset: Dataset) -> BulkLoadPlan:
+    """
+    Split a large upload into byte range chunks loadable in parallel and create the staging table they load into.
+
+    Chunks read their range straight from object storage, so they can run on any worker.
+    """
+    plan = BulkLoadPlan(uid=dataset.uid, storage_uri=dataset.storage_uri)
+    if not BULK_LOAD_ENABLED or dataset.storage_backend not in ("minio", "s3", "local"):
+        return plan
+
+    storage = resources.storage(dataset.storage_backend)
+    bucket_name, object_name = parse_uri(dataset.storage_uri)
+    size = storage.stat(bucket_name, object_name).size
+    if size < BULK_LOAD_CHUNK_SIZE:
+        return plan
+
+    head = storage.read_range(bucket_name, object_name, 0, min(size, SNIFF_SIZE))
+
+    format, csv_header, csv_geometry_column = detect_bulk_load_format(dataset.file_name, head)
+    if format is None:
+        logging.info(f"{dataset.file_name} cannot be bulk loaded, using ogr2ogr")
+        return plan
+
+    plan.format = format
+    plan.chunks = [
+        BulkLoadChunk(
+            uid=dataset.uid,
+            storage_backend=dataset.storage_backend,
+            bucket_name=bucket_name,
+            object_name=object_name,
+            format=format,
+            index=index,
+            start=start,
+            end=min(start + BULK_LOAD_CHUNK_SIZE, size),
+            csv_header=csv_header,
+            csv_geometry_column=csv_geometry_column,
+        )
+        for index, start in enumerate(range(0, size, BULK_LOAD_CHUNK_SIZE))
+    ]
+
+    # Chunks COPY parsed geometries, CSV values straight into their columns. GeoJSON property types are only known
+    # once every chunk is loaded, they are kept as jsonb until the merge. Geometries keep their Z and M values until
+    # the merge too, the staging geometry column takes any dimension.
+    if format == "csv":
+        columns = "".join(f'"{column}" text, ' for column in get_csv_columns(csv_header, csv_geometry_column))
+    else:
+        columns = "properties jsonb, "
+    staging_table = get_staging_table(dataset.uid)
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging_table}"))
+        conn.execute(
+            text(f"CREATE UNLOGGED TABLE {staging_table} (chunk integer, seq integer, {columns}geom geometry)")
+        )
+    logging.info(f"Planned bulk load of {dataset.file_name} ({size} bytes) in {len(plan.chunks)} {format} chunks")
+    return plan
+
+
+def read_chunk_lines(chunk: BulkLoadChunk, position: int | None = None):
+    """
+    Yield (end position, line) of the lines starting inside the chunk byte range, the last one may run past the
+    range end. `position` resumes reading at a line start of a previous attempt.
+    """
+    offset = position if position is not None else max(chunk.start - 1, 0)
+    response = resources.storage(chunk.storage_backend).open(chunk.bucket_name, chunk.object_name, offset)
+    try:
+        reader = io.BufferedReader(response, buffer_size=1024 * 1024)
+        position = offset
+        if offset < chunk.start:
+            # The line running over the range start belongs to the previous chunk
+            position += len(reader.readline())
+        while position < chunk.end:
+            line = reader.readline()
+            if not line:
+                break
+            position += len(line)
+            yield position, line
+    finally:
+        response.close()
+
+
+def copy_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def format_wkt_coordinates(coordinates: list, nesting: int) -> str:
+    if nesting == 0:
+        if not 2 <= len(coordinates) <= 4 or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in coordinates
+        ):
+            raise ValueError(f"Invalid GeoJSON position {coordinates!r}")
+        return " ".join(repr(v) for v in coordinates)
+    return "(" + ", ".join(format_wkt_coordinates(c, nesting - 1) for c in coordinates) + ")"
+
+
+def geojson_to_wkt(geometry: dict) -> str:
+    """WKT of a GeoJSON geometry, parsed by PostGIS as the row is copied."""
+    geometry_type = geometry.get("type")
+    if geometry_type == "GeometryCollection":
+        members = [geojson_to_wkt(member) for member in geometry.get("geometries") or []]
+        return f"GEOMETRYCOLLECTION({', '.join(members)})" if members else "GEOMETRYCOLLECTION EMPTY"
+    if geometry_type not in GEOJSON_COORDINATE_NESTING:
+        raise ValueError(f"Unsupported GeoJSON geometry type {geometry_type!r}")
+    coordinates = geometry.get("coordinates")
+    if not coordinates:
+        return f"{geometry_type.upper()} EMPTY"
+    nesting = GEOJSON_COORDINATE_NESTING[geometry_type]
+    text = format_wkt_coordinates(coordinates, nesting)
+    return f"{geometry_type.upper()}({text})" if nesting == 0 else f"{geometry_type.upper()}{text}"
+
+
+def iter_chunk_records(chunk: BulkLoadChunk, position: int | None = None):
+    """
+    Yield (end position, values, WKT geometry) of every feature of the chunk. Values are the CSV values in column
+    order, or the properties of a GeoJSON feature.
+    """
+    lines = read_chunk_lines(chunk, position)
+    if chunk.format == "csv":
+        if chunk.start == 0 and position is None:
+            next(lines, None)
+        geometry_index = chunk.csv_header.index(chunk.csv_geometry_column)
+        for end, line in lines:
+            line = line.decode("utf-8").rstrip("\r\n")
+            if not line:
+                continue
+            if is_csv_record_split(line):
+                raise BulkLoadUnsupported(f"CSV record spans lines at byte {end - len(line)}")
+            values = next(csv.reader([line]))
+            if len(values) != len(chunk.csv_header):
+                raise ValueError(f"Expected {len(chunk.csv_header)} CSV values, got {len(values)}: {line[:100]}")
+            yield end, [v for i, v in enumerate(values) if i != geometry_index], values[geometry_index] or None
+        return
+
+    strict = chunk.format == "geojsonseq"
+    for end, line in lines:
+        feature = parse_feature_line(line, strict=strict)
+        if feature is None:
+            continue
+        geometry = feature.get("geometry")
+        yield end, feature.get("properties") or {}, geojson_to_wkt(geometry) if geometry else None
+
+
+def load_bulk_load_chunk(
+    chunk: BulkLoadChunk, checkpoint: dict | None = None, on_checkpoint: Callable[[dict], None] | None = None
+) -> int:
+    """
+    COPY one chunk into the staging table, committing every BULK_LOAD_COPY_ROWS rows. Geometries are parsed by
+    PostGIS as they are copied, chunks loading in parallel share that work.
+
+    After each commit `on_checkpoint` receives the position to resume from. Given that `checkpoint`, a retry drops
+    the rows loaded after it and continues there instead of reloading the whole chunk.
+    """
+    staging_table = get_staging_table(chunk.uid)
+    checkpoint = checkpoint or {"position": None, "seq": 0, "rows": 0}
+    engine = get_postgis_engine()
+    conn = engine.raw_connection()
+    seq, rows = checkpoint["seq"], checkpoint["rows"]
+    if chunk.format == "csv":
+        columns = "".join(f'"{column}", ' for column in get_csv_columns(chunk.csv_header, chunk.csv_geometry_column))
+    else:
+        columns = "properties, "
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {staging_table} WHERE chunk = %s AND seq >= %s", (chunk.index, seq))
+            buffer = io.StringIO()
+
+            def commit(position: int | None):
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {staging_table} (chunk, seq, {columns}geom) FROM STDIN", buffer)
+                buffer.seek(0)
+                buffer.truncate()
+                conn.commit()
+                if on_checkpoint and position is not None:
+                    on_checkpoint({"position": position, "seq": seq, "rows": rows, "bytes": position - chunk.start})
+
+            position = checkpoint["position"]
+            for position, values, geometry in iter_chunk_records(chunk, checkpoint["position"]):
+                if chunk.format == "csv":
+                    fields = [copy_escape(v) for v in values]
+                else:
+                    fields = [copy_escape(json.dumps(values, separators=(",", ":")))]
+                geometry = copy_escape(f"SRID=4326;{geometry}") if geometry is not None else "\\N"
+                buffer.write("\t".join([str(chunk.index), str(seq), *fields, geometry]) + "\n")
+                seq += 1
+                rows += 1
+                if rows % BULK_LOAD_COPY_ROWS == 0:
+                    commit(position)
+            commit(position)
+    finally:
+        conn.close()
+    logging.info(f"Loaded chunk {chunk.index} ({chunk.start}-{chunk.end}) of {chunk.uid}: {rows} rows")
+    return rows
+
+
+def launder_column_name(name: str, taken: set[str]) -> str:
+    """Lower case column name made of [a-z0-9_], like ogr2ogr creates them."""
+    column = re.sub(r"[^a-z0-9_]", "_", name.lower())[:63] or "field"
+    candidate, suffix = column, 2
+    while candidate in taken:
+        candidate = f"{column[:59]}_{suffix}"
+        suffix += 1
+    taken.add(candidate)
+    return candidate
+
+
+def get_property_column_type(types: list[str] | None, integral: bool) -> str:
+    types = set(types or [])
+    if types == {"number"}:
+        return "bigint" if integral else "double precision"
+    if types == {"boolean"}:
+        return "boolean"
+    if types & {"object", "array"}:
+        return "jsonb"
+    return "text"
+
+
+def merge_bulk_load(plan: BulkLoadPlan) -> DatasetLoadOgr:
+    """
+    Build the next dataset table from the staging table, with the same `ogc_fid` primary key and `geom` spatial index
+    as an ogr2ogr load. Geometries were parsed by the chunks, GeoJSON properties become typed columns here. Z and M
+    values are dropped, the dataset geometry and the Web Mercator geometry derived from it are 2D.
+    """
+    pg_table = get_next_table(plan.uid)
+    staging_table = get_staging_table(plan.uid)
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        if plan.format == "csv":
+            chunk = plan.chunks[0]
+            # CSV values are all strings, they are kept as text like ogr2ogr does
+            columns = [(column, "text") for column in get_csv_columns(chunk.csv_header, chunk.csv_geometry_column)]
+            expressions = [f'"{column}"' for column, _ in columns]
+        else:
+            columns, expressions = get_property_columns(conn, staging_table)
+
+        column_definitions = "".join(f'"{column}" {column_type},\n' for column, column_type in columns)
+        column_names = "".join(f'"{column}", ' for column, _ in columns)
+        select_list = "".join(f"{expression}, " for expression in expressions)
+
+        logging.info(f"Merging {staging_table} into {pg_table}...")
+        conn.execute(text(f"DROP TABLE IF EXISTS {pg_table}"))
+        conn.execute(
+            text(
+                f"""
+                CREATE TABLE {pg_table} (
+                    ogc_fid serial PRIMARY KEY,
+                    {column_definitions}
+                    geom geometry(Geometry, 4326)
+                )
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO {pg_table} ({column_names}geom)
+                SELECT {select_list}ST_Force2D(geom)
+                FROM {staging_table}
+                ORDER BY chunk, seq
+                """
+            )
+        )
+        conn.execute(text(f"CREATE INDEX {pg_table}_geom_geom_idx ON {pg_table} USING GIST (geom)"))
+        conn.execute(text(f"DROP TABLE {staging_table}"))
+        conn.execute(text(f"ANALYZE {pg_table}"))
+
+    return DatasetLoadOgr(uid=plan.uid, tmp_file_path=plan.storage_uri, table_name=pg_table)
+
+
+def get_property_columns(conn, staging_table: str) -> tuple[list[tuple[str, str]], list[str]]:
+    """Typed columns of the GeoJSON properties of the staging table and the expressions reading them."""
+    properties = conn.execute(
+        text(
+            f"""
+            SELECT key,
+                array_agg(DISTINCT jsonb_typeof(value)) FILTER (WHERE jsonb_typeof(value) <> 'null') AS types,
+                coalesce(
+                    bool_and(value::text ~ '^-?[0-9]{{1,18}}$') FILTER (WHERE jsonb_typeof(value) = 'number'),
+                    false
+                ) AS integral
+            FROM {staging_table}, jsonb_each(properties)
+            GROUP BY key
+            ORDER BY key
+            """
+        )
+    ).all()
+
+    taken = {"ogc_fid", "geom"}
+    columns, expressions = [], []
+    for key, types, integral in properties:
+        column = launder_column_name(key, taken)
+        column_type = get_property_column_type(types, integral)
+        literal = "'" + key.replace("'", "''") + "'"
+        if column_type == "jsonb":
+            expression = f"properties->{literal}"
+        elif column_type == "text":
+            expression = f"properties->>{literal}"
+        else:
+            expression = f"(properties->>{literal})::{column_type}"
+        columns.append((column, column_type))
+        expressions.append(expression)
+    return columns, expressions
+
+
+def drop_bulk_load(plan: BulkLoadPlan):
+    """Drop the staging table of a bulk load given up for ogr2ogr."""
+    with get_postgis_engine().begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {get_staging_table(plan.uid)}"))
@@ -0,0 +1,44 @@
+from temporalio import activity
+from temporalio.exceptions import ApplicationError
+
+from geospatial_mapping_app.dataset_post_upload_activities import STALL_TIMEOUT, Heartbeater
+from geospatial_mapping_app.functions import notify_backend, ogr2ogr_to_postgis
+from geospatial_mapping_app.ingest_delta import fetch_dataset_delta, merge_dataset_delta
+from geospatial_mapping_app.layers import remove_fetched_dataset
+from geospatial_mapping_app.models import DatasetIngest, DatasetLoadOgr
+
+# The dataset table is only changed by the merge, in a single transaction. A failed ingest leaves the dataset as it
+# was, so unlike the post upload activities these do not mark it failed.
+
+
+@activity.defn
+def fetch_dataset_delta_activity(ingest: DatasetIngest) -> DatasetLoadOgr:
+    try:
+        return fetch_dataset_delta(ingest)
+    except Exception as e:
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def load_dataset_delta_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        with Heartbeater(stall_timeout=STALL_TIMEOUT) as heartbeater:
+
+            def on_progress(progress: int):
+                heartbeater.update({"progress": progress})
+
+            return ogr2ogr_to_postgis(data=data, on_progress=on_progress, stall_timeout=STALL_TIMEOUT)
+    except Exception as e:
+        remove_fetched_dataset(data)
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def merge_dataset_delta_activity(ingest: DatasetIngest):
+    try:
+        with Heartbeater():
+            dataset_update = merge_dataset_delta(ingest)
+        if dataset_update:
+            notify_backend(dataset_uid=ingest.uid, dataset_update=dataset_update)
+    except Exception as e:
+        raise ApplicationError(str(e), non_retryable=True)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from temporalio import workflow
+from temporalio.common import RetryPolicy
+
+with workflow.unsafe.imports_passed_through():
+    from geospatial_mapping_app.dataset_ingest_activities import (
+        fetch_dataset_delta_activity,
+        load_dataset_delta_activity,
+        merge_dataset_delta_activity,
+    )
+    from geospatial_mapping_app.dataset_post_upload_activities import render_tile_pyramid_activity
+    from geospatial_mapping_app.dataset_post_upload_workflows import HEARTBEAT_TIMEOUT
+    from geospatial_mapping_app.models import DatasetIngest, DatasetLoadOgr
+
+
+@workflow.defn(name="DatasetIngestWorkflow")
+class DatasetIngestWorkflow:
+    """Appends or upserts a delta file into the table of an existing dataset."""
+
+    @workflow.run
+    async def run(self, ingest: DatasetIngest) -> str:
+
+        # Fetch delta from cloud
+        fetched = await workflow.execute_activity(
+            fetch_dataset_delta_activity,
+            ingest,
+            schedule_to_close_timeout=timedelta(minutes=10),
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        # Load delta to its own table
+        await workflow.execute_activity(
+            load_dataset_delta_activity,
+            fetched,
+            schedule_to_close_timeout=timedelta(minutes=30),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        # Merge delta into the dataset table, only the tiles of its extent are invalidated
+        await workflow.execute_activity(
+            merge_dataset_delta_activity,
+            ingest,
+            schedule_to_close_timeout=timedelta(hours=1),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        # Pre-rendered low zoom tiles may cover the delta, render them again
+        await workflow.execute_activity(
+            render_tile_pyramid_activity,
+            DatasetLoadOgr(uid=ingest.uid, tmp_file_path=ingest.storage_uri),
+            schedule_to_close_timeout=timedelta(hours=2),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        return ingest.uid
@@ -1,21 +1,115 @@
+import contextvars
 import logging
+import math
+import threading
+import time
 from datetime import timedelta
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 from temporalio import activity
 from temporalio.common import RetryPolicy
 from temporalio.exceptions import ApplicationError
 
-from geospatial_mapping_app.models import Dataset, DatasetLoadOgr
+from geospatial_mapping_app.models import BulkLoadChunk, BulkLoadPlan, Dataset, DatasetLoadOgr
+from geospatial_mapping_app.bulk_load import (
+    BULK_LOAD_CHUNK_MAX_ATTEMPTS,
+    BulkLoadUnsupported,
+    drop_bulk_load,
+    load_bulk_load_chunk,
+    merge_bulk_load,
+    plan_bulk_load,
+)
+from geospatial_mapping_app.layers import (
+    get_source_layer_name,
+    plan_dataset_clones,
+    plan_dataset_layers,
+    remove_fetched_dataset,
+)
 from geospatial_mapping_app.functions import (
+    clone_dataset_table,
+    count_table_rows,
+    create_generalized_geometries,
+    create_web_mercator_geometry,
     fetch_dataset_from_cloud,
     notify_backend,
     ogr2ogr_to_postgis,
+    optimize_dataset_table,
+    render_tile_pyramid,
+    swap_dataset_table,
     update_dataset_metadata,
 )
 
+# Error type of chunks that cannot be bulk loaded
+BULK_LOAD_UNSUPPORTED = "BulkLoadUnsupported"
+
+# Seconds between heartbeats of long running activities, their heartbeat timeout must be longer
+HEARTBEAT_INTERVAL = 10
+# Seconds without progress after which a load is considered hung, ogr2ogr reports every percent of its input
+STALL_TIMEOUT = 300
+# Seconds between progress updates sent to the backend, each one is a dataset update
+PROGRESS_REPORT_INTERVAL = 5
+OGR2OGR_MAX_ATTEMPTS = 3
+
+
+class Heartbeater:
+    """
+    Heartbeats the current activity from a background thread while its blocking work runs, so a lost worker is
+    detected within the heartbeat timeout. The latest details given to `update` are sent along, a retry reads them
+    back from `activity.info().heartbeat_details`.
+
+    With a `stall_timeout` the heartbeats stop once `update` was not called for that long, a hung load then times out
+    and is retried. Without one the activity is only checked for liveness, for single SQL statements that report no
+    progress.
+    """
+
+    def __init__(self, interval: float = HEARTBEAT_INTERVAL, stall_timeout: float | None = None):
+        self.interval = interval
+        self.stall_timeout = stall_timeout
+        self.details = ()
+        self._updated = time.monotonic()
+        self._stop = threading.Event()
+        # The activity context lives in context variables of the activity thread
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+
+    @property
+    def stalled(self) -> bool:
+        return self.stall_timeout is not None and time.monotonic() - self._updated > self.stall_timeout
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.stalled:
+                logging.warning(f"No progress for {self.stall_timeout}s, heartbeats stopped")
+                return
+            activity.heartbeat(*self.details)
+
+    def update(self, *details):
+        self.details = details
+        self._updated = time.monotonic()
+        activity.heartbeat(*details)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def throttle(callback: Callable[[int], None], interval: float = PROGRESS_REPORT_INTERVAL) -> Callable[[int], None]:
+    """Calls `callback` with the latest progress at most once every `interval` seconds."""
+    last = -math.inf
+
+    def throttled(progress: int):
+        nonlocal last
+        if time.monotonic() - last >= interval:
+            last = time.monotonic()
+            callback(progress)
+
+    return throttled
+
 
 @activity.defn
-async def validate_input_activity(input_payload: Dict[str, Any]) -> Dataset:
+def validate_input_activity(input_payload: Dict[str, Any]) -> Dataset:
     logging.info("Validating input payload")
     try:
         validated = Dataset(**input_payload)
@@ -27,7 +121,7 @@ async def validate_input_activity(input_payload: Dict[str, Any]) -> Dataset:
 
 
 @activity.defn
-async def fetch_dataset_from_cloud_activity(dataset: Dataset) -> DatasetLoadOgr:
+def fetch_dataset_from_cloud_activity(dataset: Dataset) -> DatasetLoadOgr:
     logging.info(f"Fetching dataset {dataset.uid} from cloud storage...")
     try:
         fetched = fetch_dataset_from_cloud(dataset)
@@ -38,19 +132,191 @@ async def fetch_dataset_from_cloud_activity(dataset: Dataset) -> DatasetLoadOgr:
 
 
 @activity.defn
-async def ogr2ogr_to_postgis_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+def plan_dataset_layers_activity(fetched: DatasetLoadOgr) -> list[DatasetLoadOgr]:
     try:
-        ogr2ogr_to_postgis(data=data)
+        return plan_dataset_layers(fetched)
+    except Exception as e:
+        notify_backend(dataset_uid=fetched.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def plan_dataset_clones_activity(dataset: Dataset) -> list[Dataset]:
+    try:
+        return plan_dataset_clones(dataset)
+    except Exception as e:
+        notify_backend(dataset_uid=dataset.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def remove_fetched_dataset_activity(fetched: DatasetLoadOgr):
+    remove_fetched_dataset(fetched)
+
+
+@activity.defn
+def ogr2ogr_to_postgis_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    # Progress heartbeated by the previous attempt, it loaded the table up to its last committed feature group
+    details = activity.info().heartbeat_details
+    checkpoint = details[0] if details else None
+    try:
+        offset, source_layer, resumed = 0, None, 0
+        if checkpoint:
+            source_layer = get_source_layer_name(data)
+            offset = count_table_rows(data.table_name) if source_layer else 0
+            resumed = checkpoint["progress"] if offset else 0
+            logging.info(f"Resuming the load of {data.uid} after {offset} features")
+
+        with Heartbeater(stall_timeout=STALL_TIMEOUT) as heartbeater:
+            report = throttle(
+                lambda progress: notify_backend(dataset_uid=data.uid, dataset_update={"progress": progress})
+            )
+
+            def on_progress(progress: int):
+                # ogr2ogr reports the progress over the features left
+                progress = resumed + progress * (100 - resumed) // 100
+                heartbeater.update({"progress": progress})
+                report(progress)
+
+            ogr2ogr_to_postgis(
+                data=data,
+                on_progress=on_progress,
+                stall_timeout=STALL_TIMEOUT,
+                offset=offset,
+                source_layer=source_layer,
+            )
         return data
+    except Exception as e:
+        if activity.info().attempt < OGR2OGR_MAX_ATTEMPTS:
+            # Retried from the last committed feature group, the downloaded copy is kept until then
+            raise ApplicationError(str(e))
+        remove_fetched_dataset(data)
+        notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def plan_bulk_load_activity(dataset: Dataset) -> BulkLoadPlan:
+    try:
+        return plan_bulk_load(dataset)
+    except Exception as e:
+        notify_backend(dataset_uid=dataset.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def load_bulk_load_chunk_activity(chunk: BulkLoadChunk) -> int:
+    # Checkpoint heartbeated by the previous attempt
+    details = activity.info().heartbeat_details
+    checkpoint = details[0] if details else None
+    try:
+        with Heartbeater(stall_timeout=STALL_TIMEOUT) as heartbeater:
+            return load_bulk_load_chunk(chunk, checkpoint=checkpoint, on_checkpoint=heartbeater.update)
+    except BulkLoadUnsupported as e:
+        # The workflow loads the file with ogr2ogr instead
+        raise ApplicationError(str(e), type=BULK_LOAD_UNSUPPORTED, non_retryable=True)
+    except Exception as e:
+        if activity.info().attempt < BULK_LOAD_CHUNK_MAX_ATTEMPTS:
+            # Retried from the last checkpoint
+            raise ApplicationError(str(e))
+        notify_backend(dataset_uid=chunk.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def drop_bulk_load_activity(plan: BulkLoadPlan):
+    drop_bulk_load(plan)
+
+
+@activity.defn
+def merge_bulk_load_activity(plan: BulkLoadPlan) -> DatasetLoadOgr:
+    try:
+        with Heartbeater():
+            return merge_bulk_load(plan)
+    except Exception as e:
+        notify_backend(dataset_uid=plan.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def clone_dataset_table_activity(dataset: Dataset) -> DatasetLoadOgr:
+    try:
+        with Heartbeater():
+            return clone_dataset_table(dataset)
+    except Exception as e:
+        notify_backend(dataset_uid=dataset.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def create_web_mercator_geometry_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        return create_web_mercator_geometry(data=data)
     except Exception as e:
         notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
         raise ApplicationError(str(e), non_retryable=True)
 
+
+@activity.defn
+def create_generalized_geometries_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        return create_generalized_geometries(data=data)
+    except Exception as e:
+        notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
 @activity.defn
-async def update_dataset_metadata_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+def optimize_dataset_table_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        with Heartbeater():
+            return optimize_dataset_table(data=data)
+    except Exception as e:
+        notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def swap_dataset_table_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        with Heartbeater():
+            return swap_dataset_table(data=data)
+    except Exception as e:
+        notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
+        raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def update_dataset_metadata_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
     try:
         dataset_update = update_dataset_metadata(data=data)
         notify_backend(dataset_uid=data.uid, dataset_update=dataset_update)
     except Exception as e:
         notify_backend(dataset_uid=data.uid, dataset_update={"status": "failed"})
         raise ApplicationError(str(e), non_retryable=True)
+
+
+@activity.defn
+def render_tile_pyramid_activity(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    try:
+        with Heartbeater():
+            dataset_update = render_tile_pyramid(data=data)
+        if dataset_update:
+            notify_backend(dataset_uid=data.uid, dataset_update=dataset_update)
+        return data
+    except Exception as e:
+        # Tiles are still served live from PostGIS, a missing pyramid does not fail the dataset
+        logging.error(f"Rendering tile pyramid failed: {e}")
+        raise ApplicationError(str(e))
+
+
+@activity.defn
+def report_progress_activity(dataset_uid: str, progress: int):
+    notify_backend(dataset_uid=dataset_uid, dataset_update={"progress": progress})
+
+
+@activity.defn
+def mark_datasets_failed_activity(dataset_uids: list[str]):
+    """Datasets left processing by an activity that timed out or lost its worker, it could not report its failure."""
+    for dataset_uid in dataset_uids:
+        notify_backend(dataset_uid=dataset_uid, dataset_update={"status": "failed"})
@@ -1,18 +1,55 @@
+import asyncio
 from datetime import timedelta
 from temporalio import workflow
 from temporalio.common import RetryPolicy
+from temporalio.exceptions import ActivityError, ApplicationError
 
 with workflow.unsafe.imports_passed_through():
+    from base import get_cpu_task_queue
+    from geospatial_mapping_app.bulk_load import BULK_LOAD_CHUNK_MAX_ATTEMPTS
     from geospatial_mapping_app.dataset_post_upload_activities import (
+        BULK_LOAD_UNSUPPORTED,
+        OGR2OGR_MAX_ATTEMPTS,
+        clone_dataset_table_activity,
+        create_generalized_geometries_activity,
+        create_web_mercator_geometry_activity,
+        drop_bulk_load_activity,
         fetch_dataset_from_cloud_activity,
+        load_bulk_load_chunk_activity,
+        mark_datasets_failed_activity,
+        merge_bulk_load_activity,
         ogr2ogr_to_postgis_activity,
+        optimize_dataset_table_activity,
+        plan_bulk_load_activity,
+        plan_dataset_clones_activity,
+        plan_dataset_layers_activity,
+        remove_fetched_dataset_activity,
+        render_tile_pyramid_activity,
+        report_progress_activity,
+        swap_dataset_table_activity,
         update_dataset_metadata_activity,
         validate_input_activity,
     )
 
 
+# Long running activities heartbeat, a lost worker is detected after this instead of at the activity timeout
+HEARTBEAT_TIMEOUT = timedelta(minutes=1)
+
+
+def is_bulk_load_unsupported(error: BaseException) -> bool:
+    return (
+        isinstance(error, ActivityError)
+        and isinstance(error.cause, ApplicationError)
+        and error.cause.type == BULK_LOAD_UNSUPPORTED
+    )
+
+
 @workflow.defn(name="DatasetPostUploadWorkflow")
 class DatasetPostUploadWorkflow:
+    def __init__(self):
+        # Datasets made ready by this run, a later failure such as a missing tile pyramid leaves them ready
+        self.published: set[str] = set()
+
     @workflow.run
     async def run(self, dataset: dict) -> str:
 
@@ -24,6 +61,90 @@ class DatasetPostUploadWorkflow:
             retry_policy=RetryPolicy(maximum_attempts=1),
         )
 
+        if validated.source_dataset_uid:
+            # The same file was already loaded for the account, copy its tables with the derived columns and indexes.
+            # A multi-layer source gets a dataset per layer again.
+            clones = await workflow.execute_activity(
+                plan_dataset_clones_activity,
+                validated,
+                schedule_to_close_timeout=timedelta(minutes=5),
+                retry_policy=RetryPolicy(maximum_attempts=3),
+            )
+
+            async def clone_layer(clone):
+                optimized = await workflow.execute_activity(
+                    clone_dataset_table_activity,
+                    clone,
+                    schedule_to_close_timeout=timedelta(hours=1),
+                    heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                    retry_policy=RetryPolicy(maximum_attempts=3),
+                )
+                await self.publish(optimized)
+
+            results = await asyncio.gather(*(clone_layer(clone) for clone in clones), return_exceptions=True)
+            await self.mark_failed(clones, results)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return
+
+        # Split large files into chunks loadable in parallel
+        plan = await workflow.execute_activity(
+            plan_bulk_load_activity,
+            validated,
+            schedule_to_close_timeout=timedelta(minutes=5),
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        if plan.chunks:
+            # COPY every chunk into the staging table, spread over all the workers polling the queue.
+            # Parsing and encoding rows is CPU bound, chunks run on the process pool of the CPU task queue.
+            # A retried chunk resumes from its last heartbeated checkpoint.
+            loaded_chunks = 0
+
+            async def load_chunk(chunk):
+                nonlocal loaded_chunks
+                await workflow.execute_activity(
+                    load_bulk_load_chunk_activity,
+                    chunk,
+                    task_queue=get_cpu_task_queue(workflow.info().task_queue),
+                    schedule_to_close_timeout=timedelta(minutes=30),
+                    heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                    retry_policy=RetryPolicy(maximum_attempts=BULK_LOAD_CHUNK_MAX_ATTEMPTS),
+                )
+                loaded_chunks += 1
+                await workflow.execute_local_activity(
+                    report_progress_activity,
+                    args=[plan.uid, loaded_chunks * 100 // len(plan.chunks)],
+                    start_to_close_timeout=timedelta(seconds=30),
+                )
+
+            results = await asyncio.gather(*(load_chunk(chunk) for chunk in plan.chunks), return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if not errors:
+                # Build the dataset table from the staging table
+                loaded = await workflow.execute_activity(
+                    merge_bulk_load_activity,
+                    plan,
+                    schedule_to_close_timeout=timedelta(hours=1),
+                    heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                    retry_policy=RetryPolicy(maximum_attempts=3),
+                )
+                await self.publish(await self.optimize(loaded))
+                return
+
+            for error in errors:
+                if not is_bulk_load_unsupported(error):
+                    raise error
+            # A chunk found records the line split cannot handle, such as quoted CSV fields spanning lines
+            workflow.logger.info(f"Loading {plan.uid} with ogr2ogr: {errors[0]}")
+            await workflow.execute_activity(
+                drop_bulk_load_activity,
+                plan,
+                schedule_to_close_timeout=timedelta(minutes=5),
+                retry_policy=RetryPolicy(maximum_attempts=3),
+            )
+
         # Fetch dataset from cloud
         fetched = await workflow.execute_activity(
             fetch_dataset_from_cloud_activity,
@@ -32,19 +153,107 @@ class DatasetPostUploadWorkflow:
             retry_policy=RetryPolicy(maximum_attempts=3),
         )
 
-        # Load dataset to PostGIS
-        loaded = await workflow.execute_activity(
-            ogr2ogr_to_postgis_activity,
+        # Zip archives and multi-layer files are split into layers, each with its own dataset and table
+        layers = await workflow.execute_activity(
+            plan_dataset_layers_activity,
             fetched,
+            schedule_to_close_timeout=timedelta(minutes=10),
+            retry_policy=RetryPolicy(maximum_attempts=3),
+        )
+
+        async def load_layer(layer):
+            # Load dataset to PostGIS
+            loaded = await workflow.execute_activity(
+                ogr2ogr_to_postgis_activity,
+                layer,
+                schedule_to_close_timeout=timedelta(hours=2),
+                heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                retry_policy=RetryPolicy(maximum_attempts=OGR2OGR_MAX_ATTEMPTS),
+            )
+            await self.publish(await self.optimize(loaded))
+
+        # Layers are loaded in parallel, a failed layer fails its own dataset only
+        results = await asyncio.gather(*(load_layer(layer) for layer in layers), return_exceptions=True)
+        await self.mark_failed(layers, results)
+
+        if len(layers) > 1 and fetched.tmp_dir:
+            # The layers shared the downloaded file
+            await workflow.execute_activity(
+                remove_fetched_dataset_activity,
+                fetched,
+                schedule_to_close_timeout=timedelta(minutes=5),
+                retry_policy=RetryPolicy(maximum_attempts=3),
+            )
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def mark_failed(self, datasets: list, results: list):
+        """
+        Mark the datasets whose load failed as failed unless they were published. The activities report their own
+        failures, a timed out or lost one does not and would leave its dataset processing.
+        """
+        failed = [dataset.uid for dataset, result in zip(datasets, results) if isinstance(result, BaseException)]
+        unpublished = [uid for uid in failed if uid not in self.published]
+        if unpublished:
+            await workflow.execute_activity(
+                mark_datasets_failed_activity,
+                unpublished,
+                schedule_to_close_timeout=timedelta(minutes=5),
+                retry_policy=RetryPolicy(maximum_attempts=3),
+            )
+
+    async def optimize(self, loaded):
+        # Precompute Web Mercator geometry and its spatial index for tiling
+        indexed = await workflow.execute_activity(
+            create_web_mercator_geometry_activity,
+            loaded,
+            schedule_to_close_timeout=timedelta(minutes=30),
+            retry_policy=RetryPolicy(maximum_attempts=3)
+        )
+
+        # Precompute simplified geometries for low zoom tiles
+        generalized = await workflow.execute_activity(
+            create_generalized_geometries_activity,
+            indexed,
             schedule_to_close_timeout=timedelta(minutes=30),
             retry_policy=RetryPolicy(maximum_attempts=3)
         )
 
+        # Store rows in spatial order and refresh planner statistics
+        return await workflow.execute_activity(
+            optimize_dataset_table_activity,
+            generalized,
+            schedule_to_close_timeout=timedelta(hours=1),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3)
+        )
+
+    async def publish(self, optimized):
+        # Replace the dataset table with the new one, readers never see a partially loaded table
+        swapped = await workflow.execute_activity(
+            swap_dataset_table_activity,
+            optimized,
+            schedule_to_close_timeout=timedelta(minutes=10),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3)
+        )
+
         # Update Dataset metadata
-        data = await workflow.execute_activity(
+        await workflow.execute_activity(
             update_dataset_metadata_activity,
-            loaded,
+            swapped,
             schedule_to_close_timeout=timedelta(minutes=30),
             retry_policy=RetryPolicy(maximum_attempts=3)
         )
+        self.published.add(swapped.uid)
 
+        # Pre-render low zoom tiles into an archive served without touching PostGIS
+        await workflow.execute_activity(
+            render_tile_pyramid_activity,
+            swapped,
+            schedule_to_close_timeout=timedelta(hours=2),
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            retry_policy=RetryPolicy(maximum_attempts=3)
+        )
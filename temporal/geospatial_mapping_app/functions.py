@@ -1,12 +1,18 @@
+import math
 import subprocess
 import logging
 import os
 import shutil
+import sqlite3
 import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Callable
 import httpx
-from minio import Minio
-from urllib.parse import urlparse
-from sqlalchemy import URL, create_engine, inspect, select, text
+from sqlalchemy import Engine, inspect, select, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
 logging.basicConfig(
@@ -14,18 +20,22 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
-from base import minio_settings, postgis_settings, settings
-from geospatial_mapping_app.models import Dataset, DatasetLoadOgr
-
-mc = Minio(
-    minio_settings.MINIO_ENDPOINT,
-    access_key=minio_settings.MINIO_ACCESS_KEY,
-    secret_key=minio_settings.MINIO_SECRET_KEY,
-    secure=minio_settings.MINIO_SECURE,
-)
+from base import minio_settings, postgis_settings, resources, settings
+from geospatial_mapping_app.models import Dataset, DatasetIngest, DatasetLoadOgr
+from object_storage import parse_uri
 
 MINIO_BUCKET_NAME = os.getenv("GEOSPATIAL_MAPPING_APP_MINIO_BUCKET_NAME", "uploads")
 
+# stream: ogr2ogr reads the uploaded object in place through GDAL /vsis3/ | download: copy it to local scratch first
+INGEST_MODE = os.getenv("GEOSPATIAL_MAPPING_APP_INGEST_MODE", "stream")
+# Size of the ranged reads GDAL issues against object storage
+INGEST_STREAM_CHUNK_SIZE = os.getenv("GEOSPATIAL_MAPPING_APP_INGEST_STREAM_CHUNK_SIZE", str(4 * 1024 * 1024))
+
+# Pre-rendered tile pyramid, set max zoom to -1 to disable it
+TILE_PYRAMID_MAX_ZOOM = int(os.getenv("GEOSPATIAL_MAPPING_APP_TILE_PYRAMID_MAX_ZOOM", "8"))
+TILE_ARCHIVE_STORAGE = os.getenv("GEOSPATIAL_MAPPING_APP_TILE_ARCHIVE_STORAGE", "minio")  # minio | local
+TILE_ARCHIVE_LOCAL_DIR = os.getenv("GEOSPATIAL_MAPPING_APP_TILE_ARCHIVE_LOCAL_DIR", "/data/tiles")
+
 
 def notify_backend(dataset_uid: str, dataset_update: dict):
     logging.info(f"dataset_uid={dataset_uid} dataset_update={dataset_update}")
@@ -37,37 +47,97 @@ def notify_backend(dataset_uid: str, dataset_update: dict):
     logging.info(f"api_url={api_url} headers={headers}")
 
     try:
-        response = httpx.put(api_url, json=dataset_update, headers=headers)
+        response = resources.http_client.put(api_url, json=dataset_update, headers=headers)
         response.raise_for_status()
     except httpx.HTTPError as e:
         logging.error(f"Failed to notify FastAPI: {e}")
 
 
-def fetch_dataset_from_cloud(dataset: Dataset) -> DatasetLoadOgr:
+def get_next_table(uid: str) -> str:
+    """Table a dataset is loaded into, it replaces `u_<uid>` only once fully built, see `swap_dataset_table`."""
+    return "u_" + str(uid).replace("-", "_") + "_next"
+
 
-    if dataset.storage_backend == "minio":
-        logging.info("minio handler")
-        tmp_dir = tempfile.mkdtemp()
+def get_gdal_s3_env() -> dict:
+    """GDAL configuration to read MinIO objects through /vsis3/, passed as environment to keep secrets off argv."""
+    return {
+        "AWS_S3_ENDPOINT": minio_settings.MINIO_ENDPOINT,
+        "AWS_HTTPS": "YES" if minio_settings.MINIO_SECURE else "NO",
+        "AWS_VIRTUAL_HOSTING": "FALSE",
+        "AWS_ACCESS_KEY_ID": minio_settings.MINIO_ACCESS_KEY,
+        "AWS_SECRET_ACCESS_KEY": minio_settings.MINIO_SECRET_KEY,
+        # Do not list the object prefix when opening a file
+        "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+        "CPL_VSIL_CURL_CHUNK_SIZE": INGEST_STREAM_CHUNK_SIZE,
+        "VSI_CACHE": "TRUE",
+        "GDAL_HTTP_MAX_RETRY": "5",
+        "GDAL_HTTP_RETRY_DELAY": "1",
+    }
 
-        parsed = urlparse(dataset.storage_uri)
-        bucket_name = parsed.netloc
-        object_name = parsed.path.lstrip("/")
-        tmp_file_path = os.path.join(tmp_dir, dataset.file_name)
-        mc.fget_object(bucket_name, object_name, tmp_file_path)
 
+def fetch_dataset_from_cloud(dataset: Dataset | DatasetIngest) -> DatasetLoadOgr:
+    logging.info(f"{dataset.storage_backend} handler")
+    storage = resources.storage(dataset.storage_backend)
+    bucket_name, object_name = parse_uri(dataset.storage_uri)
+
+    if dataset.storage_backend == "local":
+        # ogr2ogr reads the file in place, the storage directory is shared with the backend
+        tmp_file_path = storage.path(bucket_name, object_name)
+        storage.stat(bucket_name, object_name)
+        return DatasetLoadOgr(uid=dataset.uid, tmp_file_path=tmp_file_path, table_name=get_next_table(dataset.uid))
+
+    if dataset.storage_backend == "minio" and INGEST_MODE == "stream":
+        # Fail here rather than in ogr2ogr when the object is missing
+        storage.stat(bucket_name, object_name)
         return DatasetLoadOgr(
-            uid=dataset.uid, tmp_dir=tmp_dir, tmp_file_path=tmp_file_path
+            uid=dataset.uid,
+            tmp_file_path=f"/vsis3/{bucket_name}/{object_name}",
+            table_name=get_next_table(dataset.uid),
         )
-    elif dataset.storage_backend == "s3":
-        logging.info("s3 handler")
-        raise NotImplementedError
-    else:
-        raise NotImplementedError
 
+    tmp_dir = tempfile.mkdtemp()
+    tmp_file_path = os.path.join(tmp_dir, dataset.file_name)
+    storage.get_file(bucket_name, object_name, tmp_file_path)
 
-def ogr2ogr_to_postgis(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    return DatasetLoadOgr(
+        uid=dataset.uid, tmp_dir=tmp_dir, tmp_file_path=tmp_file_path, table_name=get_next_table(dataset.uid)
+    )
 
-    pg_table = "u_" + str(data.uid).replace("-", "_")
+
+def read_ogr2ogr_progress(stream, on_progress: Callable[[int], None]):
+    """Report every percentage of the ogr2ogr `-progress` output ("0...10...20...30...")."""
+    last, token = -1, b""
+    for char in iter(lambda: stream.read(1), b""):
+        if char.isdigit():
+            token += char
+            continue
+        if token and last < int(token) <= 100:
+            last = int(token)
+            on_progress(last)
+        token = b""
+    if token and last < int(token) <= 100:
+        on_progress(int(token))
+
+
+# Features ogr2ogr commits per transaction, a retried load resumes after the last committed group
+OGR2OGR_GROUP_SIZE = 100000
+
+
+def ogr2ogr_to_postgis(
+    data: DatasetLoadOgr,
+    on_progress: Callable[[int], None] | None = None,
+    stall_timeout: float | None = None,
+    offset: int = 0,
+    source_layer: str | None = None,
+) -> DatasetLoadOgr:
+    """
+    Load a fetched file into `data.table_name`. ogr2ogr is killed when it reports no progress for `stall_timeout`
+    seconds. Given an `offset`, the first `offset` features of `source_layer` are skipped and the rest appended to the
+    table, loaded by a previous attempt up to there.
+
+    The downloaded copy is removed once loaded, a failed load leaves it in place for a retry.
+    """
+    pg_table = data.table_name or "u_" + str(data.uid).replace("-", "_")
 
     # Build the ogr2ogr command
     ogr2ogr_command = [
@@ -80,33 +150,357 @@ def ogr2ogr_to_postgis(data: DatasetLoadOgr) -> DatasetLoadOgr:
         pg_table,
         "-a_srs",
         "EPSG:4326",
-        "-overwrite",
+        "-append" if offset else "-overwrite",
         "-lco", "GEOMETRY_NAME=geom",
+        "-gt", str(OGR2OGR_GROUP_SIZE),
+        "-progress",
     ]
+    if offset:
+        # Features are read in file order, OGR SQL skips the ones already committed
+        sql = f"SELECT * FROM {quote_identifier(source_layer)} OFFSET {offset}"
+        ogr2ogr_command += ["-dialect", "OGRSQL", "-sql", sql]
+    elif data.layer_name:
+        ogr2ogr_command.append(data.layer_name)
+
+    # Objects streamed from MinIO are read by GDAL with the MinIO credentials, zip members of them included
+    env = {**os.environ, **get_gdal_s3_env()} if "/vsis3/" in data.tmp_file_path else None
 
     # Run the command
     try:
-        subprocess.run(ogr2ogr_command, check=True)
+        with subprocess.Popen(ogr2ogr_command, stdout=subprocess.PIPE, env=env) as process:
+            progressed = threading.Event()
+            stalled = threading.Event()
+
+            def watch():
+                # A hung ogr2ogr is killed, its output ends and the load fails
+                while process.poll() is None:
+                    if not progressed.wait(stall_timeout):
+                        stalled.set()
+                        process.kill()
+                        return
+                    progressed.clear()
+
+            def report(progress: int):
+                progressed.set()
+                if on_progress:
+                    on_progress(progress)
+
+            if stall_timeout:
+                threading.Thread(target=watch, daemon=True).start()
+            read_ogr2ogr_progress(process.stdout, report)
+            returncode = process.wait()
+            progressed.set()
+            if stalled.is_set():
+                raise TimeoutError(f"ogr2ogr reported no progress for {stall_timeout}s")
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, ogr2ogr_command)
         logging.info("Data loaded successfully into PostGIS.")
-        return data
     except subprocess.CalledProcessError as e:
         logging.error(f"ogr2ogr failed (code {e.returncode})")
-        raise Exception
-    finally:
+        raise Exception(f"ogr2ogr failed (code {e.returncode})")
+    if data.tmp_dir:
         shutil.rmtree(data.tmp_dir)
+    return data
+
+
+def count_table_rows(pg_table: str) -> int:
+    """Rows of a table, 0 when it does not exist."""
+    engine = get_postgis_engine()
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(pg_table):
+            return 0
+        return conn.execute(text(f"SELECT count(*) FROM {quote_identifier(pg_table)}")).scalar_one()
+
+
+def get_postgis_engine() -> Engine:
+    return resources.engine
+
+
+def create_web_mercator_geometry(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    """
+    Persist the geometry in Web Mercator (EPSG:3857) next to `geom` and index it.
+
+    Tiles are cut in EPSG:3857, so `get_dataset_tile` can filter on the GiST index of `geom_3857` instead of
+    running ST_Transform on every row. The column is generated, so rows added later are kept in sync.
+    """
+    pg_table = data.table_name or "u_" + str(data.uid).replace("-", "_")
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        logging.info(f"Adding geom_3857 column to {pg_table}...")
+        conn.execute(
+            text(
+                f"""
+                ALTER TABLE {pg_table}
+                ADD COLUMN IF NOT EXISTS geom_3857 geometry(Geometry, 3857)
+                GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED
+                """
+            )
+        )
+        logging.info(f"Creating GiST index on {pg_table}.geom_3857...")
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {pg_table}_geom_3857_idx ON {pg_table} USING GIST (geom_3857)"))
+        conn.execute(text(f"ANALYZE {pg_table}"))
+    return data
+
+
+# Simplified geometry per zoom band as (column, max zoom). Above the last band tiles use geom_3857 as is.
+GENERALIZATION_LEVELS = [
+    ("geom_3857_z5", 5),
+    ("geom_3857_z9", 9),
+    ("geom_3857_z12", 12),
+]
+
+# Web Mercator circumference in meters
+WEB_MERCATOR_WORLD_SIZE = 40075016.68557849
+
+
+def get_generalization_tolerance(max_zoom: int, tile_size: int = 256) -> float:
+    """Size of one screen pixel in meters at `max_zoom`, anything smaller is invisible in the band."""
+    return WEB_MERCATOR_WORLD_SIZE / (tile_size * 2**max_zoom)
+
+
+def create_generalized_geometries(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    """
+    Persist simplified Web Mercator geometries for low zoom bands so `get_dataset_tile` does not feed
+    full-resolution lines and polygons into ST_AsMVTGeom. Point-only datasets are left untouched.
+    """
+    pg_table = data.table_name or "u_" + str(data.uid).replace("-", "_")
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        has_lines_or_polygons = conn.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM {pg_table} WHERE ST_Dimension(geom) > 0)")
+        ).scalar()
+        if not has_lines_or_polygons:
+            logging.info(f"{pg_table} only has points, skipping generalization")
+            return data
+
+        # Generated columns cannot reference geom_3857, so each level transforms from geom.
+        # Adding all of them in a single ALTER TABLE rewrites the table only once.
+        add_columns = ",\n".join(
+            f"""ADD COLUMN IF NOT EXISTS {column} geometry(Geometry, 3857)
+                GENERATED ALWAYS AS (
+                    ST_SimplifyPreserveTopology(ST_Transform(geom, 3857), {get_generalization_tolerance(max_zoom)})
+                ) STORED"""
+            for column, max_zoom in GENERALIZATION_LEVELS
+        )
+        logging.info(f"Adding generalized geometry columns to {pg_table}...")
+        conn.execute(text(f"ALTER TABLE {pg_table}\n{add_columns}"))
+    return data
+
+
+# Planner statistics target of the geometry columns, PostgreSQL default is 100
+GEOMETRY_STATISTICS_TARGET = int(os.getenv("GEOSPATIAL_MAPPING_APP_GEOMETRY_STATISTICS_TARGET", "1000"))
+
+
+def set_geometry_statistics_target(conn, pg_table: str):
+    geometry_columns = conn.execute(
+        text(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = :table_name AND udt_name = 'geometry'
+            """
+        ),
+        {"table_name": pg_table},
+    ).scalars().all()
+    for column in geometry_columns:
+        conn.execute(text(f"ALTER TABLE {pg_table} ALTER COLUMN {column} SET STATISTICS {GEOMETRY_STATISTICS_TARGET}"))
+
+
+def optimize_dataset_table(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    """
+    Physically order the table rows along a space-filling curve, then VACUUM ANALYZE it.
+
+    Rows are clustered in geohash order of their centroid, so features close on the map share heap pages and tile or
+    bbox queries read few pages. Tables with coordinates outside lon/lat bounds (geohash is undefined there) are
+    clustered on the `geom` GiST index instead. The geometry columns get a higher statistics target so the planner
+    estimates spatial selectivity from a bigger histogram.
+    """
+    pg_table = data.table_name or "u_" + str(data.uid).replace("-", "_")
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        set_geometry_statistics_target(conn, pg_table)
+
+        in_lonlat_bounds = conn.execute(
+            text(
+                f"""
+                SELECT coalesce(
+                    ST_XMin(e) >= -180 AND ST_XMax(e) <= 180 AND ST_YMin(e) >= -90 AND ST_YMax(e) <= 90, false
+                )
+                FROM (SELECT ST_Extent(geom) AS e FROM {pg_table}) AS sub
+                """
+            )
+        ).scalar()
+        if in_lonlat_bounds:
+            logging.info(f"Clustering {pg_table} in geohash order...")
+            conn.execute(
+                text(
+                    f"""
+                    CREATE INDEX {pg_table}_geohash_idx ON {pg_table}
+                    ((CASE WHEN NOT ST_IsEmpty(geom) THEN ST_GeoHash(ST_Centroid(geom), 10) END))
+                    """
+                )
+            )
+            conn.execute(text(f"CLUSTER {pg_table} USING {pg_table}_geohash_idx"))
+            conn.execute(text(f"DROP INDEX {pg_table}_geohash_idx"))
+        else:
+            logging.info(f"Clustering {pg_table} on its spatial index...")
+            conn.execute(text(f"CLUSTER {pg_table} USING {pg_table}_geom_geom_idx"))
+
+    # VACUUM cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        logging.info(f"Vacuuming and analyzing {pg_table}...")
+        conn.execute(text(f"VACUUM ANALYZE {pg_table}"))
+    return data
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def clone_dataset_table(dataset: Dataset) -> DatasetLoadOgr:
+    """
+    Copy the table of `dataset.source_dataset_uid`, loaded from a file with the same content, as the next dataset
+    table.
+
+    The copy keeps the derived geometry columns (still generated), the indexes, the statistics targets and the
+    physical row order of the source table, so the load, generalization and clustering steps are not needed.
+    Indexes are built once the rows are in, serial columns get a sequence of their own.
+    """
+    pg_table = get_next_table(dataset.uid)
+    source_table = "u_" + str(dataset.source_dataset_uid).replace("-", "_")
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        # Leftover of a failed attempt
+        conn.execute(text(f"DROP TABLE IF EXISTS {pg_table}"))
+
+        logging.info(f"Cloning {source_table} into {pg_table}...")
+        conn.execute(
+            text(
+                f"CREATE TABLE {pg_table} "
+                f"(LIKE {source_table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE)"
+            )
+        )
+        columns = conn.execute(
+            text(
+                """
+                SELECT column_name, column_default, is_generated FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = :table_name
+                ORDER BY ordinal_position
+                """
+            ),
+            {"table_name": source_table},
+        ).mappings().all()
+
+        # Serial defaults still point at the sequence of the source table
+        serial_columns = [c["column_name"] for c in columns if (c["column_default"] or "").startswith("nextval(")]
+        for column in serial_columns:
+            sequence = f"{pg_table}_{column}_seq"
+            quoted = quote_identifier(column)
+            conn.execute(text(f"CREATE SEQUENCE {sequence} OWNED BY {pg_table}.{quoted}"))
+            conn.execute(text(f"ALTER TABLE {pg_table} ALTER COLUMN {quoted} SET DEFAULT nextval('{sequence}')"))
+
+        copied_columns = ", ".join(quote_identifier(c["column_name"]) for c in columns if c["is_generated"] == "NEVER")
+        conn.execute(text(f"INSERT INTO {pg_table} ({copied_columns}) SELECT {copied_columns} FROM {source_table}"))
+        for column in serial_columns:
+            conn.execute(
+                text(
+                    f"SELECT setval('{pg_table}_{column}_seq', coalesce(max({quote_identifier(column)}), 0) + 1, false)"
+                    f" FROM {pg_table}"
+                )
+            )
+
+        # Index names of dataset tables all start with the table name
+        indexes = conn.execute(
+            text(
+                """
+                SELECT i.relname AS name, pg_get_indexdef(x.indexrelid) AS definition, x.indisprimary AS is_primary
+                FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = CAST(:table_name AS regclass)
+                """
+            ),
+            {"table_name": source_table},
+        ).mappings().all()
+        for index in indexes:
+            name = index["name"].replace(source_table, pg_table)
+            logging.info(f"Creating index {name}...")
+            conn.execute(text(index["definition"].replace(source_table, pg_table)))
+            if index["is_primary"]:
+                conn.execute(text(f"ALTER TABLE {pg_table} ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {name}"))
+
+        set_geometry_statistics_target(conn, pg_table)
+
+    # VACUUM cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        logging.info(f"Vacuuming and analyzing {pg_table}...")
+        conn.execute(text(f"VACUUM ANALYZE {pg_table}"))
+    return DatasetLoadOgr(uid=dataset.uid, tmp_file_path=dataset.storage_uri, table_name=pg_table)
+
+
+# Lock wait of one swap attempt, readers queued behind the swap are held at most this long
+SWAP_LOCK_TIMEOUT = os.getenv("GEOSPATIAL_MAPPING_APP_SWAP_LOCK_TIMEOUT", "2s")
+SWAP_MAX_ATTEMPTS = 10
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def swap_dataset_table(data: DatasetLoadOgr) -> DatasetLoadOgr:
+    """
+    Replace the dataset table with the fully built `data.table_name` in one short transaction.
+
+    The indexes, constraints and sequences of the new table are renamed after the dataset table. Readers see either
+    the old or the new table, never a partial load. The swap needs an exclusive lock and new readers queue behind it,
+    so it only waits `SWAP_LOCK_TIMEOUT` for running queries and retries later instead of stalling tile requests.
+    """
+    pg_table = "u_" + str(data.uid).replace("-", "_")
+    next_table = data.table_name
+    if not next_table or next_table == pg_table:
+        return data
+
+    engine = get_postgis_engine()
+    for attempt in range(1, SWAP_MAX_ATTEMPTS + 1):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {pg_table}"))
+                conn.execute(text(f"ALTER TABLE {next_table} RENAME TO {pg_table}"))
+                relations = conn.execute(
+                    text(
+                        """
+                        SELECT relname, relkind FROM pg_class
+                        WHERE relkind IN ('i', 'S') AND (
+                            oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = CAST(:table_name AS regclass))
+                            OR oid IN (
+                                SELECT objid FROM pg_depend
+                                WHERE refobjid = CAST(:table_name AS regclass) AND deptype IN ('a', 'i')
+                            )
+                        )
+                        """
+                    ),
+                    {"table_name": pg_table},
+                ).all()
+                for name, kind in relations:
+                    if name.startswith(next_table):
+                        # Renaming the index of a primary key renames the constraint too
+                        statement = "ALTER INDEX" if kind == "i" else "ALTER SEQUENCE"
+                        conn.execute(text(f"{statement} {name} RENAME TO {pg_table}{name[len(next_table):]}"))
+            logging.info(f"Swapped {next_table} in as {pg_table}")
+            return data.model_copy(update={"table_name": None})
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == SWAP_MAX_ATTEMPTS:
+                raise
+            logging.info(f"{pg_table} is busy, retrying the swap ({attempt}/{SWAP_MAX_ATTEMPTS})...")
+            time.sleep(attempt)
+
+
+def get_primary_key_column(engine, pg_table: str) -> str:
+    inspector = inspect(engine)
+    schema = 'public'
+    pk_info = inspector.get_pk_constraint(pg_table, schema)
+    pk_columns = pk_info.get("constrained_columns", [])
+    return pk_columns[0]
 
 
 def update_dataset_metadata(data: DatasetLoadOgr):
     pg_table = "u_" + str(data.uid).replace("-", "_")
-    db_url = URL.create(
-        drivername="postgresql+psycopg2",
-        username=postgis_settings.POSTGIS_USER,
-        password=postgis_settings.POSTGIS_PASSWORD,
-        host=postgis_settings.POSTGIS_HOST,
-        port=postgis_settings.POSTGIS_PORT,
-        database=postgis_settings.POSTGIS_DB,
-    )
-    engine = create_engine(db_url)
+    engine = get_postgis_engine()
     with Session(engine) as session:
         
         logging.info("Getting bounding box...")
@@ -127,14 +521,126 @@ def update_dataset_metadata(data: DatasetLoadOgr):
         bbox = result["bbox"]
 
         logging.info("Getting primary key column...")
-        inspector = inspect(engine)
-        schema = 'public'
-        pk_info = inspector.get_pk_constraint(pg_table, schema)
-        pk_columns = pk_info.get("constrained_columns", [])
-        primary_key_column = pk_columns[0]
+        primary_key_column = get_primary_key_column(engine, pg_table)
 
         return {
             "status": "ready",
+            "progress": 100,
             "bbox": bbox,
             "primary_key_column": primary_key_column,
         }
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> tuple[int, int]:
+    """XYZ tile containing a WGS84 coordinate, latitude is clamped to the Web Mercator limits."""
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    n = 2**z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def render_tile_pyramid(data: DatasetLoadOgr, max_zoom: int = TILE_PYRAMID_MAX_ZOOM) -> dict:
+    """
+    Render tiles z0..max_zoom with `get_dataset_tile` into a single MBTiles archive and store it.
+
+    Only tiles inside the dataset bbox holding at least one feature are visited, so sparse datasets cost far fewer
+    queries than the full pyramid. A tile can be empty while its children are not, small polygons and lines are
+    dropped at low zoom, so the walk descends into every tile with features whatever its rendering. Empty tiles are
+    not written. Returns the dataset update with the archive location.
+    """
+    if max_zoom < 0:
+        logging.info("Tile pyramid disabled")
+        return {}
+
+    pg_table = "u_" + str(data.uid).replace("-", "_")
+    engine = get_postgis_engine()
+    primary_key_column = get_primary_key_column(engine, pg_table)
+
+    tmp_dir = tempfile.mkdtemp()
+    archive_path = os.path.join(tmp_dir, f"{data.uid}.mbtiles")
+    try:
+        with engine.connect() as conn, closing(sqlite3.connect(archive_path)) as mbtiles:
+            extent = conn.execute(
+                text(f"SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (SELECT ST_Extent(geom) AS e FROM {pg_table}) AS sub")
+            ).first()
+            if extent is None or extent[0] is None:
+                logging.info(f"{pg_table} has no geometries, skipping tile pyramid")
+                return {}
+            xmin, ymin, xmax, ymax = extent
+
+            mbtiles.executescript(
+                """
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                CREATE TABLE metadata (name TEXT, value TEXT);
+                CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+                CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+                """
+            )
+            mbtiles.executemany(
+                "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                [
+                    ("name", str(data.uid)),
+                    ("format", "pbf"),
+                    ("minzoom", "0"),
+                    ("maxzoom", str(max_zoom)),
+                    ("bounds", f"{xmin},{ymin},{xmax},{ymax}"),
+                    ("primary_key_column", primary_key_column),
+                ],
+            )
+
+            stmt = text("SELECT public.get_dataset_tile(:relation, :primary_key_column, :z, :x, :y)")
+            # Same filter as get_dataset_tile, a tile without any feature has no feature in its children either
+            columns = {column["name"] for column in inspect(engine).get_columns(pg_table)}
+            geom_3857 = "geom_3857" if "geom_3857" in columns else "ST_Transform(geom, 3857)"
+            has_features = text(
+                f"SELECT EXISTS (SELECT 1 FROM {pg_table} WHERE {geom_3857} && ST_TileEnvelope(:z, :x, :y))"
+            )
+            tile_count = 0
+            candidates = [(0, 0, 0)]
+            while candidates:
+                z, x, y = candidates.pop()
+                tile = conn.execute(
+                    stmt, {"relation": pg_table, "primary_key_column": primary_key_column, "z": z, "x": x, "y": y}
+                ).scalar()
+                if tile:
+                    # MBTiles rows are TMS, y axis flipped
+                    mbtiles.execute(
+                        "INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                        (z, x, (2**z - 1) - y, bytes(tile)),
+                    )
+                    tile_count += 1
+                elif not conn.execute(has_features, {"z": z, "x": x, "y": y}).scalar():
+                    continue
+
+                if z < max_zoom:
+                    min_x, min_y = lonlat_to_tile(xmin, ymax, z + 1)
+                    max_x, max_y = lonlat_to_tile(xmax, ymin, z + 1)
+                    for child_x in (2 * x, 2 * x + 1):
+                        for child_y in (2 * y, 2 * y + 1):
+                            if min_x <= child_x <= max_x and min_y <= child_y <= max_y:
+                                candidates.append((z + 1, child_x, child_y))
+            mbtiles.commit()
+            logging.info(f"Rendered {tile_count} tiles up to z{max_zoom} for {pg_table}")
+
+        # Every render is stored under a name of its own. Readers keep archives open, one replaced in place would
+        # be served stale by any of them. The backend removes the previous archive once it points to this one.
+        archive_name = f"{data.uid}/{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}.mbtiles"
+        if TILE_ARCHIVE_STORAGE == "local":
+            local_path = os.path.join(TILE_ARCHIVE_LOCAL_DIR, archive_name)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            shutil.move(archive_path, local_path)
+            tile_archive_uri = f"file://{os.path.abspath(local_path)}"
+        else:
+            object_name = f"tiles/{archive_name}"
+            storage = resources.storage("minio")
+            storage.put_file(MINIO_BUCKET_NAME, object_name, archive_path, content_type="application/vnd.sqlite3")
+            tile_archive_uri = storage.uri(MINIO_BUCKET_NAME, object_name)
+
+        return {
+            "tile_archive_uri": tile_archive_uri,
+            "tile_archive_max_zoom": max_zoom,
+        }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
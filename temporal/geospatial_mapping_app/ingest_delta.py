@@ -0,0 +1,172 @@
+import logging
+from sqlalchemy import text
+
+from geospatial_mapping_app.functions import (
+    fetch_dataset_from_cloud,
+    get_postgis_engine,
+    get_primary_key_column,
+    quote_identifier,
+)
+from geospatial_mapping_app.models import DatasetIngest, DatasetLoadOgr
+
+
+def get_delta_table(uid: str) -> str:
+    return "u_" + str(uid).replace("-", "_") + "_delta"
+
+
+def fetch_dataset_delta(ingest: DatasetIngest) -> DatasetLoadOgr:
+    """Locate the delta file, ogr2ogr loads it into its own table next to the dataset table."""
+    fetched = fetch_dataset_from_cloud(ingest)
+    return fetched.model_copy(update={"table_name": get_delta_table(ingest.uid)})
+
+
+def get_table_columns(conn, table_name: str) -> list[tuple[str, str, bool]]:
+    """(name, SQL type, generated) of the columns of a table."""
+    return conn.execute(
+        text(
+            """
+            SELECT attname, format_type(atttypid, atttypmod), attgenerated <> ''
+            FROM pg_attribute
+            WHERE attrelid = CAST(:table_name AS regclass) AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+            """
+        ),
+        {"table_name": table_name},
+    ).all()
+
+
+def get_extent(conn, query: str) -> dict | None:
+    """Bounding box of the `geom` column returned by `query`, None when it has no geometry."""
+    row = conn.execute(
+        text(
+            f"""
+            SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+            FROM (SELECT ST_Extent(geom) AS e FROM ({query}) AS g) AS sub
+            """
+        )
+    ).first()
+    if row is None or row[0] is None:
+        return None
+    return dict(zip(("xmin", "ymin", "xmax", "ymax"), row))
+
+
+def union_bbox(a: dict | None, b: dict | None) -> dict | None:
+    if not a or not b:
+        return a or b
+    return {
+        "xmin": min(a["xmin"], b["xmin"]),
+        "ymin": min(a["ymin"], b["ymin"]),
+        "xmax": max(a["xmax"], b["xmax"]),
+        "ymax": max(a["ymax"], b["ymax"]),
+    }
+
+
+def merge_dataset_delta(ingest: DatasetIngest) -> dict:
+    """
+    Append or upsert the delta table into the dataset table, then drop it.
+
+    Append inserts every delta row under a new primary key. Upsert updates the rows whose `key_column`, an attribute
+    column, matches a delta row and inserts the others, the last delta row of a key wins. Columns only found in the delta are added to the
+    dataset table. PostgreSQL maintains the indexes and generated geometry columns row by row, nothing is rebuilt.
+
+    Returns the dataset update: the bbox grown by the delta extent and the dirty extent (delta geometries and the
+    geometries they replace) whose tiles are stale. The bbox is not shrunk when upserted rows move inwards.
+    """
+    pg_table = "u_" + str(ingest.uid).replace("-", "_")
+    delta_table = get_delta_table(ingest.uid)
+    primary_key_column = ingest.primary_key_column
+    key_column = ingest.key_column
+    upsert = ingest.mode == "upsert"
+    if upsert and (not key_column or key_column == primary_key_column):
+        # Feature ids of the delta file do not match the primary key of the dataset, it is a serial from 1
+        raise ValueError("Upserts match rows on an attribute column, not the primary key")
+    engine = get_postgis_engine()
+    delta_primary_key_column = get_primary_key_column(engine, delta_table)
+
+    with engine.begin() as conn:
+        table_columns = {name: (type_, generated) for name, type_, generated in get_table_columns(conn, pg_table)}
+        delta_columns = {name: column_type for name, column_type, _ in get_table_columns(conn, delta_table)}
+        if upsert and (key_column not in table_columns or key_column not in delta_columns):
+            raise ValueError(f"Key column {key_column} is missing from the dataset or the delta")
+
+        # The delta primary key only numbers the delta rows
+        columns = [c for c in delta_columns if c != delta_primary_key_column]
+        for column in columns:
+            if column not in table_columns:
+                logging.info(f"Adding column {column} to {pg_table}...")
+                conn.execute(
+                    text(f"ALTER TABLE {pg_table} ADD COLUMN {quote_identifier(column)} {delta_columns[column]}")
+                )
+                table_columns[column] = (delta_columns[column], False)
+        columns = [c for c in columns if not table_columns[c][1]]
+
+        names = ", ".join(quote_identifier(c) for c in columns)
+        values = ", ".join(f"CAST(d.{quote_identifier(c)} AS {table_columns[c][0]})" for c in columns)
+
+        if upsert:
+            key = quote_identifier(key_column)
+            conn.execute(
+                text(
+                    f"""
+                    DELETE FROM {delta_table} AS a USING {delta_table} AS b
+                    WHERE a.{key} = b.{key} AND a.{delta_primary_key_column} < b.{delta_primary_key_column}
+                    """
+                )
+            )
+            dirty_bbox = get_extent(
+                conn,
+                f"""
+                SELECT geom FROM {delta_table}
+                UNION ALL
+                SELECT t.geom FROM {pg_table} AS t JOIN {delta_table} AS d ON t.{key} = d.{key}
+                """,
+            )
+            assignments = ", ".join(
+                f"{quote_identifier(c)} = CAST(d.{quote_identifier(c)} AS {table_columns[c][0]})"
+                for c in columns
+                if c != key_column
+            )
+            updated = 0
+            if assignments:
+                updated = conn.execute(
+                    text(f"UPDATE {pg_table} AS t SET {assignments} FROM {delta_table} AS d WHERE t.{key} = d.{key}")
+                ).rowcount
+            inserted = conn.execute(
+                text(
+                    f"""
+                    INSERT INTO {pg_table} ({names})
+                    SELECT {values} FROM {delta_table} AS d
+                    WHERE NOT EXISTS (SELECT 1 FROM {pg_table} AS t WHERE t.{key} = d.{key})
+                    """
+                )
+            ).rowcount
+        else:
+            dirty_bbox = get_extent(conn, f"SELECT geom FROM {delta_table}")
+            updated = 0
+            inserted = conn.execute(
+                text(f"INSERT INTO {pg_table} ({names}) SELECT {values} FROM {delta_table} AS d")
+            ).rowcount
+
+        if primary_key_column in columns:
+            # Keys were inserted as given, move the serial sequence past them
+            primary_key = quote_identifier(primary_key_column)
+            conn.execute(
+                text(
+                    f"""
+                    SELECT setval(pg_get_serial_sequence(:table_name, :column), max({primary_key}))
+                    FROM {pg_table}
+                    HAVING max({primary_key}) IS NOT NULL
+                    """
+                ),
+                {"table_name": pg_table, "column": primary_key_column},
+            )
+
+        conn.execute(text(f"DROP TABLE {delta_table}"))
+        logging.info(f"Merged {inserted} new and {updated} updated rows into {pg_table}")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"ANALYZE {pg_table}"))
+
+    if dirty_bbox is None:
+        return {}
+    return {"bbox": union_bbox(ingest.bbox, dirty_bbox), "dirty_bbox": dirty_bbox}
@@ -0,0 +1,166 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import zipfile
+from typing import BinaryIO
+
+from base import resources, settings
+from geospatial_mapping_app.functions import get_gdal_s3_env, get_next_table, notify_backend
+from geospatial_mapping_app.models import Dataset, DatasetLoadOgr
+
+# Files of an archive loaded as a source of their own, the sidecars of a shapefile (.dbf, .shx, .prj) are read by GDAL
+VECTOR_EXTENSIONS = {".shp", ".gpkg", ".geojson", ".json", ".geojsonl", ".csv", ".kml", ".gml", ".fgb", ".tab", ".mif"}
+# Sources holding several layers, listed with ogrinfo. Other sources are a single layer.
+MULTI_LAYER_EXTENSIONS = {".gpkg", ".gdb", ".kml", ".gml", ".sqlite"}
+
+# "1: roads (Line String)" lines of `ogrinfo -ro -q`, tables without geometry are listed as "(None)"
+OGRINFO_LAYER_PATTERN = re.compile(r"^\d+: (?P<name>.+?)(?: \((?P<geometry>[^()]*)\))?$")
+
+
+def is_zip_source(path: str) -> bool:
+    return path.lower().endswith(".zip")
+
+
+def open_source(path: str) -> BinaryIO:
+    """Seekable reader over a fetched file, objects streamed from MinIO are read with range requests."""
+    if path.startswith("/vsis3/"):
+        bucket_name, _, object_name = path.removeprefix("/vsis3/").partition("/")
+        return resources.storage("minio").open_seekable(bucket_name, object_name)
+    return open(path, "rb")
+
+
+def list_archive_sources(archive: BinaryIO) -> list[str]:
+    """
+    Members of a zip archive that are vector sources, in archive order. Only the central directory is read, no member
+    is extracted. A File Geodatabase is the `.gdb` directory holding its files.
+    """
+    sources = []
+    for name in zipfile.ZipFile(archive).namelist():
+        parts = name.split("/")
+        if any(part.startswith((".", "__MACOSX")) for part in parts):
+            continue
+        gdb = next((i for i, part in enumerate(parts[:-1]) if part.lower().endswith(".gdb")), None)
+        if gdb is not None:
+            source = "/".join(parts[: gdb + 1])
+        elif os.path.splitext(name)[1].lower() in VECTOR_EXTENSIONS:
+            source = name
+        else:
+            continue
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+
+def parse_ogrinfo_layers(output: str) -> list[str]:
+    """Names of the layers with a geometry in `ogrinfo -ro -q` output."""
+    layers = []
+    for line in output.splitlines():
+        match = OGRINFO_LAYER_PATTERN.match(line.strip())
+        if match and match["geometry"] != "None":
+            layers.append(match["name"])
+    return layers
+
+
+def list_ogr_layers(path: str) -> list[str]:
+    env = {**os.environ, **get_gdal_s3_env()} if "/vsis3/" in path else None
+    result = subprocess.run(["ogrinfo", "-ro", "-q", path], capture_output=True, text=True, env=env, check=True)
+    return parse_ogrinfo_layers(result.stdout)
+
+
+def get_source_layer_name(data: DatasetLoadOgr) -> str | None:
+    """Name of the layer a load reads, None when the source has no layer with a geometry."""
+    return data.layer_name or next(iter(list_ogr_layers(data.tmp_file_path)), None)
+
+
+def detect_dataset_layers(path: str) -> list[tuple[str, str | None]]:
+    """
+    (GDAL path, layer name) of every layer of a fetched file. Zip members are read in place through /vsizip/, a layer
+    name of None loads the only layer of its source.
+    """
+    if is_zip_source(path):
+        with open_source(path) as archive:
+            sources = [f"/vsizip/{path}/{member}" for member in list_archive_sources(archive)]
+    else:
+        sources = [path]
+
+    layers = []
+    for source in sources:
+        if os.path.splitext(source.rstrip("/"))[1].lower() in MULTI_LAYER_EXTENSIONS:
+            layers += [(source, layer_name) for layer_name in list_ogr_layers(source)]
+        else:
+            layers.append((source, None))
+    return layers
+
+
+def get_layer_names(layers: list[tuple[str, str | None]]) -> list[str]:
+    """Dataset layer names, the file name of single layer sources. Repeated names are numbered."""
+    names = [layer_name or os.path.splitext(os.path.basename(source.rstrip("/")))[0] for source, layer_name in layers]
+    return [f"{name} ({names[:i].count(name)})" if name in names[:i] else name for i, name in enumerate(names)]
+
+
+def create_dataset_layers(dataset_uid: str, layer_names: list[str]) -> list[dict]:
+    """Datasets of the given layers, created by the backend with `dataset_uid` as parent."""
+    api_url = f"{settings.BACKEND_API_BASE_URL}/api/v1/geospatial-mapping/datasets/{dataset_uid}/layers"
+    response = resources.http_client.post(
+        api_url, json={"layer_names": layer_names}, headers={"X-API-Key": settings.BACKEND_API_KEY}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def plan_dataset_layers(fetched: DatasetLoadOgr) -> list[DatasetLoadOgr]:
+    """
+    One load per layer of a fetched file. The first layer stays the upload dataset, every other layer gets a dataset
+    and a table of its own, all of them are loaded in parallel.
+
+    Layers of a multi-layer file share its local copy, the loads leave it in place and the workflow removes it once
+    they are all done.
+    """
+    layers = detect_dataset_layers(fetched.tmp_file_path)
+    if not layers:
+        raise ValueError(f"No vector layer found in {os.path.basename(fetched.tmp_file_path)}")
+    if len(layers) == 1:
+        source, layer_name = layers[0]
+        return [fetched.model_copy(update={"tmp_file_path": source, "layer_name": layer_name})]
+
+    names = get_layer_names(layers)
+    logging.info(f"Loading {len(layers)} layers of {fetched.tmp_file_path}: {names}")
+    notify_backend(dataset_uid=fetched.uid, dataset_update={"layer_name": names[0]})
+    uids = [fetched.uid] + [layer["uid"] for layer in create_dataset_layers(fetched.uid, names[1:])]
+    return [
+        fetched.model_copy(
+            update={
+                "uid": uid,
+                "tmp_dir": None,
+                "tmp_file_path": source,
+                "table_name": get_next_table(uid),
+                "layer_name": layer_name,
+            }
+        )
+        for uid, (source, layer_name) in zip(uids, layers)
+    ]
+
+
+def plan_dataset_clones(dataset: Dataset) -> list[Dataset]:
+    """
+    One clone per layer of the source dataset. The first layer stays the upload dataset, every other layer gets a
+    dataset named after the source layer, each of them copies the table of its source layer.
+    """
+    if len(dataset.source_layers) <= 1:
+        return [dataset]
+
+    names = [layer.layer_name for layer in dataset.source_layers]
+    logging.info(f"Cloning {len(names)} layers of {dataset.source_dataset_uid}: {names}")
+    notify_backend(dataset_uid=dataset.uid, dataset_update={"layer_name": names[0]})
+    uids = [dataset.uid] + [layer["uid"] for layer in create_dataset_layers(dataset.uid, names[1:])]
+    return [
+        dataset.model_copy(update={"uid": uid, "source_dataset_uid": source.uid, "source_layers": []})
+        for uid, source in zip(uids, dataset.source_layers)
+    ]
+
+
+def remove_fetched_dataset(fetched: DatasetLoadOgr):
+    if fetched.tmp_dir:
+        shutil.rmtree(fetched.tmp_dir, ignore_errors=True)
@@ -2,6 +2,11 @@ from typing import Optional
 from pydantic import BaseModel
 
 
+class DatasetSourceLayer(BaseModel):
+    uid: str
+    layer_name: Optional[str] = None
+
+
 class Dataset(BaseModel):
     id: int
     uid: str
@@ -13,9 +18,55 @@ class Dataset(BaseModel):
     storage_uri: str
     status: str
     created_at: str
+    content_hash: Optional[str] = None
+    # Ready dataset of the account with the same content hash, its table is copied instead of loading the file
+    source_dataset_uid: Optional[str] = None
+    # Source dataset followed by the extra layers of a multi-layer source, each of them is cloned
+    source_layers: list[DatasetSourceLayer] = []
 
 
 class DatasetLoadOgr(BaseModel):
     uid: str
-    tmp_dir: str
+    # Local scratch directory, None when the file is read in place from object storage
+    tmp_dir: Optional[str] = None
+    # Path handed to GDAL, a local file or a GDAL virtual file system path such as /vsis3/<bucket>/<object>
     tmp_file_path: str
+    # Table loaded by ogr2ogr, defaults to the dataset table u_<uid>
+    table_name: Optional[str] = None
+    # Layer of a multi-layer source to load, None loads its only layer
+    layer_name: Optional[str] = None
+
+
+class BulkLoadChunk(BaseModel):
+    uid: str
+    storage_backend: str = "minio"
+    bucket_name: str
+    object_name: str
+    format: str
+    index: int
+    # Byte range [start, end) of the object, the chunk loads every line starting inside it
+    start: int
+    end: int
+    csv_header: Optional[list[str]] = None
+    csv_geometry_column: Optional[str] = None
+
+
+class BulkLoadPlan(BaseModel):
+    uid: str
+    storage_uri: str
+    # None when the file has to be loaded with ogr2ogr
+    format: Optional[str] = None
+    chunks: list[BulkLoadChunk] = []
+
+
+class DatasetIngest(BaseModel):
+    """Delta file appended or upserted into the table of an existing dataset."""
+
+    uid: str
+    file_name: str
+    storage_backend: str
+    storage_uri: str
+    mode: str = "append"  # append | upsert
+    key_column: Optional[str] = None
+    primary_key_column: str
+    bbox: Optional[dict] = None
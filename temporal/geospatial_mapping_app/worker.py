@@ -1,12 +1,33 @@
 import asyncio
 import os
 from base import WorkerApp, settings
+from geospatial_mapping_app.dataset_ingest_activities import (
+    fetch_dataset_delta_activity,
+    load_dataset_delta_activity,
+    merge_dataset_delta_activity,
+)
+from geospatial_mapping_app.dataset_ingest_workflows import DatasetIngestWorkflow
 from geospatial_mapping_app.dataset_post_upload_workflows import (
     DatasetPostUploadWorkflow,
 )
 from geospatial_mapping_app.dataset_post_upload_activities import (
+    clone_dataset_table_activity,
+    create_generalized_geometries_activity,
+    create_web_mercator_geometry_activity,
+    drop_bulk_load_activity,
     fetch_dataset_from_cloud_activity,
+    load_bulk_load_chunk_activity,
+    mark_datasets_failed_activity,
+    merge_bulk_load_activity,
     ogr2ogr_to_postgis_activity,
+    optimize_dataset_table_activity,
+    plan_bulk_load_activity,
+    plan_dataset_clones_activity,
+    plan_dataset_layers_activity,
+    remove_fetched_dataset_activity,
+    render_tile_pyramid_activity,
+    report_progress_activity,
+    swap_dataset_table_activity,
     validate_input_activity,
     update_dataset_metadata_activity,
 )
@@ -16,13 +37,31 @@ TASK_QUEUE = "default-queue"
 
 if __name__ == "__main__":
     worker_app = WorkerApp(
-        workflows=[DatasetPostUploadWorkflow],
+        workflows=[DatasetPostUploadWorkflow, DatasetIngestWorkflow],
         activities=[
             validate_input_activity,
+            plan_dataset_clones_activity,
+            clone_dataset_table_activity,
+            plan_bulk_load_activity,
+            merge_bulk_load_activity,
+            drop_bulk_load_activity,
             fetch_dataset_from_cloud_activity,
+            plan_dataset_layers_activity,
+            remove_fetched_dataset_activity,
             ogr2ogr_to_postgis_activity,
+            create_web_mercator_geometry_activity,
+            create_generalized_geometries_activity,
+            optimize_dataset_table_activity,
+            swap_dataset_table_activity,
             update_dataset_metadata_activity,
+            render_tile_pyramid_activity,
+            report_progress_activity,
+            mark_datasets_failed_activity,
+            fetch_dataset_delta_activity,
+            load_dataset_delta_activity,
+            merge_dataset_delta_activity,
         ],
+        cpu_activities=[load_bulk_load_chunk_activity],
         task_queue="default-queue",
         server=settings.TEMPORAL_ADDRESS
     )
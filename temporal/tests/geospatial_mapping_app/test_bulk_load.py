@@ -0,0 +1,184 @@
+import io
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import text
+from geospatial_mapping_app import bulk_load
+from geospatial_mapping_app.functions import get_postgis_engine
+from geospatial_mapping_app.models import BulkLoadChunk, Dataset
+from geospatial_mapping_app.bulk_load import (
+    BulkLoadUnsupported,
+    copy_escape,
+    detect_bulk_load_format,
+    geojson_to_wkt,
+    get_csv_columns,
+    get_property_column_type,
+    launder_column_name,
+    parse_feature_line,
+)
+
+GEOJSON_HEAD = b"""{
+"type": "FeatureCollection",
+"name": "open_energy_sample",
+"crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:OGC:1.3:CRS84" } },
+"features": [
+{ "type": "Feature", "properties": { "id": 1 }, "geometry": { "type": "Point", "coordinates": [ 1.0, 2.0 ] } },
+{ "type": "Feature", "properties": { "id": 2 }, "geometry": { "type": "Po"""
+
+
+def test_detect_bulk_load_format():
+    assert detect_bulk_load_format("sample.geojson", GEOJSON_HEAD)[0] == "geojson"
+    assert detect_bulk_load_format("minified.geojson", b'{"type":"FeatureCollection","features":[{"type"')[0] is None
+    assert detect_bulk_load_format("sample.geojsonl", b"")[0] == "geojsonseq"
+    assert detect_bulk_load_format("sample.csv", b"\xef\xbb\xbfname,WKT\r\na,POINT (1 2)\r\n") == (
+        "csv",
+        ["name", "WKT"],
+        "WKT",
+    )
+    assert detect_bulk_load_format("sample.csv", b"name,lat,lon\n")[0] is None
+    # quoted fields spanning lines are left to ogr2ogr
+    assert detect_bulk_load_format("sample.csv", b'name,WKT\n"a\nb",POINT (1 2)\n')[0] is None
+    assert detect_bulk_load_format("sample.fgb", b"fgb")[0] is None
+
+
+def test_parse_feature_line():
+    assert parse_feature_line(b'"features": [\n', strict=False) is None
+    assert parse_feature_line(b"]\n", strict=False) is None
+    feature = parse_feature_line(b'\x1e{"type": "Feature", "properties": {}, "geometry": null},\n', strict=True)
+    assert feature["type"] == "Feature"
+    with pytest.raises(ValueError):
+        parse_feature_line(b'{ "type": "Feature", "properties": {', strict=False)
+    with pytest.raises(ValueError):
+        parse_feature_line(b'{"type": "FeatureCollection"}', strict=True)
+
+
+def test_merge_helpers():
+    taken = {"ogc_fid", "geom"}
+    assert launder_column_name("Name", taken) == "name"
+    assert launder_column_name("NAME", taken) == "name_2"
+    assert launder_column_name("geom", taken) == "geom_2"
+    assert launder_column_name("Power (MW)", taken) == "power__mw_"
+
+    assert get_property_column_type(["number"], True) == "bigint"
+    assert get_property_column_type(["number"], False) == "double precision"
+    assert get_property_column_type(["number", "string"], False) == "text"
+    assert get_property_column_type(["array"], False) == "jsonb"
+    assert get_property_column_type(None, False) == "text"
+
+    assert copy_escape('{"a":"b\\\\c"}\t') == '{"a":"b\\\\\\\\c"}\\t'
+
+    assert get_csv_columns(["Name", "WKT", "NAME"], "WKT") == ["name", "name_2"]
+
+
+def test_geojson_to_wkt():
+    assert geojson_to_wkt({"type": "Point", "coordinates": [1, 2.5]}) == "POINT(1 2.5)"
+    assert geojson_to_wkt({"type": "Point", "coordinates": [1, 2, 3]}) == "POINT(1 2 3)"
+    assert geojson_to_wkt({"type": "LineString", "coordinates": [[0, 0], [1e-07, 1]]}) == "LINESTRING(0 0, 1e-07 1)"
+    polygon = [[[0, 0], [1, 0], [1, 1], [0, 0]]]
+    assert geojson_to_wkt({"type": "Polygon", "coordinates": polygon}) == "POLYGON((0 0, 1 0, 1 1, 0 0))"
+    assert (
+        geojson_to_wkt({"type": "MultiPolygon", "coordinates": [polygon, polygon]})
+        == "MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)), ((0 0, 1 0, 1 1, 0 0)))"
+    )
+    assert geojson_to_wkt({"type": "MultiPoint", "coordinates": []}) == "MULTIPOINT EMPTY"
+    assert (
+        geojson_to_wkt({"type": "GeometryCollection", "geometries": [{"type": "Point", "coordinates": [1, 2]}]})
+        == "GEOMETRYCOLLECTION(POINT(1 2))"
+    )
+    with pytest.raises(ValueError):
+        geojson_to_wkt({"type": "Point", "coordinates": [1]})
+    with pytest.raises(ValueError):
+        geojson_to_wkt({"type": "Circle", "coordinates": [1, 2]})
+
+
+class FakeStorage:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def open(self, bucket, key, offset=0, length=None):
+        return io.BytesIO(self.data[offset:])
+
+    def stat(self, bucket, key):
+        return SimpleNamespace(size=len(self.data))
+
+    def read_range(self, bucket, key, offset, length):
+        return self.data[offset : offset + length]
+
+
+def test_read_chunk_lines_partitions_lines(monkeypatch):
+    data = b"".join(f"line {i}\n".encode() * (i % 3 + 1) for i in range(50))
+    monkeypatch.setattr(bulk_load.resources, "storage", lambda backend: FakeStorage(data))
+
+    for chunk_size in (1, 7, 8, 64, len(data)):
+        lines = []
+        for index, start in enumerate(range(0, len(data), chunk_size)):
+            chunk = BulkLoadChunk(
+                uid="uid",
+                bucket_name="bucket",
+                object_name="object",
+                format="geojsonseq",
+                index=index,
+                start=start,
+                end=min(start + chunk_size, len(data)),
+            )
+            lines.extend(line for _, line in bulk_load.read_chunk_lines(chunk))
+        assert b"".join(lines) == data
+
+    # resuming at a checkpoint continues at the line after it
+    chunk = BulkLoadChunk(
+        uid="uid", bucket_name="bucket", object_name="object", format="geojsonseq", index=0, start=0, end=len(data)
+    )
+    position, _ = next(iter(bulk_load.read_chunk_lines(chunk)))
+    assert b"".join(line for _, line in bulk_load.read_chunk_lines(chunk, position)) == data[position:]
+
+
+def test_iter_chunk_records_rejects_multiline_csv(monkeypatch):
+    data = b'name,WKT\na,POINT (1 2)\n"b\nc",POINT (3 4)\n'
+    monkeypatch.setattr(bulk_load.resources, "storage", lambda backend: FakeStorage(data))
+    chunk = BulkLoadChunk(
+        uid="uid",
+        bucket_name="bucket",
+        object_name="object",
+        format="csv",
+        index=0,
+        start=0,
+        end=len(data),
+        csv_header=["name", "WKT"],
+        csv_geometry_column="WKT",
+    )
+    records = bulk_load.iter_chunk_records(chunk)
+    assert next(records)[1:] == (["a"], "POINT (1 2)")
+    with pytest.raises(BulkLoadUnsupported):
+        next(records)
+
+
+def test_bulk_load_drops_z_and_m_values(monkeypatch):
+    uid = "5e2a8c1d-7b4f-4d6e-9a3c-0f1b2d8e6c57"
+    data = (
+        b'{"type": "Feature", "properties": {"code": "a"}, "geometry": {"type": "Point", "coordinates": [1, 2, 30]}}\n'
+        b'{"type": "Feature", "properties": {"code": "b"}, "geometry": {"type": "LineString", '
+        b'"coordinates": [[0, 0, 1, 5], [1, 1, 2, 6]]}}\n'
+        b'{"type": "Feature", "properties": {"code": "c"}, "geometry": {"type": "Point", "coordinates": [3, 4]}}\n'
+    )
+    monkeypatch.setattr(bulk_load.resources, "storage", lambda backend: FakeStorage(data))
+    monkeypatch.setattr(bulk_load, "BULK_LOAD_CHUNK_SIZE", 64)
+    dataset = Dataset(
+        id=1,
+        uid=uid,
+        account_id=1,
+        name="elevation",
+        file_name="elevation.geojsonl",
+        storage_backend="minio",
+        storage_uri="s3://mybucket/uploads/elevation.geojsonl",
+        status="uploaded",
+        created_at="2025-04-17T05:32:18.702Z",
+    )
+
+    plan = bulk_load.plan_bulk_load(dataset)
+    assert len(plan.chunks) > 1
+    assert sum(bulk_load.load_bulk_load_chunk(chunk) for chunk in plan.chunks) == 3
+    loaded = bulk_load.merge_bulk_load(plan)
+
+    with get_postgis_engine().begin() as conn:
+        rows = conn.execute(text(f"SELECT code, ST_AsText(geom) FROM {loaded.table_name} ORDER BY ogc_fid")).all()
+        conn.execute(text(f"DROP TABLE {loaded.table_name}"))
+    assert rows == [("a", "POINT(1 2)"), ("b", "LINESTRING(0 0,1 1)"), ("c", "POINT(3 4)")]
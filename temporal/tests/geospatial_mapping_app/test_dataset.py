@@ -1,9 +1,21 @@
 import logging
 import os
 import shutil
+import sqlite3
+import threading
+from contextlib import closing
+from sqlalchemy import inspect, text
+from geospatial_mapping_app import functions
 from geospatial_mapping_app.functions import (
+    clone_dataset_table,
+    create_web_mercator_geometry,
     fetch_dataset_from_cloud,
+    get_next_table,
+    get_postgis_engine,
     ogr2ogr_to_postgis,
+    optimize_dataset_table,
+    render_tile_pyramid,
+    swap_dataset_table,
 )
 from geospatial_mapping_app.models import DatasetLoadOgr
 
@@ -20,3 +32,227 @@ def test_fetch_dataset_from_cloud_load_postgis(test_dataset):
 
     # cleanup
     shutil.rmtree(fetched.tmp_dir)
+
+
+def test_clone_dataset_table(test_dataset):
+    source_uid = "5b0f3d6e-8c1a-4f2e-9a7d-3c6b1e0f2a11"
+    source_table = "u_" + source_uid.replace("-", "_")
+    dataset = test_dataset.model_copy(update={"source_dataset_uid": source_uid})
+    engine = get_postgis_engine()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {source_table}"))
+        conn.execute(
+            text(
+                f"""
+                CREATE TABLE {source_table} (
+                    ogc_fid serial PRIMARY KEY,
+                    code varchar,
+                    geom geometry(Point, 4326),
+                    geom_3857 geometry(Point, 3857) GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED
+                )
+                """
+            )
+        )
+        conn.execute(text(f"CREATE INDEX {source_table}_geom_geom_idx ON {source_table} USING GIST (geom)"))
+        conn.execute(
+            text(
+                f"INSERT INTO {source_table} (code, geom) "
+                "VALUES ('a', ST_SetSRID(ST_MakePoint(0, 0), 4326)), ('b', ST_SetSRID(ST_MakePoint(1, 1), 4326))"
+            )
+        )
+
+    cloned = clone_dataset_table(dataset)
+
+    pg_table = get_next_table(dataset.uid)
+    assert cloned.table_name == pg_table
+    assert cloned.uid == dataset.uid
+    with engine.begin() as conn:
+        query = "SELECT ogc_fid, code, ST_AsText(geom), ST_AsText(geom_3857) FROM {} ORDER BY ogc_fid"
+        assert conn.execute(text(query.format(pg_table))).all() == conn.execute(text(query.format(source_table))).all()
+        # The clone has a sequence of its own, the source sequence is left alone
+        conn.execute(text(f"INSERT INTO {pg_table} (code, geom) VALUES ('c', ST_SetSRID(ST_MakePoint(2, 2), 4326))"))
+        assert conn.execute(text(f"SELECT max(ogc_fid) FROM {pg_table}")).scalar() == 3
+        assert conn.execute(text(f"SELECT nextval('{source_table}_ogc_fid_seq')")).scalar() == 3
+
+    inspector = inspect(engine)
+    assert inspector.get_pk_constraint(pg_table)["constrained_columns"] == ["ogc_fid"]
+    assert f"{pg_table}_geom_geom_idx" in [index["name"] for index in inspector.get_indexes(pg_table)]
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {pg_table}"))
+        conn.execute(text(f"DROP TABLE {source_table}"))
+
+
+def create_dataset_table(pg_table: str, rows: list[tuple[str, str]], srid: int = 4326, geometry_type: str = "Point"):
+    """Table as loaded by ogr2ogr, rows are (code, WKT)."""
+    with get_postgis_engine().begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {pg_table}"))
+        conn.execute(
+            text(f"CREATE TABLE {pg_table} (ogc_fid serial PRIMARY KEY, code varchar, geom geometry({geometry_type}, {srid}))")
+        )
+        conn.execute(text(f"CREATE INDEX {pg_table}_geom_geom_idx ON {pg_table} USING GIST (geom)"))
+        for code, wkt in rows:
+            conn.execute(
+                text(f"INSERT INTO {pg_table} (code, geom) VALUES (:code, ST_GeomFromText(:wkt, {srid}))"),
+                {"code": code, "wkt": wkt},
+            )
+
+
+def drop_tables(*tables: str):
+    with get_postgis_engine().begin() as conn:
+        for table in tables:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def test_optimize_dataset_table_clusters_in_geohash_order():
+    uid = "7c1e9a42-3b5d-4f6a-8e2c-1d0b9f8a7e31"
+    pg_table = get_next_table(uid)
+    # Inserted alternating between two distant areas
+    create_dataset_table(
+        pg_table,
+        [
+            ("east-1", "POINT(100 10)"),
+            ("west-1", "POINT(-100 10)"),
+            ("east-2", "POINT(100.1 10)"),
+            ("west-2", "POINT(-100.1 10)"),
+        ],
+    )
+
+    optimize_dataset_table(DatasetLoadOgr(uid=uid, tmp_file_path="roads.geojson", table_name=pg_table))
+
+    with get_postgis_engine().connect() as conn:
+        physical_order = conn.execute(text(f"SELECT code FROM {pg_table} ORDER BY ctid")).scalars().all()
+        geohash_order = (
+            conn.execute(text(f"SELECT code FROM {pg_table} ORDER BY ST_GeoHash(ST_Centroid(geom), 10)"))
+            .scalars()
+            .all()
+        )
+    assert physical_order == geohash_order
+    assert [index["name"] for index in inspect(get_postgis_engine()).get_indexes(pg_table)] == [
+        f"{pg_table}_geom_geom_idx"
+    ]
+    drop_tables(pg_table)
+
+
+def test_optimize_dataset_table_clusters_projected_on_spatial_index():
+    uid = "2f8d6c4b-9a1e-4c3d-b7f5-6e0a8d2c4b19"
+    pg_table = get_next_table(uid)
+    # Web Mercator coordinates, geohash is undefined outside lon/lat bounds
+    create_dataset_table(pg_table, [("a", "POINT(500000 500000)"), ("b", "POINT(-500000 -500000)")], srid=3857)
+
+    optimize_dataset_table(DatasetLoadOgr(uid=uid, tmp_file_path="roads.geojson", table_name=pg_table))
+
+    with get_postgis_engine().connect() as conn:
+        clustered = (
+            conn.execute(
+                text(
+                    """
+                    SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                    WHERE x.indrelid = CAST(:table_name AS regclass) AND x.indisclustered
+                    """
+                ),
+                {"table_name": pg_table},
+            )
+            .scalars()
+            .all()
+        )
+    assert clustered == [f"{pg_table}_geom_geom_idx"]
+    drop_tables(pg_table)
+
+
+def test_swap_dataset_table():
+    uid = "9e4b2d7a-6c1f-4a8e-b3d5-0f7c2a9e1b64"
+    pg_table = "u_" + uid.replace("-", "_")
+    next_table = get_next_table(uid)
+    create_dataset_table(pg_table, [("old", "POINT(0 0)")])
+    create_dataset_table(next_table, [("new-1", "POINT(1 1)"), ("new-2", "POINT(2 2)")])
+
+    swapped = swap_dataset_table(DatasetLoadOgr(uid=uid, tmp_file_path="roads.geojson", table_name=next_table))
+
+    assert swapped.table_name is None
+    engine = get_postgis_engine()
+    inspector = inspect(engine)
+    assert not inspector.has_table(next_table)
+    # Indexes, constraints and sequences carry the dataset table name
+    assert inspector.get_pk_constraint(pg_table)["name"] == f"{pg_table}_pkey"
+    assert sorted(index["name"] for index in inspector.get_indexes(pg_table)) == [f"{pg_table}_geom_geom_idx"]
+    with engine.begin() as conn:
+        assert conn.execute(text(f"SELECT code FROM {pg_table} ORDER BY ogc_fid")).scalars().all() == ["new-1", "new-2"]
+        conn.execute(text(f"INSERT INTO {pg_table} (code) VALUES ('new-3')"))
+        assert conn.execute(text(f"SELECT max(ogc_fid) FROM {pg_table}")).scalar() == 3
+        assert conn.execute(text(f"SELECT pg_get_serial_sequence('{pg_table}', 'ogc_fid')")).scalar() == (
+            f"public.{pg_table}_ogc_fid_seq"
+        )
+    drop_tables(pg_table)
+
+
+def test_swap_dataset_table_waits_for_readers(monkeypatch):
+    uid = "4a7c9e1b-2d3f-4b6a-9c8e-5f1d0a3b7c82"
+    pg_table = "u_" + uid.replace("-", "_")
+    next_table = get_next_table(uid)
+    create_dataset_table(pg_table, [("old", "POINT(0 0)")])
+    create_dataset_table(next_table, [("new", "POINT(1 1)")])
+    monkeypatch.setattr(functions, "SWAP_LOCK_TIMEOUT", "100ms")
+
+    # A long running reader holds the dataset table, the swap gives up its lock wait and retries
+    reader = get_postgis_engine().connect()
+    transaction = reader.begin()
+    reader.execute(text(f"SELECT count(*) FROM {pg_table}"))
+    release = threading.Timer(1.5, transaction.rollback)
+    release.start()
+    try:
+        swap_dataset_table(DatasetLoadOgr(uid=uid, tmp_file_path="roads.geojson", table_name=next_table))
+    finally:
+        release.join()
+        reader.close()
+
+    with get_postgis_engine().connect() as conn:
+        assert conn.execute(text(f"SELECT code FROM {pg_table}")).scalars().all() == ["new"]
+    drop_tables(pg_table)
+
+
+def test_render_tile_pyramid(tmp_path, monkeypatch):
+    uid = "6b3e8f2a-1c7d-4e9b-a5f0-3d2c8b1e7a46"
+    pg_table = "u_" + uid.replace("-", "_")
+    create_dataset_table(pg_table, [("a", "POINT(10 10)"), ("b", "POINT(10.001 10.001)")])
+    data = create_web_mercator_geometry(DatasetLoadOgr(uid=uid, tmp_file_path="points.geojson"))
+    monkeypatch.setattr(functions, "TILE_ARCHIVE_STORAGE", "local")
+    monkeypatch.setattr(functions, "TILE_ARCHIVE_LOCAL_DIR", str(tmp_path))
+
+    dataset_update = render_tile_pyramid(data, max_zoom=3)
+    # Every render is stored under a new name, readers never see an archive replaced in place
+    assert render_tile_pyramid(data, max_zoom=3)["tile_archive_uri"] != dataset_update["tile_archive_uri"]
+
+    assert dataset_update["tile_archive_max_zoom"] == 3
+    archive_path = dataset_update["tile_archive_uri"].removeprefix("file://")
+    assert archive_path.startswith(str(tmp_path / uid))
+    with closing(sqlite3.connect(archive_path)) as mbtiles:
+        metadata = dict(mbtiles.execute("SELECT name, value FROM metadata").fetchall())
+        tiles = mbtiles.execute("SELECT zoom_level, tile_column, tile_row FROM tiles ORDER BY zoom_level").fetchall()
+    assert metadata["maxzoom"] == "3"
+    assert metadata["primary_key_column"] == "ogc_fid"
+    # Only the tile holding the points is rendered at each zoom, rows are TMS
+    assert tiles == [(0, 0, 0), (1, 1, 1), (2, 2, 2), (3, 4, 4)]
+    drop_tables(pg_table)
+
+
+def test_render_tile_pyramid_descends_into_empty_tiles(tmp_path, monkeypatch):
+    uid = "3d9f1b6e-8a2c-4e7d-b1f4-9c6a2e8d5b07"
+    pg_table = "u_" + uid.replace("-", "_")
+    # A building sized polygon, smaller than a pixel of the low zoom tiles
+    create_dataset_table(
+        pg_table,
+        [("building", "POLYGON((10 10, 10.01 10, 10.01 10.01, 10 10.01, 10 10))")],
+        geometry_type="Polygon",
+    )
+    data = create_web_mercator_geometry(DatasetLoadOgr(uid=uid, tmp_file_path="buildings.geojson"))
+    monkeypatch.setattr(functions, "TILE_ARCHIVE_STORAGE", "local")
+    monkeypatch.setattr(functions, "TILE_ARCHIVE_LOCAL_DIR", str(tmp_path))
+
+    dataset_update = render_tile_pyramid(data, max_zoom=6)
+
+    with closing(sqlite3.connect(dataset_update["tile_archive_uri"].removeprefix("file://"))) as mbtiles:
+        tiles = mbtiles.execute("SELECT zoom_level, tile_column, tile_row FROM tiles ORDER BY zoom_level").fetchall()
+    assert (0, 0, 0) not in tiles
+    assert (6, 33, 33) in tiles
+    drop_tables(pg_table)
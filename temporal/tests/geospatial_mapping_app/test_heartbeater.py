@@ -0,0 +1,67 @@
+import os
+import time
+import pytest
+from temporalio.testing import ActivityEnvironment
+from geospatial_mapping_app.dataset_post_upload_activities import Heartbeater, throttle
+from geospatial_mapping_app.functions import ogr2ogr_to_postgis
+from geospatial_mapping_app.models import DatasetLoadOgr
+
+
+def test_heartbeater_sends_latest_details():
+    heartbeats = []
+    env = ActivityEnvironment()
+    env.on_heartbeat = lambda *details: heartbeats.append(details)
+
+    def work():
+        with Heartbeater(interval=0.01) as heartbeater:
+            heartbeater.update({"position": 10})
+            time.sleep(0.05)
+
+    env.run(work)
+    assert len(heartbeats) > 1
+    assert all(details == ({"position": 10},) for details in heartbeats)
+
+
+def test_heartbeater_stops_when_stalled():
+    heartbeats = []
+    env = ActivityEnvironment()
+    env.on_heartbeat = lambda *details: heartbeats.append(details)
+
+    def work():
+        with Heartbeater(interval=0.01, stall_timeout=0.03) as heartbeater:
+            heartbeater.update({"progress": 1})
+            time.sleep(0.1)
+            return heartbeater.stalled
+
+    assert env.run(work)
+    count = len(heartbeats)
+    time.sleep(0.03)
+    assert count == len(heartbeats) < 10
+
+
+def test_throttle_reports_latest_progress_at_most_once_per_interval():
+    reported = []
+    report = throttle(reported.append, interval=60)
+    for progress in range(100):
+        report(progress)
+    assert reported == [0]
+
+
+def test_ogr2ogr_to_postgis_kills_stalled_load(tmp_path, monkeypatch):
+    # Reports 10% then hangs
+    ogr2ogr = tmp_path / "ogr2ogr"
+    ogr2ogr.write_text("#!/bin/sh\nprintf '0...10'\nexec sleep 30\n")
+    ogr2ogr.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    source_dir = tmp_path / "fetched"
+    source_dir.mkdir()
+    data = DatasetLoadOgr(uid="1", tmp_dir=str(source_dir), tmp_file_path=str(source_dir / "data.csv"))
+
+    progress = []
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        ogr2ogr_to_postgis(data, on_progress=progress.append, stall_timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert progress == [0, 10]
+    # Kept for a retry
+    assert source_dir.exists()
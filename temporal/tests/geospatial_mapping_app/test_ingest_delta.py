@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import inspect, text
+from geospatial_mapping_app.functions import get_postgis_engine
+from geospatial_mapping_app.ingest_delta import get_delta_table, merge_dataset_delta, union_bbox
+from geospatial_mapping_app.models import DatasetIngest
+
+
+def test_get_delta_table():
+    assert get_delta_table("19bea7c2-d17c-47b7-b88a-1fe5133cc1b6") == "u_19bea7c2_d17c_47b7_b88a_1fe5133cc1b6_delta"
+
+
+def test_union_bbox():
+    bbox = {"xmin": 0, "ymin": 0, "xmax": 10, "ymax": 10}
+    delta = {"xmin": 5, "ymin": -5, "xmax": 20, "ymax": 5}
+    assert union_bbox(bbox, delta) == {"xmin": 0, "ymin": -5, "xmax": 20, "ymax": 10}
+    assert union_bbox(None, delta) == delta
+    assert union_bbox(bbox, None) == bbox
+
+
+def create_ingest_tables(uid: str, rows: list[tuple[str, int, str]], delta_rows: list[tuple[str, int, str]]):
+    """Dataset table as loaded by ogr2ogr and its delta table, rows are (code, value, point WKT)."""
+    pg_table = "u_" + uid.replace("-", "_")
+    with get_postgis_engine().begin() as conn:
+        for table, table_rows in ((pg_table, rows), (get_delta_table(uid), delta_rows)):
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.execute(
+                text(f"CREATE TABLE {table} (ogc_fid serial PRIMARY KEY, code varchar, value integer, geom geometry)")
+            )
+            for code, value, wkt in table_rows:
+                conn.execute(
+                    text(
+                        f"INSERT INTO {table} (code, value, geom) VALUES (:code, :value, ST_GeomFromText(:wkt, 4326))"
+                    ),
+                    {"code": code, "value": value, "wkt": wkt},
+                )
+        conn.execute(
+            text(
+                f"""
+                ALTER TABLE {pg_table} ADD COLUMN geom_3857 geometry(Geometry, 3857)
+                GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED
+                """
+            )
+        )
+    return pg_table
+
+
+def read_rows(pg_table: str) -> list[tuple]:
+    with get_postgis_engine().connect() as conn:
+        query = f"SELECT ogc_fid, code, value, ST_AsText(geom), geom_3857 IS NOT NULL FROM {pg_table} ORDER BY ogc_fid"
+        return conn.execute(text(query)).all()
+
+
+def test_merge_dataset_delta_append():
+    uid = "1d6f0b52-57c4-4a3e-9d0b-2e3f5a1c7e01"
+    pg_table = create_ingest_tables(
+        uid, [("a", 1, "POINT(0 0)"), ("b", 2, "POINT(1 1)")], [("a", 10, "POINT(5 5)"), ("c", 3, "POINT(6 6)")]
+    )
+    ingest = DatasetIngest(
+        uid=uid,
+        file_name="delta.geojson",
+        storage_backend="minio",
+        storage_uri="s3://uploads/delta.geojson",
+        mode="append",
+        primary_key_column="ogc_fid",
+        bbox={"xmin": 0, "ymin": 0, "xmax": 1, "ymax": 1},
+    )
+
+    dataset_update = merge_dataset_delta(ingest)
+
+    assert read_rows(pg_table) == [
+        (1, "a", 1, "POINT(0 0)", True),
+        (2, "b", 2, "POINT(1 1)", True),
+        (3, "a", 10, "POINT(5 5)", True),
+        (4, "c", 3, "POINT(6 6)", True),
+    ]
+    assert dataset_update == {
+        "bbox": {"xmin": 0, "ymin": 0, "xmax": 6, "ymax": 6},
+        "dirty_bbox": {"xmin": 5, "ymin": 5, "xmax": 6, "ymax": 6},
+    }
+    with get_postgis_engine().connect() as conn:
+        assert not inspect(conn).has_table(get_delta_table(uid))
+
+
+def test_merge_dataset_delta_upsert():
+    uid = "1d6f0b52-57c4-4a3e-9d0b-2e3f5a1c7e02"
+    pg_table = create_ingest_tables(
+        uid,
+        [("a", 1, "POINT(0 0)"), ("b", 2, "POINT(1 1)")],
+        [("a", 10, "POINT(4 4)"), ("a", 11, "POINT(5 5)"), ("c", 3, "POINT(6 6)")],
+    )
+    ingest = DatasetIngest(
+        uid=uid,
+        file_name="delta.geojson",
+        storage_backend="minio",
+        storage_uri="s3://uploads/delta.geojson",
+        mode="upsert",
+        key_column="code",
+        primary_key_column="ogc_fid",
+        bbox={"xmin": 0, "ymin": 0, "xmax": 1, "ymax": 1},
+    )
+
+    dataset_update = merge_dataset_delta(ingest)
+
+    # The last delta row of a key wins, new keys are inserted under the next primary key
+    assert read_rows(pg_table) == [
+        (1, "a", 11, "POINT(5 5)", True),
+        (2, "b", 2, "POINT(1 1)", True),
+        (3, "c", 3, "POINT(6 6)", True),
+    ]
+    # The replaced geometry is dirty as well
+    assert dataset_update["dirty_bbox"] == {"xmin": 0, "ymin": 0, "xmax": 6, "ymax": 6}
+
+
+def test_merge_dataset_delta_upsert_rejects_primary_key():
+    ingest = DatasetIngest(
+        uid="1d6f0b52-57c4-4a3e-9d0b-2e3f5a1c7e03",
+        file_name="delta.shp",
+        storage_backend="minio",
+        storage_uri="s3://uploads/delta.shp",
+        mode="upsert",
+        key_column="ogc_fid",
+        primary_key_column="ogc_fid",
+    )
+    with pytest.raises(ValueError):
+        merge_dataset_delta(ingest)
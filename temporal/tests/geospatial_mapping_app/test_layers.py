@@ -0,0 +1,98 @@
+import io
+import zipfile
+from geospatial_mapping_app import layers
+from geospatial_mapping_app.layers import (
+    detect_dataset_layers,
+    get_layer_names,
+    list_archive_sources,
+    parse_ogrinfo_layers,
+    plan_dataset_clones,
+    plan_dataset_layers,
+)
+from geospatial_mapping_app.models import Dataset, DatasetLoadOgr
+
+
+def make_zip(names: list[str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"")
+    return buffer.getvalue()
+
+
+def test_list_archive_sources():
+    archive = make_zip(
+        [
+            "roads/roads.shp",
+            "roads/roads.dbf",
+            "roads/roads.shx",
+            "__MACOSX/roads/._roads.shp",
+            "rivers.geojson",
+            "parcels.gdb/a00000001.gdbtable",
+            "parcels.gdb/a00000002.gdbtable",
+            "README.txt",
+        ]
+    )
+    assert list_archive_sources(io.BytesIO(archive)) == ["roads/roads.shp", "rivers.geojson", "parcels.gdb"]
+
+
+def test_parse_ogrinfo_layers():
+    output = "1: roads (Line String)\n2: points (Point)\n3: attributes (None)\n4: untyped\n"
+    assert parse_ogrinfo_layers(output) == ["roads", "points", "untyped"]
+
+
+def test_get_layer_names():
+    sources = [("/vsizip/a.zip/a/roads.shp", None), ("/vsizip/a.zip/b/roads.shp", None), ("x.gpkg", "pts")]
+    assert get_layer_names(sources) == ["roads", "roads (1)", "pts"]
+
+
+def test_plan_dataset_layers_fans_out(tmp_path, monkeypatch):
+    path = tmp_path / "upload.zip"
+    path.write_bytes(make_zip(["roads.shp", "roads.dbf", "rivers.shp", "rivers.dbf"]))
+    monkeypatch.setattr(layers, "notify_backend", lambda dataset_uid, dataset_update: None)
+    monkeypatch.setattr(layers, "create_dataset_layers", lambda uid, names: [{"uid": f"{name}-uid"} for name in names])
+
+    fetched = DatasetLoadOgr(uid="upload-uid", tmp_dir=str(tmp_path), tmp_file_path=str(path))
+    planned = plan_dataset_layers(fetched)
+
+    assert [(p.uid, p.tmp_file_path, p.table_name, p.tmp_dir) for p in planned] == [
+        ("upload-uid", f"/vsizip/{path}/roads.shp", "u_upload_uid_next", None),
+        ("rivers-uid", f"/vsizip/{path}/rivers.shp", "u_rivers_uid_next", None),
+    ]
+
+
+def test_plan_dataset_layers_single_source(tmp_path):
+    path = tmp_path / "roads.geojson"
+    path.write_text("{}")
+    fetched = DatasetLoadOgr(uid="uid", tmp_file_path=str(path), table_name="u_uid_next")
+    assert detect_dataset_layers(str(path)) == [(str(path), None)]
+    assert plan_dataset_layers(fetched) == [fetched]
+
+
+def test_plan_dataset_clones_fans_out(test_dataset, monkeypatch):
+    notified = []
+    monkeypatch.setattr(layers, "notify_backend", lambda dataset_uid, dataset_update: notified.append(dataset_update))
+    monkeypatch.setattr(layers, "create_dataset_layers", lambda uid, names: [{"uid": f"{name}-uid"} for name in names])
+    dataset = Dataset(
+        **{
+            **test_dataset.model_dump(),
+            "source_dataset_uid": "source-uid",
+            "source_layers": [
+                {"uid": "source-uid", "layer_name": "roads"},
+                {"uid": "source-rivers-uid", "layer_name": "rivers"},
+            ],
+        }
+    )
+
+    planned = plan_dataset_clones(dataset)
+
+    assert [(p.uid, p.source_dataset_uid, p.source_layers) for p in planned] == [
+        (test_dataset.uid, "source-uid", []),
+        ("rivers-uid", "source-rivers-uid", []),
+    ]
+    assert notified == [{"layer_name": "roads"}]
+
+
+def test_plan_dataset_clones_single_layer(test_dataset):
+    dataset = test_dataset.model_copy(update={"source_dataset_uid": "source-uid"})
+    assert plan_dataset_clones(dataset) == [dataset]